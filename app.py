@@ -6,13 +6,12 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-import onnxruntime as ort
 import numpy as np
-import wfdb
 import tempfile
+import threading
 import csv
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, current_app # Modified import
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, session, current_app # Modified import
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
@@ -24,6 +23,7 @@ from flask_moment import Moment # Add this import
 
 from flask import jsonify, request
 from sqlalchemy import or_
+from sqlalchemy.orm import contains_eager, selectinload
 
 from wtforms import (
     Form,
@@ -43,6 +43,36 @@ from flask_wtf import FlaskForm
 
 # ONNX Runtime for ECG inference
 
+from csv_export import csv_response
+from dashboard_stats import DashboardStatsCache, compute_dashboard_stats, invalidate_on_writes
+from ecg_batcher import ECGMicroBatcher
+from ecg_cache import ECGResultCache, model_identity, record_key
+from ecg_jobs import ECGJobRunner, enqueue_ecg_analysis
+from ecg_preprocessing import N_LEADS, N_SAMPLES, ECGPreprocessError, prepare_record
+from ecg_sessions import ORTSessionPool, build_optimized_model, optimized_model_path, preload_model, resolve_model_variant
+from ecg_store import build_store, load_record, read_wfdb
+from ecg_waveform import WAVEFORM_MIMETYPE, encode_waveform, waveform_view
+from medicament_catalog import MedicamentCatalog
+from metrics import RequestMetrics, registry as metrics_registry, time_db_commits, time_phase
+from pagination import TOTAL_EXACT, clamp_per_page, offset_page, page_from_args
+from serializers import appointment_list, doctor_list, patient_list, visit_list
+from sql_profiler import SQLProfiler, query_budget
+from table_engine import (
+    TableSpec,
+    apply_filters,
+    at_least,
+    contains_words,
+    date_from,
+    date_to,
+    day_range,
+    equal_to,
+    one_of,
+    paginate_table,
+    parse_date,
+)
+from text_search import text_search
+from time_series import count_series
+
 from models import (
     db,
     bcrypt,
@@ -58,6 +88,7 @@ from models import (
     GeneralSettings,
     User,
     UserSession,
+    ECGAnalysisJob,
 )
 
 # ----------------------------------------
@@ -106,17 +137,164 @@ bcrypt.init_app(app)
 # 2) ONNX MODEL LOADING (ECG) - Replaces PyTorch
 # ----------------------------------------
 MODEL_PATH = os.path.join(BASE_DIR, "resnet34_model.onnx")
-ort_session = None
+ort_session = None  # ORTSessionPool once loaded (same run/get_inputs API as InferenceSession)
+
+# Model variant to serve: "fp32", or an INT8 build published by
+# convert_to_onnx.py --quantize ("int8-dynamic" / "int8-static"). A variant
+# that is missing or did not pass its accuracy gate falls back to FP32.
+app.config["ECG_MODEL_VARIANT"] = os.getenv("ECG_MODEL_VARIANT", "fp32")
+
+# ONNX Runtime session tuning (see ecg_sessions.py). ECG_ORT_INTRA_OP_THREADS=0
+# splits the cores evenly across the pool; ECG_ORT_PROVIDERS is a comma list
+# in priority order (empty = ORT's default for this build).
+app.config["ECG_ORT_POOL_SIZE"] = int(os.getenv("ECG_ORT_POOL_SIZE", "1"))
+# Worker processes serving the app on this machine (gunicorn.conf.py sets it to
+# its worker count), so that the default thread split covers every process's pool
+app.config["ECG_ORT_PROCESSES"] = int(os.getenv("ECG_ORT_PROCESSES", "1"))
+app.config["ECG_ORT_GRAPH_OPTIMIZATION"] = os.getenv("ECG_ORT_GRAPH_OPTIMIZATION", "all")
+app.config["ECG_ORT_INTRA_OP_THREADS"] = int(os.getenv("ECG_ORT_INTRA_OP_THREADS", "0"))
+app.config["ECG_ORT_INTER_OP_THREADS"] = int(os.getenv("ECG_ORT_INTER_OP_THREADS", "1"))
+app.config["ECG_ORT_EXECUTION_MODE"] = os.getenv("ECG_ORT_EXECUTION_MODE", "sequential")
+app.config["ECG_ORT_MEM_PATTERN"] = os.getenv("ECG_ORT_MEM_PATTERN", "true").lower() in ("1", "true", "yes")
+app.config["ECG_ORT_CPU_MEM_ARENA"] = os.getenv("ECG_ORT_CPU_MEM_ARENA", "true").lower() in ("1", "true", "yes")
+app.config["ECG_ORT_PROVIDERS"] = [p.strip() for p in os.getenv("ECG_ORT_PROVIDERS", "").split(",") if p.strip()]
+app.config["ECG_ORT_OPTIMIZED_DIR"] = os.getenv("ECG_ORT_OPTIMIZED_DIR", os.path.join(BASE_DIR, "instance", "ort_optimized"))
+app.config["ECG_ORT_SELF_CHECK"] = os.getenv("ECG_ORT_SELF_CHECK", "true").lower() in ("1", "true", "yes")
+
+# When the model is loaded: "background" (a thread started by the worker's first
+# request; /readyz answers 503 until it is done), "lazy" (on the first inference)
+# or "eager" (at import, blocking; single process only, ORT sessions do not survive a fork)
+app.config["ECG_MODEL_WARMUP"] = os.getenv("ECG_MODEL_WARMUP", "background")
+
+# Micro-batching: concurrent predict_ecg_onnx calls are coalesced into one
+# batched ORT run (the exported model has a dynamic batch axis)
+app.config["ECG_BATCHING_ENABLED"] = os.getenv("ECG_BATCHING_ENABLED", "true").lower() in ("1", "true", "yes")
+app.config["ECG_BATCH_MAX_SIZE"] = int(os.getenv("ECG_BATCH_MAX_SIZE", "16"))
+app.config["ECG_BATCH_MAX_WAIT_MS"] = float(os.getenv("ECG_BATCH_MAX_WAIT_MS", "5"))
+
+# Content-addressed inference result cache (memory LRU + on-disk tier)
+app.config["ECG_CACHE_MAX_ENTRIES"] = int(os.getenv("ECG_CACHE_MAX_ENTRIES", "1024"))
+app.config["ECG_CACHE_DIR"] = os.getenv("ECG_CACHE_DIR", os.path.join(BASE_DIR, "instance", "ecg_cache"))
+app.config["ECG_CACHE_MAX_DISK_ENTRIES"] = int(os.getenv("ECG_CACHE_MAX_DISK_ENTRIES", "20000"))  # 0 = unbounded
+ECG_MODEL_ID = None  # SHA-256 of the loaded model file, part of every cache key
+
+# Background ECG analysis jobs (persisted in the ecg_analysis_job table)
+app.config["ECG_ASYNC_JOBS"] = os.getenv("ECG_ASYNC_JOBS", "true").lower() in ("1", "true", "yes")
+app.config["ECG_JOB_WORKERS"] = int(os.getenv("ECG_JOB_WORKERS", "2"))
+app.config["ECG_JOB_MAX_ATTEMPTS"] = int(os.getenv("ECG_JOB_MAX_ATTEMPTS", "3"))
+app.config["ECG_JOB_POLL_INTERVAL"] = float(os.getenv("ECG_JOB_POLL_INTERVAL", "2"))
+app.config["ECG_JOB_RETRY_BACKOFF"] = float(os.getenv("ECG_JOB_RETRY_BACKOFF", "10"))
+
+# Dashboard counters are cached per role/doctor for this many seconds (0 disables the cache)
+app.config["DASHBOARD_STATS_TTL"] = float(os.getenv("DASHBOARD_STATS_TTL", "30"))
+
+# In-memory medicament registry: seconds between checks for changes made outside this process
+app.config["MEDICAMENT_CATALOG_REFRESH"] = float(os.getenv("MEDICAMENT_CATALOG_REFRESH", "300"))
+
+# SQL statements per request (see sql_profiler.py): counted and timed for the
+# Server-Timing header and the heartline.sql log. Requests over the budget are
+# logged with their slowest/repeated statements (strict: they fail, for tests);
+# /debug/queries lists recent requests when SQL_DEBUG_QUERIES is on (development only)
+app.config["SQL_QUERY_BUDGET"] = int(os.getenv("SQL_QUERY_BUDGET", "30"))
+app.config["SQL_QUERY_BUDGET_STRICT"] = os.getenv("SQL_QUERY_BUDGET_STRICT", "false").lower() in ("1", "true", "yes")
+app.config["SQL_SLOW_REQUEST_MS"] = float(os.getenv("SQL_SLOW_REQUEST_MS", "200"))
+app.config["SQL_DEBUG_QUERIES"] = os.getenv("SQL_DEBUG_QUERIES", "false").lower() in ("1", "true", "yes")
+
+sql_profiler = SQLProfiler(
+    app,
+    budget=app.config["SQL_QUERY_BUDGET"],
+    strict=app.config["SQL_QUERY_BUDGET_STRICT"],
+    slow_ms=app.config["SQL_SLOW_REQUEST_MS"],
+    debug_view=app.config["SQL_DEBUG_QUERIES"],
+)
+
+# Prometheus metrics at /metrics (see metrics.py): request latency by route/role/outcome
+# and the ECG sub-phases. Set METRICS_TOKEN to require "Authorization: Bearer <token>"
+app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN", "")
+
+request_metrics = RequestMetrics(app, token=app.config["METRICS_TOKEN"] or None)
+time_db_commits()
+
+
+def resolve_ecg_model():
+    """The model file to serve: (path, SHA-256, optimized graph path), or None when there is none"""
+    if not os.path.exists(MODEL_PATH):
+        return None
+    fp32_model_id = model_identity(MODEL_PATH)
+    model_path, fallback_reason = resolve_model_variant(MODEL_PATH, app.config["ECG_MODEL_VARIANT"], fp32_model_id)
+    if fallback_reason:
+        print(f"{fallback_reason}; serving the FP32 model instead.")
+    model_id = fp32_model_id if model_path == MODEL_PATH else model_identity(model_path)
+    optimized_path = optimized_model_path(app.config["ECG_ORT_OPTIMIZED_DIR"], model_id, app.config["ECG_ORT_GRAPH_OPTIMIZATION"])
+    return model_path, model_id, optimized_path
+
+
+def ecg_ort_options(**overrides):
+    """session_options settings from the ECG_ORT_* config"""
+    options = {
+        "graph_optimization": app.config["ECG_ORT_GRAPH_OPTIMIZATION"],
+        "intra_op_threads": app.config["ECG_ORT_INTRA_OP_THREADS"],
+        "inter_op_threads": app.config["ECG_ORT_INTER_OP_THREADS"],
+        "execution_mode": app.config["ECG_ORT_EXECUTION_MODE"],
+        "enable_mem_pattern": app.config["ECG_ORT_MEM_PATTERN"],
+        "enable_cpu_mem_arena": app.config["ECG_ORT_CPU_MEM_ARENA"],
+    }
+    options.update(overrides)
+    return options
+
+
+preloaded_ecg_model = None  # resolve_ecg_model() result of preload_ecg_model(), reused by forked workers
+
+
+def preload_ecg_model():
+    """
+    Resolve the model and read its files into memory in a pre-fork server
+    master (wsgi.py), so every worker builds its sessions from the same
+    copy-on-write bytes without hashing or reading the files again. The
+    optimized graph is built first if missing, in a child process. No
+    session is created here: the workers create their own after the fork.
+    Returns the number of bytes preloaded.
+    """
+    global preloaded_ecg_model
+    preloaded_ecg_model = resolve_ecg_model()
+    if preloaded_ecg_model is None:
+        preload_model()
+        return 0
+    model_path, _, optimized_path = preloaded_ecg_model
+    if optimized_path and not os.path.exists(optimized_path):
+        # Optimize once here rather than in every worker at the same time
+        error = build_optimized_model(model_path, optimized_path, providers=app.config["ECG_ORT_PROVIDERS"] or None,
+                                      **ecg_ort_options(intra_op_threads=1))
+        if error:
+            print(f"Optimized ONNX graph not prebuilt ({error}); the workers will build it.")
+    return preload_model(model_path, optimized_path)
+
 
 def load_onnx_model():
-    """Load ONNX model for ECG inference"""
-    global ort_session
+    """Load ONNX model for ECG inference into a pool of tuned sessions"""
+    global ort_session, ECG_MODEL_ID
     try:
-        if os.path.exists(MODEL_PATH):
-            ort_session = ort.InferenceSession(MODEL_PATH)
-            print(f"ONNX model loaded successfully from {MODEL_PATH}")
+        model = preloaded_ecg_model or resolve_ecg_model()
+        if model is not None:
+            model_path, ECG_MODEL_ID, optimized_path = model
+            ort_session = ORTSessionPool(
+                model_path,
+                size=app.config["ECG_ORT_POOL_SIZE"],
+                providers=app.config["ECG_ORT_PROVIDERS"] or None,
+                optimized_path=optimized_path,
+                processes=app.config["ECG_ORT_PROCESSES"],
+                **ecg_ort_options(),
+            )
+            print(f"ONNX model loaded successfully from {model_path}")
             print(f"Input name: {ort_session.get_inputs()[0].name}")
             print(f"Input shape: {ort_session.get_inputs()[0].shape}")
+            if app.config["ECG_ORT_SELF_CHECK"]:
+                check = ort_session.self_check((1, N_LEADS, N_SAMPLES))
+                print(f"ONNX Runtime providers: {check['providers']}, pool size {check['pool_size']}, "
+                      f"{check['intra_op_threads']} intra-op threads per session, "
+                      f"optimized graph: {check['optimized_model'] or 'not saved'}")
+                print(f"ONNX warm-up latency: first {check['warmup_ms']['first']:.1f} ms, "
+                      f"best {check['warmup_ms']['best']:.1f} ms over {check['warmup_ms']['runs']} runs")
         else:
             print(f"ONNX model file not found at {MODEL_PATH}. ECG inference will be disabled.")
             ort_session = None
@@ -124,6 +302,69 @@ def load_onnx_model():
         print(f"Error loading ONNX model: {e}. ECG inference will be disabled.")
         ort_session = None
 
+
+_model_lock = threading.Lock()
+_model_loaded = threading.Event()  # set once load_onnx_model() has run (model ready or unavailable)
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+
+
+def ensure_onnx_model():
+    """The ORT session pool, loading the model first if this process has not (None when unavailable)"""
+    if not _model_loaded.is_set():
+        with _model_lock:
+            if not _model_loaded.is_set():
+                load_onnx_model()
+                _model_loaded.set()
+    return ort_session
+
+
+def start_model_warmup():
+    """Load the model in a background thread, once per (possibly forked) process"""
+    global _warmup_thread
+    if _model_loaded.is_set():
+        return
+    with _warmup_lock:
+        # A thread inherited from the parent of a fork is not alive in the child
+        if _warmup_thread is None or not _warmup_thread.is_alive():
+            _warmup_thread = threading.Thread(target=ensure_onnx_model, name="ecg-model-warmup", daemon=True)
+            _warmup_thread.start()
+
+
+def model_status():
+    if ort_session is not None:
+        return "ready"
+    return "unavailable" if _model_loaded.is_set() else "loading"
+
+
+def run_onnx_batch(batch):
+    """
+    Run one ONNX Runtime call on a batch
+    Args:
+        batch: float32 numpy array of shape [N, 12, 15000]
+    Returns:
+        numpy array of logits, shape [N, 9]
+    """
+    if ort_session is None:
+        raise ValueError("ONNX model not loaded")
+    input_name = ort_session.get_inputs()[0].name
+    return ort_session.run(None, {input_name: batch})[0]
+
+
+ecg_batcher = ECGMicroBatcher(
+    run_onnx_batch,
+    max_batch_size=app.config["ECG_BATCH_MAX_SIZE"],
+    max_wait_ms=app.config["ECG_BATCH_MAX_WAIT_MS"],
+    workers=app.config["ECG_ORT_POOL_SIZE"],
+)
+metrics_registry.register_histogram(
+    "heartline_ecg_batch_size", "Signals per batched ONNX Runtime call", ecg_batcher.batch_size_histogram
+)
+metrics_registry.register_histogram(
+    "heartline_ecg_batch_queue_wait_milliseconds", "Time a signal waited for its batch", ecg_batcher.queue_wait_histogram
+)
+
+
 def predict_ecg_onnx(ecg_signal):
     """
     Run ECG inference using ONNX Runtime
@@ -132,26 +373,23 @@ def predict_ecg_onnx(ecg_signal):
     Returns:
         dict: probabilities for each class
     """
-    global ort_session
-    
-    if ort_session is None:
+    if ensure_onnx_model() is None:
         raise ValueError("ONNX model not loaded")
     
     try:
-        # Prepare input (add batch dimension)
-        input_data = ecg_signal.astype(np.float32)
-        if len(input_data.shape) == 2:
-            input_data = np.expand_dims(input_data, axis=0)  # Add batch dimension
-        
-        # Get input name
-        input_name = ort_session.get_inputs()[0].name
-        
-        # Run inference
-        ort_inputs = {input_name: input_data}
-        ort_outputs = ort_session.run(None, ort_inputs)
+        # Prepare input (drop a leading batch dimension of 1 if present)
+        input_data = np.asarray(ecg_signal, dtype=np.float32)
+        if len(input_data.shape) == 3:
+            input_data = input_data[0]
+        
+        # Run inference, coalesced with concurrent requests when batching is enabled
+        with time_phase("inference"):
+            if app.config["ECG_BATCHING_ENABLED"]:
+                logits = ecg_batcher.submit(input_data)
+            else:
+                logits = run_onnx_batch(np.expand_dims(input_data, axis=0))[0]
         
         # Apply sigmoid to get probabilities
-        logits = ort_outputs[0][0]  # Remove batch dimension
         probs = 1 / (1 + np.exp(-logits))  # Sigmoid activation
         
         # Map to class names
@@ -163,8 +401,109 @@ def predict_ecg_onnx(ecg_signal):
     except Exception as e:
         raise RuntimeError(f"ECG inference failed: {e}")
 
-# Load the ONNX model when the app starts
-load_onnx_model()
+ecg_result_cache = ECGResultCache(
+    max_entries=app.config["ECG_CACHE_MAX_ENTRIES"],
+    cache_dir=app.config["ECG_CACHE_DIR"],
+    max_disk_entries=app.config["ECG_CACHE_MAX_DISK_ENTRIES"],
+)
+
+
+for _name, _stat in (("hits", "memory hits"), ("disk_hits", "disk hits"), ("misses", "misses")):
+    metrics_registry.register_value(
+        f"heartline_ecg_cache_{_name}_total", f"ECG result cache {_stat}",
+        lambda stat=_name: ecg_result_cache.stats()[stat], kind="counter",
+    )
+
+
+def read_ecg_record(hea_path, mat_path=None):
+    """ecg_store.load_record, timed as the read_record phase"""
+    with time_phase("read_record"):
+        return load_record(hea_path, mat_path)
+
+
+def predict_ecg_cached(mat_path, hea_path, record=None):
+    """
+    Run ECG inference for a .mat/.hea pair, reusing earlier results for identical files
+    Args:
+        mat_path, hea_path: paths of the WFDB record files
+        record: optional already-loaded wfdb.Record (skips re-reading on a miss)
+    Returns:
+        tuple: (probabilities dict, True if served from the cache)
+    """
+    ensure_onnx_model()  # the model hash is part of the key
+    key = record_key(mat_path, hea_path, ECG_MODEL_ID)
+    prob_dict = ecg_result_cache.get(key)
+    if prob_dict is not None:
+        return prob_dict, True
+
+    if record is None:
+        record = read_ecg_record(hea_path, mat_path)
+    with time_phase("preprocess"):
+        signal = prepare_record(record)
+    prob_dict = predict_ecg_onnx(signal)
+    ecg_result_cache.put(key, prob_dict)
+    return prob_dict, False
+
+
+def decode_ecg_upload(mat_path, hea_path):
+    """Decode a freshly uploaded record into the memory-mapped signal store (see ecg_store.py)"""
+    try:
+        build_store(hea_path, mat_path)
+    except Exception as e:
+        # Readers rebuild the store on demand and report unreadable records themselves
+        app.logger.warning(f"Could not decode ECG record {hea_path} into the signal store: {e}")
+
+
+ecg_job_runner = ECGJobRunner(
+    app,
+    lambda visit: predict_ecg_cached(visit.ecg_mat, visit.ecg_hea)[0],
+    workers=app.config["ECG_JOB_WORKERS"],
+    poll_interval=app.config["ECG_JOB_POLL_INTERVAL"],
+    retry_backoff=app.config["ECG_JOB_RETRY_BACKOFF"],
+)
+
+
+def queue_ecg_analysis(visit):
+    """Enqueue a background analysis job for a visit with both ECG files (caller commits)"""
+    return enqueue_ecg_analysis(visit.id, max_attempts=app.config["ECG_JOB_MAX_ATTEMPTS"])
+
+
+@app.before_request
+def start_ecg_job_runner():
+    """Start the job workers lazily, once per (possibly forked) worker process"""
+    if app.config["ECG_ASYNC_JOBS"]:
+        ecg_job_runner.start()
+
+
+@app.before_request
+def warm_up_ecg_model():
+    """Start loading the model in the background on the worker's first request"""
+    if app.config["ECG_MODEL_WARMUP"] == "background":
+        start_model_warmup()
+
+
+if app.config["ECG_MODEL_WARMUP"] == "eager":
+    ensure_onnx_model()
+
+
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process answers requests (the model and the database are not checked)"""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: the database answers and, unless loaded lazily, the ECG model warm-up is done (503 until then)"""
+    try:
+        db.session.execute(db.text("SELECT 1"))
+        database = "ok"
+    except Exception as e:
+        app.logger.warning(f"Readiness check: database unavailable: {e}")
+        database = "unavailable"
+    model = model_status()
+    ready = database == "ok" and (model != "loading" or app.config["ECG_MODEL_WARMUP"] == "lazy")
+    return jsonify({"status": "ready" if ready else "not_ready", "database": database, "model": model}), 200 if ready else 503
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -351,6 +690,10 @@ def create_patient():
     return render_template("forms/patient_form.html", form=form)
 
 
+medicament_catalog = MedicamentCatalog(refresh_interval=app.config["MEDICAMENT_CATALOG_REFRESH"])
+invalidate_on_writes(medicament_catalog, models=(Medicament,))
+
+
 @app.route("/visit/new", methods=["GET", "POST"])
 @login_required
 @any_role_required
@@ -364,8 +707,7 @@ def create_visit():
     # The patient_id will be set by the searchable dropdown via JavaScript
 
     # Populate medicament choices for each PrescriptionForm
-    meds = Medicament.query.order_by(Medicament.nom_com).all()
-    med_choices = [(m.num_enr, f"{m.nom_com} ({m.dosage}{m.unite})") for m in meds]
+    med_choices = medicament_catalog.choices()
     for subform in form.prescriptions:
         subform.medicament_num_enr.choices = med_choices
 
@@ -396,6 +738,9 @@ def create_visit():
             hea_file.save(hea_dest)
             v.ecg_hea = hea_dest
 
+        if (mat_file or hea_file) and v.ecg_mat and v.ecg_hea:
+            decode_ecg_upload(v.ecg_mat, v.ecg_hea)
+
         db.session.add(v)
         db.session.flush()  # flush so v.id becomes available for children
 
@@ -429,29 +774,23 @@ def create_visit():
                 )
                 db.session.add(vd)
 
-        db.session.commit()        # 5) OPTIONAL: Run ECG inference immediately after saving if both files exist
-        if v.ecg_mat and v.ecg_hea and ort_session:
+        # 5) Queue ECG inference in the background if both files exist, so the form returns right away
+        ecg_job = None
+        if v.ecg_mat and v.ecg_hea and app.config["ECG_ASYNC_JOBS"]:
+            ecg_job = queue_ecg_analysis(v)
+
+        db.session.commit()
+        if ecg_job is not None:
+            ecg_job_runner.notify()
+            flash("ECG analysis queued. Results will appear on this page shortly.", "info")
+        elif v.ecg_mat and v.ecg_hea and ensure_onnx_model():
             try:
-                rec_basename = os.path.splitext(os.path.basename(v.ecg_hea))[0]
-                rec_dir = os.path.dirname(v.ecg_hea)
-                record = wfdb.rdrecord(os.path.join(rec_dir, rec_basename))
-                sig_all = record.p_signal  # shape [n_samples, n_leads]
-                nsteps, nleads = sig_all.shape
-
-                if nsteps >= 15000:
-                    clipped = sig_all[-15000:, :]
-                else:
-                    clipped = sig_all
-                
-                buffered = np.zeros((15000, nleads), dtype=np.float32)
-                buffered[-clipped.shape[0]:, :] = clipped
-
-                x_np = buffered.T  # shape [12, 15000]
-                
-                # Use ONNX inference instead of PyTorch
-                v.ecg_prediction = predict_ecg_onnx(x_np)
+                # Use ONNX inference (or a cached result for identical files)
+                v.ecg_prediction, _ = predict_ecg_cached(v.ecg_mat, v.ecg_hea)
                 db.session.commit()
                 flash("ECG inference completed automatically.", "info")
+            except ECGPreprocessError as e:
+                flash(f"ECG inference skipped: {e.message}", "warning")
             except Exception as e:
                 flash(f"ECG inference failed: {e}", "warning")
 
@@ -468,11 +807,15 @@ def visit_details(visit_id):
     """
     Display comprehensive visit details including ECG analysis, prescriptions, and documents.
     """
-    visit = Visit.query.get_or_404(visit_id)
+    visit = Visit.query.options(
+        selectinload(Visit.prescriptions).joinedload(Prescription.medicament),
+        selectinload(Visit.documents),
+    ).get_or_404(visit_id)
     
     # Get related data
-    prescriptions = visit.prescriptions.all()
-    documents = visit.documents.all()
+    prescriptions = visit.prescriptions
+    documents = visit.documents
+    ecg_job = visit.ecg_jobs.order_by(ECGAnalysisJob.id.desc()).first()
     
     # Prepare ECG analysis data if available
     ecg_analysis = None
@@ -507,120 +850,206 @@ def visit_details(visit_id):
                          visit=visit, 
                          prescriptions=prescriptions, 
                          documents=documents,
-                         ecg_analysis=ecg_analysis)
+                         ecg_analysis=ecg_analysis,
+                         ecg_job=ecg_job)
+
+# ─── Server-side tables (see table_engine.py) ───
+
+def wants_json_table():
+    """True when a table page is asked for JSON (?format=json or an Accept header preferring it)"""
+    if request.args.get("format") == "json":
+        return True
+    return request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json"
+
+
+def render_table_page(spec, template, serialize, prepare_row=None, context=None):
+    """
+    Run one page of a TableSpec for the current request.
+
+    Args:
+        spec: table_engine.TableSpec
+        template: HTML template, rendered with ``page`` (a TablePage)
+        serialize: row -> dict for the JSON response
+        prepare_row: optional per-row hook applied to the page's rows
+        context: optional callable returning extra template variables
+            (only evaluated for HTML)
+    """
+    try:
+        page = paginate_table(spec, request.args)
+    except ValueError as e:
+        if wants_json_table():
+            return jsonify({"success": False, "error": str(e)}), 400
+        flash(f"Invalid table parameters: {e}", "warning")
+        return redirect(url_for(request.endpoint))
+    if prepare_row:
+        page.rows = [prepare_row(row) for row in page.rows]
+    if wants_json_table():
+        return jsonify({"success": True, **page.to_dict(serialize)})
+    return render_template(template, page=page, **(context() if context else {}))
+
+
+ECG_CLASS_NAMES = {
+    "SNR": "Sinus Rhythm",
+    "AF": "Atrial Fibrillation",
+    "IAVB": "AV Block",
+    "LBBB": "Left Bundle Branch Block",
+    "RBBB": "Right Bundle Branch Block",
+    "PAC": "Premature Atrial Contraction",
+    "PVC": "Premature Ventricular Contraction",
+    "STD": "ST Depression",
+    "STE": "ST Elevation"
+}
+
+
+def ecg_prediction_summary_sql():
+    """
+    SQL expressions for the primary class and its probability, read from the
+    Visit.ecg_prediction JSON (highest probability wins, ties go to the first
+    class, like max() over the dict). Returns (primary_class, top_probability).
+
+    Visit stores both in ecg_primary_class / ecg_confidence on every write;
+    these expressions are what backfill_ecg_summary.py fills older rows with.
+    """
+    raw = {abbr: Visit.ecg_prediction[abbr].as_float() for abbr in ECG_CLASS_NAMES}
+    probs = {abbr: db.func.coalesce(raw[abbr], 0.0) for abbr in ECG_CLASS_NAMES}
+    is_top = {
+        abbr: db.and_(raw[abbr].isnot(None),
+                      *[probs[abbr] >= probs[other] for other in ECG_CLASS_NAMES if other != abbr])
+        for abbr in ECG_CLASS_NAMES
+    }
+    primary_class = db.case(*[(is_top[abbr], abbr) for abbr in ECG_CLASS_NAMES], else_=None)
+    top_probability = db.case(*[(is_top[abbr], probs[abbr]) for abbr in ECG_CLASS_NAMES], else_=0.0)
+    return primary_class, top_probability
+
+
+def ecg_history_spec():
+    # Analyzed visits, by their indexed summary columns (see Visit.ecg_primary_class)
+    return TableSpec(
+        Visit.query.join(Visit.patient).options(contains_eager(Visit.patient))
+        .filter(Visit.ecg_primary_class.isnot(None)),
+        sorts={
+            "id": Visit.id,
+            "date": Visit.visit_date,
+            "first_name": Patient.first_name,
+            "last_name": Patient.last_name,
+            "confidence": Visit.ecg_confidence,
+        },
+        presets={
+            "date_desc": "-date",
+            "date_asc": "date",
+            "patient_asc": "first_name,last_name,-date",
+            "patient_desc": "-first_name,-last_name,-date",
+            "confidence_desc": "-confidence,-date",
+            "confidence_asc": "confidence,-date",
+        },
+        default_sort="date_desc",
+        filters={
+            "patient": contains_words(Patient.first_name, Patient.last_name),
+            "diagnosis": one_of(Visit.ecg_primary_class, ECG_CLASS_NAMES),
+            "min_confidence": at_least(Visit.ecg_confidence),
+            "date_from": date_from(Visit.visit_date),
+            "date_to": date_to(Visit.visit_date),
+        },
+    )
+
+
+def attach_ecg_summary(record):
+    """Primary diagnosis name for display (the confidence is record.ecg_confidence)"""
+    record.ecg_primary_diagnosis = {
+        'abbreviation': record.ecg_primary_class,
+        'name': ECG_CLASS_NAMES.get(record.ecg_primary_class, record.ecg_primary_class)
+    }
+    return record
+
+
+def ecg_history_row_json(record):
+    return {
+        "id": record.id,
+        "patient_id": record.patient_id,
+        "patient_name": f"{record.patient.first_name} {record.patient.last_name}",
+        "visit_date": record.visit_date.isoformat(),
+        "primary_diagnosis": record.ecg_primary_diagnosis,
+        "confidence": record.ecg_confidence,
+        "diagnosis": record.diagnosis,
+        "has_files": bool(record.ecg_mat and record.ecg_hea),
+    }
+
 
 @app.route("/ecg_history")
 def ecg_history():
     """
-    Display comprehensive ECG history table with filtering and sorting capabilities.
+    Display the ECG history table, one server-side page at a time
+    (filters, sort and cursor come from the query string; ?format=json for JSON).
     """
     from datetime import date
-    from sqlalchemy import desc
-    
-    # Get all visits that have ECG data, ordered by visit date (newest first)
-    ecg_records = Visit.query.filter(
-        Visit.ecg_prediction.isnot(None)
-    ).order_by(desc(Visit.visit_date)).all()
-    
-    # Process ECG records to extract primary diagnosis and confidence
-    for record in ecg_records:
-        if record.ecg_prediction:
-            # Find primary diagnosis (highest probability)
-            max_prob_abbr = max(record.ecg_prediction, key=record.ecg_prediction.get)
-            max_prob_value = record.ecg_prediction[max_prob_abbr]
-            
-            # Class names mapping
-            class_names = {
-                "SNR": "Sinus Rhythm",
-                "AF": "Atrial Fibrillation", 
-                "IAVB": "AV Block",
-                "LBBB": "Left Bundle Branch Block",
-                "RBBB": "Right Bundle Branch Block", 
-                "PAC": "Premature Atrial Contraction",
-                "PVC": "Premature Ventricular Contraction",
-                "STD": "ST Depression",
-                "STE": "ST Elevation"
-            }
-            
-            # Attach processed data to record
-            record.ecg_primary_diagnosis = {
-                'abbreviation': max_prob_abbr,
-                'name': class_names.get(max_prob_abbr, max_prob_abbr)
-            }
-            record.ecg_confidence = max_prob_value
-    
-    # Calculate summary statistics
-    total_ecgs = len(ecg_records)
-    normal_rhythm_count = sum(1 for r in ecg_records 
-                             if r.ecg_primary_diagnosis['abbreviation'] == 'SNR')
-    abnormal_count = total_ecgs - normal_rhythm_count
-    high_confidence_count = sum(1 for r in ecg_records if r.ecg_confidence >= 0.8)
-    
-    return render_template("tables/ecg_history_table.html", 
-                         ecg_records=ecg_records,
-                         total_ecgs=total_ecgs,
-                         normal_rhythm_count=normal_rhythm_count,
-                         abnormal_count=abnormal_count,
-                         high_confidence_count=high_confidence_count,
-                         date=date)
+
+    def context():
+        # Summary statistics over every ECG, aggregated in SQL from the summary columns
+        stats = db.session.query(
+            db.func.count(Visit.id),
+            db.func.sum(db.case((Visit.ecg_primary_class == "SNR", 1), else_=0)),
+            db.func.sum(db.case((Visit.ecg_confidence >= 0.8, 1), else_=0)),
+        ).filter(Visit.ecg_primary_class.isnot(None)).one()
+        total_ecgs = stats[0] or 0
+        normal_rhythm_count = int(stats[1] or 0)
+        return {
+            "total_ecgs": total_ecgs,
+            "normal_rhythm_count": normal_rhythm_count,
+            "abnormal_count": total_ecgs - normal_rhythm_count,
+            "high_confidence_count": int(stats[2] or 0),
+            "date": date,
+        }
+
+    return render_table_page(ecg_history_spec(), "tables/ecg_history_table.html", ecg_history_row_json,
+                             prepare_row=attach_ecg_summary, context=context)
+
+
+def age_on(birth_date, today):
+    """Age in whole years on ``today``"""
+    return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+
+
+def wants_gzip_export():
+    return request.args.get("gzip", "").lower() in ("1", "true", "yes")
 
 
 @app.route("/ecg_history/export")
 def export_ecg_history():
     """
-    Export ECG history data to CSV format.
+    Stream the ECG history as CSV (?gzip=1 for a .csv.gz file).
+
+    Accepts the ECG history table's filters (patient, diagnosis,
+    min_confidence, date_from, date_to), so an export matches the table view.
     """
-    import csv
-    from io import StringIO
-    from flask import make_response
-    from sqlalchemy import desc
-    
-    # Get all visits with ECG data
-    ecg_records = Visit.query.filter(
-        Visit.ecg_prediction.isnot(None)
-    ).order_by(desc(Visit.visit_date)).all()
-    
-    # Create CSV content
-    output = StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow([
-        'Visit ID', 'Patient Name', 'Patient Age', 'Gender', 'Visit Date', 
-        'Primary ECG Diagnosis', 'Confidence', 'Clinical Diagnosis',
-        'All ECG Findings', 'Files Available'
-    ])
-    
-    # Write data rows
-    for record in ecg_records:
-        if record.ecg_prediction:
-            # Calculate patient age
-            from datetime import date
-            birth_date = record.patient.date_of_birth
-            today = date.today()
-            age = today.year - birth_date.year
-            if today.month < birth_date.month or (today.month == birth_date.month and today.day < birth_date.day):
-                age = age - 1
-            
-            # Find primary diagnosis
-            max_prob_abbr = max(record.ecg_prediction, key=record.ecg_prediction.get)
-            max_prob_value = record.ecg_prediction[max_prob_abbr]
-            
-            class_names = {
-                "SNR": "Sinus Rhythm", "AF": "Atrial Fibrillation", "IAVB": "AV Block",
-                "LBBB": "Left Bundle Branch Block", "RBBB": "Right Bundle Branch Block", 
-                "PAC": "Premature Atrial Contraction", "PVC": "Premature Ventricular Contraction",
-                "STD": "ST Depression", "STE": "ST Elevation"
-            }
-            
-            primary_diagnosis = class_names.get(max_prob_abbr, max_prob_abbr)
-            
+    from datetime import date
+
+    query = (
+        db.session.query(
+            Visit.id, Visit.visit_date, Visit.diagnosis, Visit.ecg_primary_class, Visit.ecg_confidence,
+            Visit.ecg_prediction, Visit.ecg_mat, Visit.ecg_hea,
+            Patient.first_name, Patient.last_name, Patient.date_of_birth, Patient.gender,
+        )
+        .join(Patient, Patient.id == Visit.patient_id)
+        .filter(Visit.ecg_primary_class.isnot(None))
+    )
+    try:
+        query, _ = apply_filters(ecg_history_spec(), query, request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    # Server-side cursor: rows arrive in batches instead of all at once
+    query = query.order_by(Visit.visit_date.desc(), Visit.id.desc()).yield_per(500)
+
+    class_names = ECG_CLASS_NAMES
+    today = date.today()
+
+    def rows():
+        for record in query:
             # Format all findings
             all_findings = "; ".join([
-                f"{class_names.get(abbr, abbr)}: {prob:.1%}" 
-                for abbr, prob in record.ecg_prediction.items()
+                f"{class_names.get(abbr, abbr)}: {prob:.1%}"
+                for abbr, prob in (record.ecg_prediction or {}).items()
             ])
-            
+
             # File availability
             files_available = []
             if record.ecg_mat:
@@ -628,27 +1057,25 @@ def export_ecg_history():
             if record.ecg_hea:
                 files_available.append("HEA")
             files_str = ", ".join(files_available) if files_available else "None"
-            
-            writer.writerow([
+
+            yield [
                 record.id,
-                f"{record.patient.first_name} {record.patient.last_name}",
-                age,
-                record.patient.gender,
+                f"{record.first_name} {record.last_name}",
+                age_on(record.date_of_birth, today),
+                record.gender,
                 record.visit_date.strftime('%Y-%m-%d %H:%M'),
-                primary_diagnosis,
-                f"{max_prob_value:.1%}",
+                class_names.get(record.ecg_primary_class, record.ecg_primary_class),
+                f"{record.ecg_confidence:.1%}",
                 record.diagnosis or "No clinical diagnosis",
                 all_findings,
                 files_str
-            ])
-    
-    # Create response
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = 'attachment; filename=ecg_history.csv'
-    
-    return response
+            ]
+
+    return csv_response([
+        'Visit ID', 'Patient Name', 'Patient Age', 'Gender', 'Visit Date',
+        'Primary ECG Diagnosis', 'Confidence', 'Clinical Diagnosis',
+        'All ECG Findings', 'Files Available'
+    ], rows(), "ecg_history", compress=wants_gzip_export())
 
 
 @app.route("/api/ecg_details/<int:visit_id>")
@@ -709,36 +1136,16 @@ def analyze_existing_ecg(visit_id):
         if not os.path.exists(visit.ecg_mat) or not os.path.exists(visit.ecg_hea):
             return jsonify({"success": False, "error": "ECG files not found on disk"}), 400
           # Check if model is loaded
-        if not ort_session:
+        if not ensure_onnx_model():
             return jsonify({"success": False, "error": "ECG analysis model not available"}), 500
         
-        # Read ECG data using the existing file paths
-        rec_basename = os.path.splitext(os.path.basename(visit.ecg_hea))[0]
-        rec_dir = os.path.dirname(visit.ecg_hea)
-        record_path = os.path.join(rec_dir, rec_basename)
-        
-        # Load the ECG record
-        record = wfdb.rdrecord(record_path)
+        # Load the ECG record (memory-mapped from the decoded store)
+        record = read_ecg_record(visit.ecg_hea, visit.ecg_mat)
         sig_all = record.p_signal  # [n_samples, n_leads]
         nsteps, nleads = sig_all.shape
         
-        # Prepare data for inference (same logic as in other analyze_ecg functions)
-        if nsteps >= 15000:
-            clipped = sig_all[-15000:, :]
-        else:
-            clipped = sig_all
-        buffered = np.zeros((15000, nleads), dtype=np.float32)
-        buffered[-clipped.shape[0]:, :] = clipped
-        
-        # Transpose for the model
-        x_np = buffered.T  # shape [12, 15000]
-        
-        # Run ONNX inference
-        prob_dict = predict_ecg_onnx(x_np)
-        
-        # Find the most likely condition (highest probability)
-        max_prob_abbr = max(prob_dict, key=prob_dict.get)
-        max_prob_value = prob_dict[max_prob_abbr]
+        # Run ONNX inference, short-circuited when these exact files were scored before
+        prob_dict, _ = predict_ecg_cached(visit.ecg_mat, visit.ecg_hea, record=record)
         
         # Class names for response
         class_names = {
@@ -795,10 +1202,136 @@ def analyze_existing_ecg(visit_id):
         
         return jsonify(response)
         
+    except ECGPreprocessError as e:
+        return jsonify(e.to_dict()), 400
     except Exception as e:
         return jsonify({"success": False, "error": f"ECG analysis failed: {str(e)}"}), 500
 
 
+@app.route("/api/ecg_jobs/<int:job_id>")
+@login_required
+@any_role_required
+def api_ecg_job(job_id):
+    """Status (and result once finished) of a background ECG analysis job"""
+    job = ECGAnalysisJob.query.get_or_404(job_id)
+    return jsonify({"success": True, "job": job.to_dict()})
+
+
+@app.route("/api/ecg_batcher/stats")
+@login_required
+@any_role_required
+def ecg_batcher_stats():
+    """Batch-size and queue-wait histograms for tuning the inference batcher"""
+    return jsonify({
+        "enabled": app.config["ECG_BATCHING_ENABLED"],
+        "stats": ecg_batcher.stats(),
+        "cache": ecg_result_cache.stats(),
+        "sessions": ort_session.stats() if ort_session else None
+    })
+
+
+def wants_binary_waveform():
+    """True when the client negotiated the framed binary waveform format (Accept header or ?format=binary)"""
+    fmt = request.args.get("format")
+    if fmt in ("binary", "json"):
+        return fmt == "binary"
+    best = request.accept_mimetypes.best_match(["application/json", WAVEFORM_MIMETYPE])
+    return best == WAVEFORM_MIMETYPE
+
+
+def waveform_view_args():
+    """
+    Parse the plot-view query (?max_points=, ?t_start=, ?t_end= in seconds, ?method=minmax|lttb).
+    Returns None when none was given (full-resolution response), raises ValueError on bad input.
+    """
+    args = request.args
+    if not any(key in args for key in ("max_points", "t_start", "t_end")):
+        return None
+    try:
+        max_points = int(args["max_points"]) if args.get("max_points") else None
+        t_start = float(args["t_start"]) if args.get("t_start") else None
+        t_end = float(args["t_end"]) if args.get("t_end") else None
+    except ValueError:
+        raise ValueError("max_points must be an integer and t_start/t_end numbers of seconds")
+    if max_points is not None and max_points < 2:
+        raise ValueError("max_points must be at least 2")
+    if t_start is not None and t_end is not None and t_end <= t_start:
+        raise ValueError("t_end must be greater than t_start")
+    method = args.get("method", "minmax")
+    if method not in ("minmax", "lttb"):
+        raise ValueError(f"Unknown decimation method: {method}")
+    return {"max_points": max_points, "t_start": t_start, "t_end": t_end, "method": method}
+
+
+def record_waveform_view(record, view_args, n_leads=None):
+    """Apply a parsed plot-view query to a wfdb.Record; returns (view dict, nleads, source fs)"""
+    sig_all = record.p_signal
+    nleads = sig_all.shape[1] if n_leads is None else min(n_leads, sig_all.shape[1])
+    fs = float(record.fs) if hasattr(record, 'fs') and record.fs else 250.0
+    view = waveform_view(sig_all[:, :nleads].T, fs, **(view_args or {}))
+    return view, nleads, fs
+
+
+def waveform_view_json(record, view_args, n_leads=None, scale=1.0):
+    """
+    JSON payload for a windowed/decimated waveform. Min-max output keeps a shared
+    "time" axis; LTTB picks different samples per lead, so it returns "times" per lead.
+    """
+    view, nleads, fs = record_waveform_view(record, view_args, n_leads)
+    signals = view["signals"] * scale if scale != 1.0 else view["signals"]
+    if view["times"] is None:
+        n_points = signals.shape[1]
+        time_data = (view["t0"] + np.arange(n_points) / view["fs"]).tolist()
+        times = None
+    else:
+        time_data = None
+        times = view["times"].tolist()
+    lead_names = record.sig_name[:nleads] if getattr(record, 'sig_name', None) else [f"Lead {i+1}" for i in range(nleads)]
+    return {
+        "time": time_data,
+        "times": times,
+        "signals": signals.tolist(),
+        "sampling_rate": fs,
+        "duration": view["t_end"] - view["t0"],
+        "t_start": view["t0"],
+        "t_end": view["t_end"],
+        "decimation": {
+            "method": view["method"],
+            "bucket_size": view["bucket_size"],
+            "source_samples": view["source_samples"],
+            "points": int(signals.shape[1]),
+        },
+        "lead_names": lead_names,
+        "n_leads": nleads,
+    }
+
+
+def binary_waveform_response(record, n_leads=None, scale=1.0, view_args=None):
+    """
+    Encode a wfdb.Record's signals as a binary waveform frame (see ecg_waveform.py).
+    ?encoding=int16 sends ADC counts with per-lead gain/baseline instead of float32.
+    ``view_args`` (from waveform_view_args) windows/decimates with min-max first.
+    """
+    if view_args and view_args["method"] == "lttb":
+        # The frame describes a uniform time axis; LTTB samples are irregular
+        return jsonify({"success": False, "error": "method=lttb is only available in the JSON format"}), 400
+    view, nleads, _ = record_waveform_view(record, view_args, n_leads)
+    lead_names = record.sig_name[:nleads] if getattr(record, 'sig_name', None) else [f"Lead {i+1}" for i in range(nleads)]
+    units = record.units[:nleads] if getattr(record, 'units', None) else None
+
+    encoding = request.args.get("encoding", "float32")
+    if encoding not in ("float32", "int16"):
+        return jsonify({"success": False, "error": f"Unsupported waveform encoding: {encoding}"}), 400
+    gain = baseline = None
+    if encoding == "int16" and getattr(record, 'adc_gain', None) and getattr(record, 'baseline', None):
+        # Reuse the record's own ADC parameters so the original digital samples round-trip exactly
+        gain, baseline = record.adc_gain[:nleads], record.baseline[:nleads]
+
+    body = encode_waveform(view["signals"], view["fs"], lead_names, units=units, scale=scale,
+                           encoding=encoding, gain=gain, baseline=baseline, t0=view["t0"])
+    return Response(body, mimetype=WAVEFORM_MIMETYPE, headers={"Vary": "Accept"})
+
+
 @app.route('/visit/<int:visit_id>/ecg_waveform', methods=['GET'])
 def get_visit_ecg_waveform(visit_id):
     """Load ECG waveform data from existing files for a visit"""
@@ -813,13 +1346,19 @@ def get_visit_ecg_waveform(visit_id):
         if not os.path.exists(visit.ecg_mat) or not os.path.exists(visit.ecg_hea):
             return jsonify({"success": False, "error": "ECG files not found on disk"}), 404
         
-        # Read ECG data using the existing file paths
-        rec_basename = os.path.splitext(os.path.basename(visit.ecg_hea))[0]
-        rec_dir = os.path.dirname(visit.ecg_hea)
-        record_path = os.path.join(rec_dir, rec_basename)
-        
-        # Load the ECG record
-        record = wfdb.rdrecord(record_path)
+        try:
+            view_args = waveform_view_args()
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
+        # Load the ECG record (memory-mapped from the decoded store)
+        record = read_ecg_record(visit.ecg_hea, visit.ecg_mat)
+        if wants_binary_waveform():
+            return binary_waveform_response(record, n_leads=12, scale=1000.0, view_args=view_args)
+        if view_args is not None:
+            ecg_data = waveform_view_json(record, view_args, n_leads=12, scale=1000.0)
+            ecg_data["leads"] = ecg_data["n_leads"]
+            return jsonify({"success": True, "ecg": ecg_data})
         sig_all = record.p_signal  # [n_samples, n_leads]
         nsteps, nleads = sig_all.shape
           # Prepare ECG waveform data for frontend
@@ -857,7 +1396,7 @@ def analyze_ecg():
     Returns JSON with ECG diagnosis probabilities.
     """
     try:
-        if not ort_session:
+        if not ensure_onnx_model():
             return jsonify({"error": "ECG model not loaded"}), 500
         
         mat_file = request.files.get('mat_file')
@@ -886,28 +1425,9 @@ def analyze_ecg():
             mat_file.save(mat_path)
             hea_file.save(hea_path)
             
-            # Read ECG data using wfdb
-            record_path = os.path.join(temp_dir, mat_base)
-            record = wfdb.rdrecord(record_path)
-            sig_all = record.p_signal  # shape [n_samples, n_leads]
-            nsteps, nleads = sig_all.shape
-            
-            # Prepare data for inference (same as in create_visit)
-            if nsteps >= 15000:
-                clipped = sig_all[-15000:, :]
-            else:
-                clipped = sig_all
-            buffered = np.zeros((15000, nleads), dtype=np.float32)
-            buffered[-clipped.shape[0]:, :] = clipped
-            
-            x_np = buffered.T  # shape [12, 15000]
-            
-            # Run ONNX inference
-            prob_dict = predict_ecg_onnx(x_np)
-            
-            # Find the most likely condition (highest probability)
-            max_prob_abbr = max(prob_dict, key=prob_dict.get)
-            max_prob_value = prob_dict[max_prob_abbr]
+            # Read ECG data using wfdb and run ONNX inference (cached by file content,
+            # so re-uploading the same record during a consult is instant)
+            prob_dict, _ = predict_ecg_cached(mat_path, hea_path)
             
             # Class names for response
             class_names = {
@@ -940,6 +1460,8 @@ def analyze_ecg():
             
             return jsonify(response)
             
+    except ECGPreprocessError as e:
+        return jsonify(e.to_dict()), 400
     except Exception as e:
         return jsonify({"error": f"ECG analysis failed: {str(e)}"}), 500
 
@@ -976,11 +1498,10 @@ def ecg_waveform_data():
             mat_file.save(mat_path)
             hea_file.save(hea_path)
             
-            record_path = os.path.join(temp_dir, mat_base)
-            # Ensure files are closed before wfdb tries to read them, by seeking to start after saving
-            mat_file.seek(0)
-            hea_file.seek(0)
-            record = wfdb.rdrecord(record_path) 
+            with time_phase("read_record"):
+                record = read_wfdb(hea_path)
+            if wants_binary_waveform():
+                return binary_waveform_response(record)
             
             sig_all = record.p_signal  # [n_samples, n_leads]
             nsteps, nleads = sig_all.shape
@@ -1029,16 +1550,12 @@ def edit_visit(visit_id):
     ]
 
     # ──────────── 2) Prepare Medicament choices for prescriptions ────────────
-    meds = Medicament.query.order_by(Medicament.nom_com).all()
-    med_choices = [
-        (m.num_enr, f"{m.nom_com} ({m.dosage}{m.unite})") 
-        for m in meds
-    ]
+    med_choices = medicament_catalog.choices()
 
     # ──────────── 3) ONLY pre-populate existing prescriptions & documents on GET ────────────
     if request.method == "GET":
         # --- 3a) Prescriptions from database ---
-        existing_prescriptions = visit.prescriptions.all()
+        existing_prescriptions = visit.prescriptions
         if existing_prescriptions:
             # Remove any default/min entries to start clean
             while len(form.prescriptions.entries) > 0:
@@ -1056,7 +1573,7 @@ def edit_visit(visit_id):
                 subform.medicament_num_enr.choices = med_choices
 
         # --- 3b) Documents from database ---
-        existing_documents = visit.documents.all()
+        existing_documents = visit.documents
         if existing_documents:
             while len(form.documents.entries) > 0:
                 form.documents.pop_entry()
@@ -1096,6 +1613,9 @@ def edit_visit(visit_id):
             hea_file.save(hea_dest)
             visit.ecg_hea = hea_dest
 
+        if (mat_file or hea_file) and visit.ecg_mat and visit.ecg_hea:
+            decode_ecg_upload(visit.ecg_mat, visit.ecg_hea)
+
         # 5c) Delete ALL existing prescriptions in DB, then re-insert from form entries
         existing_prescriptions = Prescription.query.filter_by(visit_id=visit.id).all()
         Prescription.query.filter_by(visit_id=visit.id).delete()
@@ -1132,29 +1652,24 @@ def edit_visit(visit_id):
                 )
                 db.session.add(vd)
 
-        db.session.commit()        # 5e) (Optional) Re-run ECG inference if both .mat and .hea were uploaded
-        if (mat_file or hea_file) and visit.ecg_mat and visit.ecg_hea and ort_session:
+        # 5e) (Optional) Re-run ECG inference in the background if both .mat and .hea were uploaded
+        ecg_job = None
+        ecg_changed = (mat_file or hea_file) and visit.ecg_mat and visit.ecg_hea
+        if ecg_changed and app.config["ECG_ASYNC_JOBS"]:
+            ecg_job = queue_ecg_analysis(visit)
+
+        db.session.commit()
+        if ecg_job is not None:
+            ecg_job_runner.notify()
+            flash("ECG analysis queued. Results will appear on the visit page shortly.", "info")
+        elif ecg_changed and ensure_onnx_model():
             try:
-                rec_basename = os.path.splitext(os.path.basename(visit.ecg_hea))[0]
-                rec_dir      = os.path.dirname(visit.ecg_hea)
-                record       = wfdb.rdrecord(os.path.join(rec_dir, rec_basename))
-                sig_all      = record.p_signal  # [n_samples, n_leads]
-                nsteps, nleads = sig_all.shape
-
-                # Clip or pad to 15000 samples
-                if nsteps >= 15000:
-                    clipped = sig_all[-15000:, :]
-                else:
-                    clipped = sig_all
-                buffered = np.zeros((15000, nleads), dtype=np.float32)
-                buffered[-clipped.shape[0]:, :] = clipped
-
-                x_np = buffered.T
-                
-                # Run ONNX inference
-                visit.ecg_prediction = predict_ecg_onnx(x_np)
+                # Run ONNX inference (or reuse a cached result for identical files)
+                visit.ecg_prediction, _ = predict_ecg_cached(visit.ecg_mat, visit.ecg_hea)
                 db.session.commit()
                 flash("ECG analysis updated successfully.", "info")
+            except ECGPreprocessError as e:
+                flash(f"ECG analysis skipped: {e.message}", "warning")
             except Exception as e:
                 flash(f"ECG analysis failed: {e}", "warning")
 
@@ -1171,18 +1686,9 @@ def search_medicaments():
     try:
         q = request.args.get('q', '', type=str).strip()
         page = request.args.get('page', 1, type=int)
-        per_page = 10
-        query = Medicament.query
-        if q:
-            pattern = f"%{q}%"
-            # Search in both nom_com and nom_dci fields
-            query = query.filter(
-                db.or_(
-                    Medicament.nom_com.ilike(pattern),
-                    Medicament.nom_dci.ilike(pattern)                )
-            )
-        paginated = query.order_by(Medicament.nom_com).paginate(page=page, per_page=per_page, error_out=False)
-        meds = paginated.items
+        per_page = clamp_per_page(request.args.get('per_page', type=int), 10)
+        # Search in both nom_com and nom_dci fields (in-memory catalog, no query per keystroke)
+        meds, more = medicament_catalog.search(q, offset=(max(page, 1) - 1) * per_page, limit=per_page)
         results = [
             { 
                 'id': m.num_enr, 
@@ -1194,7 +1700,6 @@ def search_medicaments():
             }
             for m in meds
         ]
-        more = paginated.pages > page
         return jsonify({ 'medicaments': results, 'pagination': { 'more': more } })
     except Exception as e:
         return jsonify({ 'error': str(e) }), 500
@@ -1211,21 +1716,12 @@ def search_patients():
         page = request.args.get('page', 1, type=int)
         per_page = 10
         
-        query = Patient.query
-        if q:
-            pattern = f"%{q}%"
-            # Search in both first_name and last_name fields
-            query = query.filter(
-                db.or_(
-                    Patient.first_name.ilike(pattern),
-                    Patient.last_name.ilike(pattern)
-                )
-            )
+        # Search in both first_name and last_name fields, closest names first
+        query = text_search(Patient.query, [Patient.first_name, Patient.last_name], q)
         
-        # Sort by latest added (id desc), then by name
-        paginated = query.order_by(Patient.id.desc(), Patient.first_name, Patient.last_name).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Then by latest added (id desc), then by name; select2 only needs "more", so no COUNT(*)
+        paginated = offset_page(query.order_by(Patient.id.desc(), Patient.first_name, Patient.last_name),
+                                page=page, per_page=per_page)
         
         patients = paginated.items
         results = [
@@ -1240,8 +1736,7 @@ def search_patients():
             for p in patients
         ]
         
-        more = paginated.pages > page
-        return jsonify({ 'patients': results, 'pagination': { 'more': more } })
+        return jsonify({ 'patients': results, 'pagination': { 'more': paginated.has_more } })
     except Exception as e:
         return jsonify({ 'error': str(e) }), 500
 
@@ -1307,24 +1802,150 @@ def create_patient_ajax():
 # ─── Route to search medicaments by name ───
 
 
+def patient_table_rows():
+    """
+    Patients with their per-patient visit aggregates, in a single SELECT.
+    Returns the query for plain rows (patient columns plus total_visits,
+    unpaid_visits, partial_visits, has_prescriptions, has_ecg,
+    last_visit_date and last_follow_up_date), unordered.
+    """
+    visit_stats = (
+        db.session.query(
+            Visit.patient_id.label("patient_id"),
+            db.func.count(Visit.id).label("total_visits"),
+            db.func.sum(db.case((Visit.payment_status == "unpaid", 1), else_=0)).label("unpaid_visits"),
+            db.func.sum(db.case((Visit.payment_status == "partial", 1), else_=0)).label("partial_visits"),
+            db.func.max(db.case((Visit.ecg_mat.isnot(None), 1), else_=0)).label("has_ecg"),
+        )
+        .group_by(Visit.patient_id)
+        .subquery()
+    )
+    prescribed = (
+        db.session.query(Visit.patient_id.label("patient_id"))
+        .join(Prescription, Prescription.visit_id == Visit.id)
+        .distinct()
+        .subquery()
+    )
+    # Latest visit per patient (for the last visit / follow-up column)
+    ranked_visits = (
+        db.session.query(
+            Visit.patient_id.label("patient_id"),
+            Visit.visit_date.label("visit_date"),
+            Visit.follow_up_date.label("follow_up_date"),
+            db.func.row_number().over(
+                partition_by=Visit.patient_id,
+                order_by=(Visit.visit_date.desc(), Visit.id.desc()),
+            ).label("rn"),
+        )
+        .subquery()
+    )
+
+    return (
+        db.session.query(
+            Patient.id,
+            Patient.first_name,
+            Patient.last_name,
+            Patient.date_of_birth,
+            Patient.gender,
+            Patient.phone,
+            Patient.email,
+            db.func.coalesce(visit_stats.c.total_visits, 0).label("total_visits"),
+            db.func.coalesce(visit_stats.c.unpaid_visits, 0).label("unpaid_visits"),
+            db.func.coalesce(visit_stats.c.partial_visits, 0).label("partial_visits"),
+            db.func.coalesce(visit_stats.c.has_ecg, 0).label("has_ecg"),
+            prescribed.c.patient_id.isnot(None).label("has_prescriptions"),
+            ranked_visits.c.visit_date.label("last_visit_date"),
+            ranked_visits.c.follow_up_date.label("last_follow_up_date"),
+        )
+        .outerjoin(visit_stats, visit_stats.c.patient_id == Patient.id)
+        .outerjoin(prescribed, prescribed.c.patient_id == Patient.id)
+        .outerjoin(ranked_visits, db.and_(ranked_visits.c.patient_id == Patient.id, ranked_visits.c.rn == 1))
+    )
+
+
+def years_before(day, years):
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:  # 29 February
+        return day.replace(year=day.year - years, day=28)
+
+
+def patient_age_filter(bound):
+    """Age in whole years, as a date_of_birth range ("min" or "max" bound)"""
+    from datetime import date
+
+    def apply(query, value):
+        try:
+            years = int(value)
+        except ValueError:
+            raise ValueError(f"Invalid age: {value}")
+        today = date.today()
+        if bound == "min":
+            return query.filter(Patient.date_of_birth <= years_before(today, years))
+        return query.filter(Patient.date_of_birth > years_before(today, years + 1))
+    return apply
+
+
+def patients_table_spec():
+    return TableSpec(
+        patient_table_rows(),
+        sorts={
+            "id": Patient.id,
+            "first_name": Patient.first_name,
+            "last_name": Patient.last_name,
+            "date_of_birth": Patient.date_of_birth,
+            "created": db.func.coalesce(Patient.created_at, datetime(1970, 1, 1)),
+        },
+        presets={
+            "name_asc": "first_name,last_name",
+            "name_desc": "-first_name,-last_name",
+            "age_asc": "-date_of_birth",
+            "age_desc": "date_of_birth",
+            "created_desc": "-created",
+            "created_asc": "created",
+        },
+        default_sort="name_asc",
+        filters={
+            "name": contains_words(Patient.first_name, Patient.last_name),
+            "gender": one_of(Patient.gender, ("Male", "Female", "Other")),
+            "age_min": patient_age_filter("min"),
+            "age_max": patient_age_filter("max"),
+        },
+    )
+
+
+def patient_row_json(row):
+    return {
+        "id": row.id,
+        "first_name": row.first_name,
+        "last_name": row.last_name,
+        "date_of_birth": row.date_of_birth.isoformat(),
+        "gender": row.gender,
+        "phone": row.phone,
+        "email": row.email,
+        "total_visits": row.total_visits,
+        "unpaid_visits": int(row.unpaid_visits),
+        "partial_visits": int(row.partial_visits),
+        "has_ecg": bool(row.has_ecg),
+        "has_prescriptions": bool(row.has_prescriptions),
+        "last_visit_date": row.last_visit_date.isoformat() if row.last_visit_date else None,
+        "last_follow_up_date": row.last_follow_up_date.isoformat() if row.last_follow_up_date else None,
+    }
+
+
 @app.route("/patients")
 @login_required
 @any_role_required
 def patients_table():
     """
-    Display comprehensive patients table with filtering and sorting capabilities.
+    Display the patients table, one server-side page at a time
+    (filters, sort and cursor come from the query string; ?format=json for JSON).
     """
     from datetime import date
-    
-    # Get all patients with their related data
-    patients = Patient.query.order_by(Patient.last_name, Patient.first_name).all()
-    
-    return render_template("tables/patients_table.html", 
-                         patients=patients,
-                         Patient=Patient,
-                         Visit=Visit,
-                         Prescription=Prescription,
-                         date=date)
+
+    # One query per page: patients plus their visit/payment/prescription/ECG stats
+    return render_table_page(patients_table_spec(), "tables/patients_table.html", patient_row_json,
+                             context=lambda: {"date": date})
 
 
 @app.route("/patient/<int:patient_id>")
@@ -1369,23 +1990,58 @@ def edit_patient(patient_id):
 @any_role_required
 def visits_table():
     """
-    Display comprehensive visits table with filtering and sorting capabilities.
+    Display the visits table, one server-side page at a time
+    (filters, sort and cursor come from the query string; ?format=json for JSON).
     """
     from datetime import date
-    from sqlalchemy import desc
-    
-    # Get all visits with their related data, ordered by visit date (newest first)
-    visits = Visit.query.order_by(desc(Visit.visit_date)).all()
-    
-    return render_template("tables/visits_table.html", 
-                         visits=visits,
-                         Patient=Patient,
-                         Visit=Visit,
-                         Prescription=Prescription,
-                         VisitDocument=VisitDocument,
-                         date=date)
+
+    return render_table_page(visits_table_spec(), "tables/visits_table.html", visit_row_json,
+                             context=lambda: {"date": date})
+
+
+def visits_table_spec():
+    return TableSpec(
+        # Documents are listed and prescriptions counted per row: two more queries per page, not per row
+        Visit.query.join(Visit.patient)
+        .options(contains_eager(Visit.patient), selectinload(Visit.documents), selectinload(Visit.prescriptions)),
+        sorts={
+            "id": Visit.id,
+            "date": Visit.visit_date,
+            "first_name": Patient.first_name,
+            "last_name": Patient.last_name,
+            "payment": db.func.coalesce(Visit.payment_total, 0),
+        },
+        presets={
+            "date_desc": "-date",
+            "date_asc": "date",
+            "patient_asc": "first_name,last_name,-date",
+            "patient_desc": "-first_name,-last_name,-date",
+            "payment_desc": "-payment,-date",
+            "payment_asc": "payment,-date",
+        },
+        default_sort="date_desc",
+        filters={
+            "patient": contains_words(Patient.first_name, Patient.last_name),
+            "payment_status": one_of(Visit.payment_status, ("paid", "partial", "unpaid")),
+            "date_from": date_from(Visit.visit_date),
+            "date_to": date_to(Visit.visit_date),
+        },
+    )
 
 
+def visit_row_json(visit):
+    return {
+        "id": visit.id,
+        "patient_id": visit.patient_id,
+        "patient_name": f"{visit.patient.first_name} {visit.patient.last_name}",
+        "visit_date": visit.visit_date.isoformat(),
+        "diagnosis": visit.diagnosis,
+        "payment_total": float(visit.payment_total) if visit.payment_total is not None else None,
+        "payment_remaining": float(visit.payment_remaining) if visit.payment_remaining is not None else None,
+        "payment_status": visit.payment_status,
+        "has_ecg": bool(visit.ecg_mat and visit.ecg_hea),
+        "follow_up_date": visit.follow_up_date.isoformat() if visit.follow_up_date else None,
+    }
 
 
 @app.route("/appointments")
@@ -1393,32 +2049,74 @@ def visits_table():
 @any_role_required
 def appointments_table():
     """
-    Display comprehensive appointments table with filtering and sorting capabilities.
+    Display the appointments table, one server-side page at a time
+    (filters, sort and cursor come from the query string; ?format=json for JSON).
     """
     from datetime import date, datetime
-    
-    # Get all appointments with their related data
-    appointments = Appointment.query.order_by(Appointment.date.desc()).all()
-    
-    # Get all doctors for the filter dropdown
-    doctors = Doctor.query.order_by(Doctor.last_name, Doctor.first_name).all()
-    
-    # Calculate appointment statistics
-    stats = {
-        'total': Appointment.query.count(),
-        'scheduled': Appointment.query.filter_by(state='scheduled').count(),
-        'completed': Appointment.query.filter_by(state='completed').count(),
-        'today': Appointment.query.filter(
-            db.func.date(Appointment.date) == date.today()
-        ).count()
+
+    def context():
+        # Doctors for the filter dropdown
+        doctors = Doctor.query.order_by(Doctor.last_name, Doctor.first_name).all()
+
+        # Calculate appointment statistics
+        stats = {
+            'total': Appointment.query.count(),
+            'scheduled': Appointment.query.filter_by(state='scheduled').count(),
+            'completed': Appointment.query.filter_by(state='completed').count(),
+            'today': Appointment.query.filter(
+                day_range(Appointment.date, date.today())
+            ).count()
+        }
+        return {"doctors": doctors, "stats": stats, "date": date, "datetime": datetime}
+
+    return render_table_page(appointments_table_spec(), "tables/appointments_table.html", appointment_row_json,
+                             context=context)
+
+
+def appointments_table_spec():
+    return TableSpec(
+        Appointment.query.join(Appointment.patient).outerjoin(Appointment.doctor)
+        .options(contains_eager(Appointment.patient), contains_eager(Appointment.doctor)),
+        sorts={
+            "id": Appointment.id,
+            "date": Appointment.date,
+            "first_name": Patient.first_name,
+            "last_name": Patient.last_name,
+            "state": Appointment.state,
+            "created": db.func.coalesce(Appointment.created_at, datetime(1970, 1, 1)),
+        },
+        presets={
+            "date_asc": "date",
+            "date_desc": "-date",
+            "patient_asc": "first_name,last_name,date",
+            "patient_desc": "-first_name,-last_name,date",
+            "status_asc": "state,date",
+            "created_desc": "-created",
+        },
+        default_sort="date_desc",
+        filters={
+            "patient": contains_words(Patient.first_name, Patient.last_name),
+            "status": one_of(Appointment.state, ("scheduled", "completed", "canceled")),
+            "doctor_id": equal_to(Appointment.doctor_id),
+            "date_from": date_from(Appointment.date),
+            "date_to": date_to(Appointment.date),
+        },
+    )
+
+
+def appointment_row_json(appointment):
+    doctor = appointment.doctor
+    return {
+        "id": appointment.id,
+        "patient_id": appointment.patient_id,
+        "patient_name": f"{appointment.patient.first_name} {appointment.patient.last_name}",
+        "doctor_id": appointment.doctor_id,
+        "doctor_name": f"Dr. {doctor.first_name} {doctor.last_name}" if doctor else None,
+        "date": appointment.date.isoformat(),
+        "reason": appointment.reason,
+        "state": appointment.state,
+        "created_at": appointment.created_at.isoformat() if appointment.created_at else None,
     }
-    
-    return render_template("tables/appointments_table.html", 
-                         appointments=appointments,
-                         doctors=doctors,
-                         stats=stats,
-                         date=date,
-                         datetime=datetime)
 
 
 @app.route("/appointment/new", methods=["GET", "POST"])
@@ -1506,81 +2204,35 @@ def edit_appointment(appointment_id):
 
 # --- Patients ---
 @app.route('/api/patients')
+@query_budget(3)  # user, page, total
 @login_required
 @any_role_required
 def api_patients():
     """API endpoint to get patient data for tables"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        search = request.args.get('search', '', type=str).strip()
-        
-        query = Patient.query
-        
-        # Filter by search term (first or last name)
-        if search:
-            pattern = f'%{search}%'
-            query = query.filter(
-                or_(
-                    Patient.first_name.ilike(pattern),
-                    Patient.last_name.ilike(pattern)
-                )
-            )
-        
-        # Paginate results
-        patients_paginated = query.paginate(page=page, per_page=per_page, error_out=False)
-        
-        # Serialize results
-        patients = [
-            {
-                'id': p.id,
-                'first_name': p.first_name,
-                'last_name': p.last_name,
-                'date_of_birth': p.date_of_birth.strftime('%Y-%m-%d') if p.date_of_birth else None,
-                'gender': p.gender,
-                'phone': p.phone,
-                'email': p.email,
-                'created_at': p.created_at.strftime('%Y-%m-%d %H:%M'),
-                'visits_count': p.visits.count()
-            }
-            for p in patients_paginated.items
-        ]
+        # One query per page (visit counts as subqueries), estimated total
+        patients_paginated, patients = patient_list(request.args)
         
         return jsonify({
             'patients': patients,
-            'pagination': {
-                'page': patients_paginated.page,
-                'per_page': patients_paginated.per_page,
-                'total': patients_paginated.total,
-                'pages': patients_paginated.pages
-            }
+            'pagination': patients_paginated.pagination()
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 # --- Doctors ---
 @app.route('/api/doctors')
+@query_budget(2)  # user, doctors
 @login_required
 @any_role_required
 def api_doctors():
     """API endpoint to get doctor data"""
     try:
-        doctors = Doctor.query.order_by(Doctor.last_name, Doctor.first_name).all()
-        doctor_list = [
-            {
-                'id': d.id,
-                'first_name': d.first_name,
-                'last_name': d.last_name,
-                'specialty': d.specialty,
-                'phone': d.phone,
-                'email': d.email,
-                'user_id': d.user.id if d.user else None,
-                'username': d.user.username if d.user else None
-            }
-            for d in doctors
-        ]
-        return jsonify({'doctors': doctor_list})
+        # Doctors and their user accounts in one query
+        return jsonify({'doctors': doctor_list()})
     except Exception as e:
         app.logger.error(f"Error in /api/doctors: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -1592,9 +2244,7 @@ def api_doctors():
 def api_users():
     """API endpoint to get user data for user management with pagination and filters"""
     try:
-        # Pagination and filters
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        # Filters
         search = request.args.get('search', '', type=str).strip()
         role = request.args.get('role', '', type=str)
         status = request.args.get('status', '', type=str)
@@ -1621,9 +2271,9 @@ def api_users():
             elif status == 'inactive':
                 query = query.filter(User.is_active.is_(False))
         # Order by created date
-        query = query.order_by(User.created_at.desc())
-        # Paginate
-        paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+        query = query.order_by(User.created_at.desc(), User.id.desc())
+        # Paginate (exact total: the user management page shows page numbers; the table is small)
+        paginated = page_from_args(query, request.args, total=TOTAL_EXACT)
         users = paginated.items
         # Serialize results
         user_list = [
@@ -1642,12 +2292,7 @@ def api_users():
         ]
         return jsonify({
             'users': user_list,
-            'pagination': {
-                'page': paginated.page,
-                'per_page': paginated.per_page,
-                'total': paginated.total,
-                'pages': paginated.pages
-            }
+            'pagination': paginated.pagination()
         })
     except Exception as e:
         app.logger.error(f"Error in /api/users: {str(e)}")
@@ -1677,111 +2322,42 @@ def api_users_stats():
 
 # --- Visits ---
 @app.route('/api/visits')
+@query_budget(3)  # user, page, total
 @login_required
 @any_role_required
 def api_visits():
     """API endpoint to get visit data for tables"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        search = request.args.get('search', '', type=str).strip()
-        
-        query = Visit.query
-        
-        # Filter by search term (patient name, diagnosis, etc.)
-        if search:
-            pattern = f'%{search}%'
-            query = query.filter(
-                or_(
-                    Patient.first_name.ilike(pattern),
-                    Patient.last_name.ilike(pattern),
-                    Visit.diagnosis.ilike(pattern)
-                )
-            ).join(Patient)  # Join with Patient table for name search
-        
-        # Paginate results
-        visits_paginated = query.paginate(page=page, per_page=per_page, error_out=False)
-        
-        # Serialize results
-        visits = [
-            {
-                'id': v.id,
-                'patient_name': f"{v.patient.first_name} {v.patient.last_name}",
-                'visit_date': v.visit_date.strftime('%Y-%m-%d %H:%M') if v.visit_date else None,
-                'diagnosis': v.diagnosis,
-                'payment_status': v.payment_status,
-                'created_at': v.created_at.strftime('%Y-%m-%d %H:%M'),
-                'prescriptions_count': v.prescriptions.count(),
-                'documents_count': v.documents.count()
-            }
-            for v in visits_paginated.items
-        ]
+        # One query per page (patient joined, prescription/document counts as subqueries), estimated total
+        visits_paginated, visits = visit_list(request.args)
         
         return jsonify({
             'visits': visits,
-            'pagination': {
-                'page': visits_paginated.page,
-                'per_page': visits_paginated.per_page,
-                'total': visits_paginated.total,
-                'pages': visits_paginated.pages
-            }
+            'pagination': visits_paginated.pagination()
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 # --- Appointments ---
 @app.route('/api/appointments')
+@query_budget(3)  # user, page, total
 @login_required
 @any_role_required
 def api_appointments():
     """API endpoint to get appointment data for tables"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        search = request.args.get('search', '', type=str).strip()
-        
-        query = Appointment.query
-        
-        # Filter by search term (patient name, doctor name, reason, etc.)
-        if search:
-            pattern = f'%{search}%'
-            query = query.filter(
-                or_(
-                    Patient.first_name.ilike(pattern),
-                    Patient.last_name.ilike(pattern),
-                    Doctor.first_name.ilike(pattern),
-                    Doctor.last_name.ilike(pattern),
-                    Appointment.reason.ilike(pattern)
-                )
-            ).join(Patient, Doctor)  # Join with Patient and Doctor tables
-        
-        # Paginate results
-        appointments_paginated = query.paginate(page=page, per_page=per_page, error_out=False)
-        
-        # Serialize results
-        appointments = [
-            {
-                'id': a.id,
-                'patient_name': f"{a.patient.first_name} {a.patient.last_name}",
-                'doctor_name': f"Dr. {a.doctor.first_name} {a.doctor.last_name}" if a.doctor else "No doctor assigned",
-                'date': a.date.strftime('%Y-%m-%d %H:%M') if a.date else None,
-                'reason': a.reason,
-                'state': a.state,
-                'created_at': a.created_at.strftime('%Y-%m-%d %H:%M')
-            }
-            for a in appointments_paginated.items
-        ]
+        # One query per page (patient and doctor joined), estimated total
+        appointments_paginated, appointments = appointment_list(request.args)
         
         return jsonify({
             'appointments': appointments,
-            'pagination': {
-                'page': appointments_paginated.page,
-                'per_page': appointments_paginated.per_page,
-                'total': appointments_paginated.total,
-                'pages': appointments_paginated.pages
-            }
+            'pagination': appointments_paginated.pagination()
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1870,43 +2446,43 @@ def delete_appointment(appointment_id):
 @login_required
 @any_role_required
 def export_appointments():
-    """Export appointments data to CSV"""
+    """
+    Stream appointments as CSV (?gzip=1 for a .csv.gz file).
+
+    Accepts the appointments table's filters (patient, status, doctor_id,
+    date_from, date_to), e.g. ?date_from=2024-05-01&date_to=2024-05-31.
+    """
+    query = (
+        db.session.query(
+            Appointment.id, Appointment.date, Appointment.reason, Appointment.state, Appointment.created_at,
+            Patient.first_name.label("patient_first_name"), Patient.last_name.label("patient_last_name"),
+            Doctor.first_name.label("doctor_first_name"), Doctor.last_name.label("doctor_last_name"),
+        )
+        .join(Patient, Patient.id == Appointment.patient_id)
+        .outerjoin(Doctor, Doctor.id == Appointment.doctor_id)
+    )
     try:
-        import csv
-        import io
-        from datetime import datetime
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['ID', 'Date', 'Time', 'Patient', 'Doctor', 'Reason', 'Status', 'Created'])
-        
-        # Write appointment data
-        appointments = Appointment.query.order_by(Appointment.date.desc()).all()
-        for apt in appointments:
-            writer.writerow([
+        query, _ = apply_filters(appointments_table_spec(), query, request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    # Server-side cursor: rows arrive in batches instead of all at once
+    query = query.order_by(Appointment.date.desc(), Appointment.id.desc()).yield_per(500)
+
+    def rows():
+        for apt in query:
+            yield [
                 apt.id,
                 apt.date.strftime('%Y-%m-%d'),
                 apt.date.strftime('%H:%M'),
-                f"{apt.patient.first_name} {apt.patient.last_name}",
-                f"Dr. {apt.doctor.first_name} {apt.doctor.last_name}" if apt.doctor else "No doctor assigned",
+                f"{apt.patient_first_name} {apt.patient_last_name}",
+                f"Dr. {apt.doctor_first_name} {apt.doctor_last_name}" if apt.doctor_first_name else "No doctor assigned",
                 apt.reason,
                 apt.state.title(),
-                apt.created_at.strftime('%Y-%m-%d %H:%M')
-            ])
-        
-        output.seek(0)
-        
-        from flask import Response
-        return Response(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={'Content-Disposition': 'attachment; filename=appointments.csv'}
-        )
-        
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
+                apt.created_at.strftime('%Y-%m-%d %H:%M') if apt.created_at else ""
+            ]
+
+    return csv_response(['ID', 'Date', 'Time', 'Patient', 'Doctor', 'Reason', 'Status', 'Created'],
+                        rows(), "appointments", compress=wants_gzip_export())
 
 
 # ----------------------------------------
@@ -2134,27 +2710,29 @@ def index():
     return redirect(url_for('dashboard'))
 
 
+dashboard_stats_cache = DashboardStatsCache(ttl=app.config["DASHBOARD_STATS_TTL"])
+invalidate_on_writes(dashboard_stats_cache)
+
+
+def current_dashboard_stats():
+    """Dashboard counters for the current user's role (and doctor), one query per TTL"""
+    doctor_id = current_user.doctor_id if current_user.is_doctor() else None
+    return dashboard_stats_cache.get(
+        (current_user.role, doctor_id),
+        lambda: compute_dashboard_stats(doctor_id=doctor_id),
+    )
+
+
 @app.route("/dashboard")
 @login_required
 def dashboard():
     """Main dashboard - role-specific content"""
-    from datetime import date, timedelta
-    
-    # Get basic statistics
-    total_patients = Patient.query.count()
-    total_visits = Visit.query.count()
-    total_appointments = Appointment.query.count()
-    
-    # Today's statistics
-    today = date.today()
-    today_visits = Visit.query.filter(
-        db.func.date(Visit.visit_date) == today
-    ).count()
-    
-    today_appointments = Appointment.query.filter(
-        db.func.date(Appointment.date) == today,
-        Appointment.state == 'scheduled'
-    ).count()
+    stats = current_dashboard_stats()
+    total_patients = stats["total_patients"]
+    total_visits = stats["total_visits"]
+    total_appointments = stats["total_appointments"]
+    today_visits = stats["today_visits"]
+    today_appointments = stats["today_appointments"]
     
     # Recent activity based on role
     if current_user.is_doctor():
@@ -2201,18 +2779,7 @@ def dashboard():
 def doctor_dashboard_stats():
     """Get doctor dashboard statistics"""
     try:
-        from datetime import date, timedelta
-        today = date.today()
-        week_ago = today - timedelta(days=7)
-        month_ago = today - timedelta(days=30)
-        
-        # Basic counts
-        total_patients = Patient.query.count()
-        today_visits = Visit.query.filter(db.func.date(Visit.visit_date) == today).count()
-        ecg_tests_week = Visit.query.filter(
-            Visit.visit_date >= week_ago,
-            Visit.ecg_results.isnot(None)
-        ).count()
+        stats = current_dashboard_stats()
         
         # Average visit time (mock data for now)
         avg_visit_time = 25
@@ -2223,30 +2790,21 @@ def doctor_dashboard_stats():
         ecg_change = 15
         time_change = 0
         
-        # Quick stats
-        pending_reports = Visit.query.filter(Visit.notes == '').count()
-        completed_today = Visit.query.filter(
-            db.func.date(Visit.visit_date) == today,
-            Visit.notes != ''
-        ).count()
-        follow_ups = 3  # Mock data
-        new_patients_week = Patient.query.filter(
-            Patient.created_at >= week_ago
-        ).count()
-        
         return jsonify({
-            'total_patients': total_patients,
-            'today_visits': today_visits,
-            'ecg_tests_week': ecg_tests_week,
+            'total_patients': stats['total_patients'],
+            'today_visits': stats['today_visits'],
+            'ecg_tests_week': stats['ecg_tests_week'],
             'avg_visit_time': avg_visit_time,
             'patients_change': patients_change,
             'visits_change': visits_change,
             'ecg_change': ecg_change,
             'time_change': time_change,
-            'pending_reports': pending_reports,
-            'completed_today': completed_today,
-            'follow_ups': follow_ups,
-            'new_patients_week': new_patients_week
+            'pending_reports': stats['pending_reports'],
+            'completed_today': stats['completed_today'],
+            'follow_ups': stats['follow_ups'],
+            'new_patients_week': stats['new_patients_week'],
+            'my_today_visits': stats.get('doctor_today_visits', 0),
+            'my_upcoming_appointments': stats.get('doctor_upcoming_appointments', 0)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -2257,17 +2815,7 @@ def doctor_dashboard_stats():
 def assistant_dashboard_stats():
     """Get assistant dashboard statistics"""
     try:
-        from datetime import date, timedelta
-        today = date.today()
-        yesterday = today - timedelta(days=1)
-        
-        # Basic counts for today
-        patients_registered = Patient.query.filter(
-            db.func.date(Patient.created_at) == today
-        ).count()
-        visits_processed = Visit.query.filter(
-            db.func.date(Visit.visit_date) == today
-        ).count()
+        stats = current_dashboard_stats()
         calls_handled = 12  # Mock data
         avg_processing_time = 8  # Mock data
         
@@ -2278,8 +2826,8 @@ def assistant_dashboard_stats():
         time_change = -5
         
         return jsonify({
-            'patients_registered': patients_registered,
-            'visits_processed': visits_processed,
+            'patients_registered': stats['new_patients_today'],
+            'visits_processed': stats['today_visits'],
             'calls_handled': calls_handled,
             'avg_processing_time': avg_processing_time,
             'registration_change': registration_change,
@@ -2331,8 +2879,8 @@ def dashboard_today_schedule():
         today = date.today()
         
         appointments = Appointment.query.filter(
-            db.func.date(Appointment.date) == today,
-            Appointment.state == 'scheduled'
+            Appointment.state == 'scheduled',
+            day_range(Appointment.date, today)
         ).order_by(Appointment.date).limit(10).all()
         
         schedule = []
@@ -2340,7 +2888,7 @@ def dashboard_today_schedule():
             schedule.append({
                 'time': apt.date.isoformat(),
                 'patient_name': f"{apt.patient.first_name} {apt.patient.last_name}",
-                'visit_type': apt.purpose or 'General Visit'
+                'visit_type': apt.reason or 'General Visit'
             })
         
         return jsonify(schedule)
@@ -2352,30 +2900,62 @@ def dashboard_today_schedule():
 def dashboard_visits_chart():
     """Get visits chart data for last 7 days"""
     try:
-        from datetime import date, timedelta
-        
-        # Get last 7 days
-        today = date.today()
-        dates = []
-        visits_count = []
-        
-        for i in range(6, -1, -1):
-            day = today - timedelta(days=i)
-            dates.append(day.strftime('%m/%d'))
-            
-            # Count visits for this day
-            count = Visit.query.filter(
-                db.func.date(Visit.visit_date) == day
-            ).count()
-            visits_count.append(count)
+        today = datetime.now().date()
+        data = count_series(Visit.query, Visit.visit_date, today - timedelta(days=6), today,
+                            dialect=db.session.get_bind().dialect.name)
         
         return jsonify({
-            'labels': dates,
-            'visits': visits_count
+            'labels': [datetime.fromisoformat(day).strftime('%m/%d') for day in data['buckets']],
+            'visits': data['total']
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/dashboard/visits-series')
+@login_required
+def dashboard_visits_series():
+    """
+    Visit counts per day, week or month over any range, in one grouped query.
+    Query args: start, end (YYYY-MM-DD, both included; default the last 30 days),
+    granularity (day/week/month), by (doctor or diagnosis breakdown), doctor_id.
+    """
+    today = datetime.now().date()
+    try:
+        end = parse_date(request.args["end"]) if request.args.get("end") else today
+        start = parse_date(request.args["start"]) if request.args.get("start") else end - timedelta(days=29)
+        granularity = request.args.get("granularity", "day")
+        breakdown = request.args.get("by") or None
+
+        query = Visit.query
+        if request.args.get("doctor_id"):
+            query = equal_to(Visit.doctor_id)(query, request.args["doctor_id"])
+        if breakdown == "doctor":
+            series = Visit.doctor_id
+        elif breakdown == "diagnosis":
+            series = db.func.nullif(db.func.trim(Visit.diagnosis), "")
+        elif breakdown is None:
+            series = None
+        else:
+            raise ValueError(f"Cannot break down by: {breakdown}")
+
+        data = count_series(query, Visit.visit_date, start, end, granularity, series,
+                            dialect=db.session.get_bind().dialect.name)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    if breakdown == "doctor":
+        doctor_ids = [s["key"] for s in data["series"] if isinstance(s["key"], int)]
+        names = {d.id: f"Dr. {d.first_name} {d.last_name}" for d in Doctor.query.filter(Doctor.id.in_(doctor_ids))}
+        for s in data["series"]:
+            s["label"] = names.get(s["key"], "Unassigned" if s["key"] is None else str(s["key"]))
+    elif breakdown == "diagnosis":
+        for s in data["series"]:
+            s["label"] = s["key"] or "No diagnosis"
+
+    data.update({"success": True, "start": start.isoformat(), "end": end.isoformat(),
+                 "granularity": granularity, "by": breakdown})
+    return jsonify(data)
+
 @app.route('/api/dashboard/patient-queue')
 @login_required
 def dashboard_patient_queue():
@@ -2386,8 +2966,8 @@ def dashboard_patient_queue():
         
         # Get today's appointments that are scheduled or in progress
         appointments = Appointment.query.filter(
-            db.func.date(Appointment.date) == today,
-            Appointment.state.in_(['scheduled', 'in_progress'])
+            Appointment.state.in_(['scheduled', 'in_progress']),
+            day_range(Appointment.date, today)
         ).order_by(Appointment.date).all()
         
         queue = []
@@ -2395,7 +2975,7 @@ def dashboard_patient_queue():
             status = 'waiting' if apt.state == 'scheduled' else 'in-progress'
             queue.append({
                 'name': f"{apt.patient.first_name} {apt.patient.last_name}",
-                'visit_type': apt.purpose or 'General Visit',
+                'visit_type': apt.reason or 'General Visit',
                 'scheduled_time': apt.date.isoformat(),
                 'status': status
             })
@@ -2571,10 +3151,9 @@ def list_users():
         elif status_filter == 'inactive':
             query = query.filter_by(is_active=False)
         
-        # Paginate
-        users_pagination = query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Paginate (exact total for the page numbers; the user table is small)
+        users_pagination = offset_page(query.order_by(User.created_at.desc(), User.id.desc()),
+                                       page=page, per_page=per_page, total=TOTAL_EXACT)
         
         users_list = []
         for user in users_pagination.items:
@@ -2588,17 +3167,12 @@ def list_users():
                 'is_active': user.is_active,
                 'last_login': user.last_login.isoformat() if user.last_login else None,
                 'created_at': user.created_at.isoformat(),
-                'doctor_profile_id': user.doctor_profile_id
+                'doctor_profile_id': user.doctor_id
             })
         
         return jsonify({
             'users': users_list,
-            'pagination': {
-                'page': page,
-                'pages': users_pagination.pages,
-                'per_page': per_page,
-                'total': users_pagination.total
-            }
+            'pagination': users_pagination.pagination()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -2619,7 +3193,7 @@ def get_user(user_id):
             'last_name': user.last_name,
             'role': user.role,
             'is_active': user.is_active,
-            'doctor_profile_id': user.doctor_profile_id
+            'doctor_profile_id': user.doctor_id
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -2727,32 +3301,12 @@ def analyze_ecg_by_visit(visit_id):
         if not os.path.exists(mat_path) or not os.path.exists(hea_path):
             return jsonify({"success": False, "error": "ECG files not found on disk for live analysis"}), 400
         
-        if not ort_session:
+        if not ensure_onnx_model():
             return jsonify({"success": False, "error": "ECG analysis model not available"}), 500
 
-        rec_basename = os.path.splitext(os.path.basename(hea_path))[0]
-        rec_dir = os.path.dirname(hea_path)
-        record_path = os.path.join(rec_dir, rec_basename)
-        
-        record = wfdb.rdrecord(record_path)
-        sig_all = record.p_signal
-        nsteps, nleads = sig_all.shape
-
-        if nleads != 12:
-             return jsonify({"success": False, "error": f"ECG record has {nleads} leads, but model expects 12."}), 400
-
-        if nsteps >= 15000:
-            clipped = sig_all[-15000:, :]
-        else:
-            clipped = sig_all
-        
-        buffered = np.zeros((15000, nleads), dtype=np.float32)
-        buffered[-clipped.shape[0]:, :] = clipped
-        
-        x_np = buffered.T
-        
-        # Run ONNX inference
-        prob_dict_live = predict_ecg_onnx(x_np)
+        # Run ONNX inference (content-addressed cache first)
+        prob_dict_live, from_cache = predict_ecg_cached(mat_path, hea_path)
+        source = "cached" if from_cache else "live analysis"
         max_prob_abbr_live = max(prob_dict_live, key=prob_dict_live.get)
         max_prob_value_live = prob_dict_live[max_prob_abbr_live]
         
@@ -2764,22 +3318,12 @@ def analyze_ecg_by_visit(visit_id):
                 "name": class_names.get(max_prob_abbr_live, max_prob_abbr_live),
                 "probability": max_prob_value_live
             },
-            "summary": f"Primary finding: {class_names.get(max_prob_abbr_live, max_prob_abbr_live)} ({max_prob_value_live:.1%} confidence) (live analysis)"
+            "summary": f"Primary finding: {class_names.get(max_prob_abbr_live, max_prob_abbr_live)} ({max_prob_value_live:.1%} confidence) ({source})"
         }
         return jsonify(response)
 
-    except wfdb.WFDBError as wfdbe:
-        current_app.logger.error(f"WFDBError in /analyze_ecg_by_visit/{visit_id}: {wfdbe}", exc_info=True)
-        record_path_for_error = "unknown"
-        try:
-            # Try to get record_path for better error logging if it was defined
-            if 'rec_basename' in locals() and 'rec_dir' in locals():
-                 record_path_for_error = os.path.join(rec_dir, rec_basename)
-        except NameError:
-            pass # Keep it as unknown
-        if ".dat" in str(wfdbe).lower() and ("cannot be found" in str(wfdbe).lower() or "no such file" in str(wfdbe).lower()):
-             return jsonify({"success": False, "error": f"WFDB error: Associated .dat file missing or unreadable for record {record_path_for_error}. Details: {str(wfdbe)}"}), 404
-        return jsonify({"success": False, "error": f"WFDB processing error: {str(wfdbe)}"}), 500
+    except ECGPreprocessError as e:
+        return jsonify(e.to_dict()), 400
     except FileNotFoundError:
         current_app.logger.error(f"FileNotFoundError in /analyze_ecg_by_visit/{visit_id}", exc_info=True)
         return jsonify({"success": False, "error": "ECG record file not found. Check paths and file integrity."}), 404
@@ -2803,11 +3347,16 @@ def ecg_waveform_by_visit(visit_id):
         if not os.path.exists(mat_path) or not os.path.exists(hea_path):
             return jsonify({"success": False, "error": "ECG files not found on disk"}), 404
 
-        rec_basename = os.path.splitext(os.path.basename(hea_path))[0]
-        rec_dir = os.path.dirname(hea_path)
-        record_path = os.path.join(rec_dir, rec_basename)
-        
-        record = wfdb.rdrecord(record_path)
+        try:
+            view_args = waveform_view_args()
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
+        record = read_ecg_record(hea_path, mat_path)
+        if wants_binary_waveform():
+            return binary_waveform_response(record, view_args=view_args)
+        if view_args is not None:
+            return jsonify({"success": True, "ecg_data": waveform_view_json(record, view_args)})
         sig_all = record.p_signal
         nsteps, nleads = sig_all.shape
         
@@ -2836,17 +3385,6 @@ def ecg_waveform_by_visit(visit_id):
             "ecg_data": ecg_data
         })
 
-    except wfdb.WFDBError as wfdbe:
-        current_app.logger.error(f"WFDBError in /ecg_waveform_by_visit/{visit_id}: {wfdbe}", exc_info=True)
-        record_path_for_error = "unknown"
-        try:
-            if 'rec_basename' in locals() and 'rec_dir' in locals():
-                 record_path_for_error = os.path.join(rec_dir, rec_basename)
-        except NameError:
-            pass
-        if ".dat" in str(wfdbe).lower() and ("cannot be found" in str(wfdbe).lower() or "no such file" in str(wfdbe).lower()):
-             return jsonify({"success": False, "error": f"WFDB error: Associated .dat file missing or unreadable for record {record_path_for_error}. Details: {str(wfdbe)}"}), 404
-        return jsonify({"success": False, "error": f"WFDB processing error: {str(wfdbe)}"}), 500
     except FileNotFoundError:
         current_app.logger.error(f"FileNotFoundError in /ecg_waveform_by_visit/{visit_id}", exc_info=True)
         return jsonify({"success": False, "error": "ECG record file not found. Check paths and file integrity."}), 404
@@ -2864,7 +3402,7 @@ if __name__ == "__main__":
             print("Database tables created/verified successfully.")
         except Exception as e:
             print(f"Database error: {e}")
-        
-        load_onnx_model()      # load ONNX model for ECG inference
     
+    # Development server only; in production serve wsgi:application with
+    # gunicorn (gunicorn -c gunicorn.conf.py), see wsgi.py
     app.run(host='0.0.0.0',debug=False)
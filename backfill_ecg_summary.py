@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Fill the ECG summary columns (Visit.ecg_primary_class, ecg_confidence,
+ecg_analyzed_at) for visits analyzed before those columns existed.
+Apply migrations/001_visit_ecg_summary.sql first.
+
+    python backfill_ecg_summary.py [--batch-size 1000] [--all]
+
+Each batch is a single UPDATE over a primary-key range, computed in SQL from
+the prediction JSON, so no prediction is loaded into Python and the script
+can be interrupted and re-run safely. The original analysis time is not
+known for old rows; their updated_at is used instead.
+"""
+
+import argparse
+
+from app import app, db, ecg_prediction_summary_sql
+from models import Visit
+
+
+def backfill_ecg_summary(batch_size=1000, recompute=False):
+    """Returns the number of visits updated"""
+    primary_class, top_probability = ecg_prediction_summary_sql()
+    max_id = db.session.query(db.func.max(Visit.id)).scalar() or 0
+
+    updated = 0
+    for start in range(0, max_id, batch_size):
+        query = Visit.query.filter(
+            Visit.id > start,
+            Visit.id <= start + batch_size,
+            Visit.ecg_prediction.isnot(None),
+        )
+        if not recompute:
+            query = query.filter(Visit.ecg_primary_class.is_(None))
+        count = query.update({
+            Visit.ecg_primary_class: primary_class,
+            Visit.ecg_confidence: db.case((primary_class.isnot(None), top_probability), else_=None),
+            Visit.ecg_analyzed_at: db.func.coalesce(Visit.ecg_analyzed_at, Visit.updated_at, Visit.visit_date),
+            # Keep the last-edit time: without this the column's onupdate stamps every visit with now
+            Visit.updated_at: Visit.updated_at,
+        }, synchronize_session=False)
+        db.session.commit()
+        updated += count
+        if count:
+            print(f"   visits {start + 1}-{min(start + batch_size, max_id)}: {count} updated")
+    return updated
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backfill the denormalized ECG summary columns on visit")
+    parser.add_argument("--batch-size", type=int, default=1000, help="visit ids per UPDATE (default 1000)")
+    parser.add_argument("--all", action="store_true",
+                        help="recompute every analyzed visit, not only those missing a summary")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with app.app_context():
+        print("Backfilling ECG summary columns...")
+        total = backfill_ecg_summary(max(args.batch_size, 1), recompute=args.all)
+        remaining = Visit.query.filter(
+            Visit.ecg_prediction.isnot(None), Visit.ecg_primary_class.is_(None)
+        ).count()
+        print(f"✓ {total} visits updated")
+        if remaining:
+            print(f"⚠ {remaining} visits have a prediction without any class probability and were left empty")
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Latency/throughput benchmark for the ECG inference path.
+
+Measures, each with p50/p95/p99/mean latency and throughput:
+  onnx        ONNX Runtime runs at batch sizes 1-64 for every thread count and
+              every published model variant (fp32, int8-dynamic, int8-static)
+  batcher     predict_ecg_onnx's path: concurrent single-record submits through
+              ECGMicroBatcher + ORTSessionPool
+  torch       PyTorch resnet34 at the same batch sizes (when torch and the .pth exist)
+  rdrecord    WFDB parsing (wfdb.rdrecord) vs the memory-mapped store (ecg_store)
+  waveform    waveform JSON serialization vs the binary frame and a decimated view
+
+Results go to a JSON file; pass --compare OLD.json to print p50 changes
+against an earlier run.
+
+    python benchmark_ecg.py --output bench.json
+    python benchmark_ecg.py --suites onnx --batch-sizes 1,8,32 --threads 1,4 --compare bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import onnxruntime as ort
+import wfdb
+
+from ecg_batcher import ECGMicroBatcher
+from ecg_cache import model_identity
+from ecg_preprocessing import N_LEADS, N_SAMPLES
+from ecg_sessions import MODEL_VARIANTS, ORTSessionPool, create_session, model_variant_path
+from ecg_store import build_store, load_record
+from ecg_waveform import encode_waveform, waveform_view
+
+SUITES = ("onnx", "batcher", "torch", "rdrecord", "waveform")
+
+
+def summarize(latencies_ms, items_per_call=1):
+    """Percentiles (ms) and throughput (items/s) for one measured configuration"""
+    lat = np.asarray(latencies_ms, dtype=np.float64)
+    return {
+        "iterations": int(lat.size),
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p95_ms": float(np.percentile(lat, 95)),
+        "p99_ms": float(np.percentile(lat, 99)),
+        "mean_ms": float(lat.mean()),
+        "throughput_per_s": float(items_per_call * lat.size / (lat.sum() / 1000.0)) if lat.sum() > 0 else None,
+    }
+
+
+def time_calls(fn, iterations, warmup):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return latencies
+
+
+def synthetic_batch(n):
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((n, N_LEADS, N_SAMPLES), dtype=np.float32)
+
+
+# ----------------------------------------
+# Suites
+# ----------------------------------------
+
+def bench_onnx(args):
+    results = []
+    for variant in MODEL_VARIANTS:
+        path = model_variant_path(args.model, variant)
+        if not os.path.exists(path):
+            continue
+        for threads in args.threads:
+            session = create_session(path, intra_op_threads=threads, graph_optimization=args.graph_optimization)
+            input_name = session.get_inputs()[0].name
+            for batch_size in args.batch_sizes:
+                batch = synthetic_batch(batch_size)
+                latencies = time_calls(lambda: session.run(None, {input_name: batch}), args.iterations, args.warmup)
+                entry = {"suite": "onnx", "variant": variant, "threads": threads, "batch_size": batch_size,
+                         **summarize(latencies, batch_size)}
+                results.append(entry)
+                print(f"   onnx {variant:<12} threads={threads:<2} batch={batch_size:<3} "
+                      f"p50={entry['p50_ms']:.2f} ms p99={entry['p99_ms']:.2f} ms "
+                      f"{entry['throughput_per_s']:.1f} ecg/s")
+    return results
+
+
+def bench_batcher(args):
+    """Concurrent callers, each submitting one record at a time, like Flask threads calling predict_ecg_onnx"""
+    results = []
+    pool = ORTSessionPool(args.model, size=args.pool_size, graph_optimization=args.graph_optimization)
+    input_name = pool.get_inputs()[0].name
+    batcher = ECGMicroBatcher(lambda batch: pool.run(None, {input_name: batch})[0],
+                              max_batch_size=max(args.batch_sizes), max_wait_ms=args.max_wait_ms,
+                              workers=args.pool_size)
+    signal = synthetic_batch(1)[0]
+    try:
+        for clients in args.clients:
+            latencies = []
+            lock = threading.Lock()
+
+            def client():
+                local = time_calls(lambda: batcher.submit(signal, timeout=60), args.iterations, 0)
+                with lock:
+                    latencies.extend(local)
+
+            time_calls(lambda: batcher.submit(signal, timeout=60), args.warmup, 0)
+            started = time.perf_counter()
+            workers = [threading.Thread(target=client) for _ in range(clients)]
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+            wall = time.perf_counter() - started
+
+            entry = {"suite": "batcher", "variant": "fp32", "clients": clients, "pool_size": args.pool_size,
+                     **summarize(latencies)}
+            entry["throughput_per_s"] = len(latencies) / wall
+            results.append(entry)
+            print(f"   batcher clients={clients:<3} p50={entry['p50_ms']:.2f} ms p99={entry['p99_ms']:.2f} ms "
+                  f"{entry['throughput_per_s']:.1f} ecg/s")
+    finally:
+        batcher.stop(5)
+    return results
+
+
+def bench_torch(args):
+    try:
+        import torch
+        from resnet import resnet34
+    except ImportError:
+        print("   torch not installed, skipping")
+        return []
+    if not os.path.exists(args.torch_model):
+        print(f"   {args.torch_model} not found, skipping")
+        return []
+
+    model = resnet34(input_channels=12, num_classes=9)
+    model.load_state_dict(torch.load(args.torch_model, map_location="cpu"))
+    model.eval()
+
+    results = []
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        for batch_size in args.batch_sizes:
+            batch = torch.from_numpy(synthetic_batch(batch_size))
+            with torch.no_grad():
+                latencies = time_calls(lambda: model(batch), args.iterations, args.warmup)
+            entry = {"suite": "torch", "variant": "fp32", "threads": threads, "batch_size": batch_size,
+                     **summarize(latencies, batch_size)}
+            results.append(entry)
+            print(f"   torch threads={threads:<2} batch={batch_size:<3} "
+                  f"p50={entry['p50_ms']:.2f} ms {entry['throughput_per_s']:.1f} ecg/s")
+    return results
+
+
+def _record_for_bench(args, workdir):
+    """Path of the .hea to parse: --record, or a synthetic 12-lead 30 s record"""
+    if args.record:
+        return args.record
+    t = np.arange(N_SAMPLES) / 500.0
+    sig = np.stack([0.5 * np.sin(2 * np.pi * (1 + 0.1 * i) * t) for i in range(N_LEADS)], axis=1)
+    wfdb.wrsamp("bench", fs=500, units=["mV"] * N_LEADS, sig_name=[f"L{i + 1}" for i in range(N_LEADS)],
+                p_signal=sig, fmt=["16"] * N_LEADS, write_dir=workdir)
+    return os.path.join(workdir, "bench.hea")
+
+
+def bench_rdrecord(args, hea_path, workdir):
+    # Work on a copy so the benchmark never writes a store next to a real record
+    local = os.path.join(workdir, "copy")
+    os.makedirs(local, exist_ok=True)
+    record = wfdb.rdrecord(os.path.splitext(hea_path)[0])
+    src_dir = os.path.dirname(os.path.abspath(hea_path))
+    for name in {os.path.basename(hea_path), *record.file_name}:
+        shutil.copy(os.path.join(src_dir, name), local)
+    local_hea = os.path.join(local, os.path.basename(hea_path))
+    record_path = os.path.splitext(local_hea)[0]
+    build_store(local_hea)
+
+    results = []
+    for name, fn in (
+        ("wfdb.rdrecord", lambda: wfdb.rdrecord(record_path)),
+        ("ecg_store.load_record", lambda: np.asarray(load_record(local_hea).p_signal[-1])),
+    ):
+        entry = {"suite": "rdrecord", "reader": name, **summarize(time_calls(fn, args.iterations, args.warmup))}
+        results.append(entry)
+        print(f"   {name:<22} p50={entry['p50_ms']:.3f} ms p99={entry['p99_ms']:.3f} ms")
+    return results
+
+
+def bench_waveform(args, hea_path):
+    """Serialization cost of the waveform endpoints for one record"""
+    record = wfdb.rdrecord(os.path.splitext(hea_path)[0])
+    sig_all = record.p_signal
+    nsteps, nleads = sig_all.shape
+    fs = float(record.fs)
+    lead_names = record.sig_name
+
+    def full_json():
+        # Same payload as /ecg_waveform_by_visit/<id> without ?max_points
+        return json.dumps({"success": True, "ecg_data": {
+            "time": np.linspace(0, nsteps / fs, nsteps).tolist(),
+            "signals": [sig_all[:, i].tolist() for i in range(nleads)],
+            "sampling_rate": fs,
+            "duration": nsteps / fs,
+            "lead_names": lead_names,
+            "n_leads": nleads,
+        }})
+
+    def decimated_json():
+        view = waveform_view(sig_all.T, fs, max_points=args.max_points)
+        return json.dumps({"time": (view["t0"] + np.arange(view["signals"].shape[1]) / view["fs"]).tolist(),
+                           "signals": view["signals"].tolist()})
+
+    results = []
+    for name, fn in (
+        ("json", full_json),
+        (f"json_max_points_{args.max_points}", decimated_json),
+        ("binary_float32", lambda: encode_waveform(sig_all.T, fs, lead_names)),
+        ("binary_int16", lambda: encode_waveform(sig_all.T, fs, lead_names, encoding="int16")),
+    ):
+        size = len(fn())
+        entry = {"suite": "waveform", "format": name, "bytes": size,
+                 **summarize(time_calls(fn, args.iterations, args.warmup))}
+        results.append(entry)
+        print(f"   waveform {name:<22} {size / 1024:8.1f} KB p50={entry['p50_ms']:.2f} ms")
+    return results
+
+
+# ----------------------------------------
+# Reporting
+# ----------------------------------------
+
+def _entry_key(entry):
+    return tuple((k, entry[k]) for k in ("suite", "variant", "threads", "batch_size", "clients", "reader", "format")
+                 if k in entry)
+
+
+def compare(previous_path, results, threshold=10.0):
+    with open(previous_path, "r", encoding="utf-8") as fh:
+        previous = {_entry_key(e): e for e in json.load(fh)["results"]}
+    print(f"\nChange in p50 vs {previous_path}:")
+    for entry in results:
+        old = previous.get(_entry_key(entry))
+        if not old or not old.get("p50_ms"):
+            continue
+        change = (entry["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100.0
+        label = " ".join(f"{k}={v}" for k, v in _entry_key(entry))
+        flag = "  <-- slower" if change > threshold else ""
+        print(f"   {label:<60} {old['p50_ms']:9.3f} -> {entry['p50_ms']:9.3f} ms ({change:+.1f}%){flag}")
+
+
+def environment(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "onnxruntime": ort.__version__,
+        "providers": ort.get_available_providers(),
+        "model": args.model,
+        "model_sha256": model_identity(args.model),
+        "iterations": args.iterations,
+        "warmup": args.warmup,
+    }
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def parse_args():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Benchmark ECG inference, parsing and waveform serialization")
+    parser.add_argument("--model", default="resnet34_model.onnx", help="FP32 ONNX model; variants are found next to it")
+    parser.add_argument("--torch-model", default="resnet34_model.pth")
+    parser.add_argument("--record", help=".hea file for the rdrecord/waveform suites (default: synthetic record)")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"comma list of {', '.join(SUITES)}")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--threads", type=_int_list, default=sorted({1, cpu_count}))
+    parser.add_argument("--clients", type=_int_list, default=[1, 4, 16], help="concurrent callers for the batcher suite")
+    parser.add_argument("--pool-size", type=int, default=1, help="ORT sessions for the batcher suite")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--graph-optimization", default="all")
+    parser.add_argument("--max-points", type=int, default=6000)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--output", default="ecg_benchmark.json")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=10.0,
+                        help="flag p50 increases above this percentage (default 10)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    results = []
+    workdir = tempfile.mkdtemp(prefix="ecg_bench_")
+    try:
+        hea_path = _record_for_bench(args, workdir)
+        for suite in suites:
+            print(f"\n[{suite}]")
+            if suite in ("onnx", "batcher") and not os.path.exists(args.model):
+                print(f"   ONNX model not found at {args.model}, skipping")
+            elif suite == "onnx":
+                results += bench_onnx(args)
+            elif suite == "batcher":
+                results += bench_batcher(args)
+            elif suite == "torch":
+                results += bench_torch(args)
+            elif suite == "rdrecord":
+                results += bench_rdrecord(args, hea_path, workdir)
+            elif suite == "waveform":
+                results += bench_waveform(args, hea_path)
+            else:
+                print(f"   unknown suite, expected one of {', '.join(SUITES)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump({"environment": environment(args), "results": results}, fh, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(args.compare, results, args.regression_threshold)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Per-keystroke latency of the medicament autocomplete (/search_medicaments).
+
+Replays typing: for a sample of registry names, every prefix of the brand
+name (nom_com) and of the molecule (nom_dci), up to --max-prefix characters,
+is searched the way the endpoint does, and the latency of each "keystroke"
+is recorded. Two searches are compared:
+  text_search   text_search.text_search (trigram/prefix indexes on PostgreSQL
+                after migrations/003_text_search.sql, ranked by similarity)
+  ilike         the previous unindexable ILIKE '%q%' filter on both columns
+
+    python benchmark_search.py --database-url postgresql://localhost/heartline
+    python benchmark_search.py --rows 50000            # synthetic registry in SQLite
+
+Without --database-url a synthetic registry of --rows medicaments is built in
+an in-memory SQLite database (no indexes; useful to compare code paths, not
+for absolute numbers). Results go to a JSON file.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import time
+from datetime import datetime
+
+import numpy as np
+from flask import Flask
+
+from models import db, Medicament
+from text_search import text_search
+
+PER_PAGE = 10
+MODES = ("text_search", "ilike")
+
+SYLLABLES = ["pa", "ra", "cé", "ta", "mol", "do", "li", "prane", "ef", "fer", "al", "gan", "ibu", "pro", "fène",
+             "amo", "xi", "cil", "line", "é", "stra", "diol", "œs", "tro", "gel", "clo", "pi", "dog", "rel", "zol"]
+
+
+def summarize(latencies_ms):
+    lat = np.asarray(latencies_ms, dtype=np.float64)
+    return {
+        "keystrokes": int(lat.size),
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p95_ms": float(np.percentile(lat, 95)),
+        "p99_ms": float(np.percentile(lat, 99)),
+        "mean_ms": float(lat.mean()),
+    }
+
+
+def search(mode, term):
+    """One page of results for ``term``, as /search_medicaments returns it"""
+    columns = [Medicament.nom_com, Medicament.nom_dci]
+    if mode == "text_search":
+        query = text_search(Medicament.query, columns, term)
+    else:
+        pattern = f"%{term}%"
+        query = Medicament.query.filter(db.or_(*[column.ilike(pattern) for column in columns]))
+    return query.order_by(Medicament.nom_com).limit(PER_PAGE + 1).all()
+
+
+def seed_registry(rows):
+    rng = random.Random(0)
+    db.create_all()
+    for start in range(0, rows, 5000):
+        db.session.add_all([
+            Medicament(
+                num_enr=f"{i:08d}",
+                nom_com="".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).upper(),
+                nom_dci="".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))),
+                dosage=str(rng.choice([5, 10, 100, 500, 1000])),
+                unite=rng.choice(["mg", "g", "ml"]),
+            )
+            for i in range(start, min(start + 5000, rows))
+        ])
+        db.session.commit()
+
+
+def keystrokes(names, max_prefix):
+    """Every prefix of every name, as typed"""
+    terms = []
+    for name in names:
+        typed = name.strip()[:max_prefix]
+        terms += [typed[:n] for n in range(1, len(typed) + 1)]
+    return terms
+
+
+def bench(mode, terms, warmup):
+    for term in terms[:warmup]:
+        search(mode, term)
+    by_length = {}
+    latencies = []
+    for term in terms:
+        started = time.perf_counter()
+        search(mode, term)
+        elapsed = (time.perf_counter() - started) * 1000.0
+        latencies.append(elapsed)
+        by_length.setdefault(min(len(term), 6), []).append(elapsed)
+    result = {"mode": mode, **summarize(latencies)}
+    result["by_prefix_length"] = {("6+" if n == 6 else str(n)): summarize(v) for n, v in sorted(by_length.items())}
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark medicament autocomplete latency per keystroke")
+    parser.add_argument("--database-url", default=os.getenv("SEARCH_BENCH_DATABASE_URL"),
+                        help="database holding the registry (default: synthetic in-memory SQLite)")
+    parser.add_argument("--rows", type=int, default=30000, help="synthetic registry size without --database-url")
+    parser.add_argument("--names", type=int, default=50, help="registry entries whose names are typed")
+    parser.add_argument("--max-prefix", type=int, default=8, help="characters typed per name")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma list of {', '.join(MODES)}")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--output", default="search_benchmark.json")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = args.database_url or "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    with app.app_context():
+        if not args.database_url:
+            print(f"Building a synthetic registry of {args.rows} medicaments in SQLite...")
+            seed_registry(args.rows)
+        total = Medicament.query.count()
+        sample = Medicament.query.order_by(db.func.random()).limit(args.names).all()
+        names = [m.nom_com for m in sample] + [m.nom_dci for m in sample]
+        terms = keystrokes(names, args.max_prefix)
+        print(f"{total} medicaments, {len(terms)} keystrokes from {len(names)} names")
+
+        results = []
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            entry = bench(mode, terms, args.warmup)
+            results.append(entry)
+            print(f"\n[{mode}] p50 {entry['p50_ms']:.2f} ms  p95 {entry['p95_ms']:.2f} ms  p99 {entry['p99_ms']:.2f} ms")
+            for length, stats in entry["by_prefix_length"].items():
+                print(f"   {length:>2} chars  p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms")
+
+        report = {
+            "environment": {
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "database": db.engine.dialect.name,
+                "medicaments": total,
+                "max_prefix": args.max_prefix,
+            },
+            "results": results,
+        }
+
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nResults written to {args.output}")
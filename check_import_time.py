@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Check that importing the web app stays fast: no heavy module (wfdb and the
+pandas it pulls in, onnxruntime, torch) is imported until it is used, and the
+whole import fits in a time budget.
+
+    python check_import_time.py                    # budget 1000 ms
+    python check_import_time.py --budget-ms 600 --top 20
+
+``import app`` runs in a fresh interpreter with ``-X importtime``; the
+cumulative time of each module is read from its stderr. Placeholder database
+settings are used when none are set (importing the app does not connect).
+Exits with status 1 if a forbidden module was imported or the budget is
+exceeded.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Loaded on first use (ecg_store.read_wfdb, ecg_sessions._ort, convert_to_onnx.py)
+FORBIDDEN = ("wfdb", "pandas", "onnxruntime", "torch")
+
+
+def import_times(module="app"):
+    """{module: cumulative µs} of ``import <module>`` in a fresh interpreter"""
+    env = dict(os.environ)
+    for name, value in (("DB_HOST", "localhost"), ("DB_PORT", "5432"), ("DB_USER", "heartline"),
+                        ("DB_PASSWORD", "-"), ("DB_NAME", "heartline")):
+        env.setdefault(name, value)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=HERE, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check the import time of the web app")
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="most milliseconds `import app` may take")
+    parser.add_argument("--top", type=int, default=10, help="slowest modules to print")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    times = import_times()
+    total_ms = times["app"] / 1000.0
+
+    print(f"import app: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, us in sorted(times.items(), key=lambda item: item[1], reverse=True)[1:args.top + 1]:
+        print(f"  {us / 1000.0:8.1f} ms  {name}")
+
+    failures = 0
+    for name in FORBIDDEN:
+        if name in times:
+            failures += 1
+            print(f"[FAIL] {name} imported at startup ({times[name] / 1000.0:.0f} ms)")
+    if total_ms > args.budget_ms:
+        failures += 1
+        print(f"[FAIL] import took {total_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    if not failures:
+        print("[ok] no heavy module imported, within budget")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Check that the JSON list endpoints (serializers.py) run a fixed number of
+SQL statements per page, whatever the page size: no lazy load or count
+per row.
+
+    python check_query_counts.py                       # synthetic data in SQLite
+    python check_query_counts.py --database-url postgresql://localhost/heartline_counts
+
+Each endpoint is called with a page of 1 row and a page of --per-page rows
+(first page, next page by cursor, page number, search) on a fresh session,
+so nothing is served from the identity map; the statements of the two sizes
+must be the same in number and within the endpoint's budget. Without
+--database-url the tables are created in an in-memory SQLite database and
+filled with synthetic rows. Exits with status 1 if any check fails.
+"""
+
+import argparse
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+
+from models import db, Appointment, Doctor, Medicament, Patient, Prescription, User, Visit, VisitDocument
+from serializers import appointment_list, doctor_list, patient_list, visit_list
+from sql_profiler import capture
+
+# Statements per call: the page SELECT, plus the total (estimate or count)
+PAGE_BUDGET = 2
+LIST_BUDGET = 1
+
+
+def seed(patients, doctors=5):
+    """Patients with visits, prescriptions, documents and appointments; doctors with user accounts"""
+    db.create_all()
+    db.session.add(Medicament(num_enr="M1", nom_com="DOLIPRANE", nom_dci="paracetamol", dosage="500", unite="mg"))
+    staff = []
+    for i in range(doctors):
+        doctor = Doctor(first_name=f"Doctor{i}", last_name=f"D{i}", specialty="Cardiology")
+        staff.append(doctor)
+        if i % 2 == 0:
+            db.session.add(User(username=f"doctor{i}", email=f"doctor{i}@example.org", password_hash="-",
+                                role="doctor", first_name=doctor.first_name, last_name=doctor.last_name,
+                                doctor=doctor))
+    db.session.add_all(staff)
+    db.session.flush()
+
+    now = datetime(2024, 6, 1, 9)
+    for i in range(patients):
+        patient = Patient(first_name=f"Patient{i}", last_name=f"P{i % 7}", date_of_birth=date(1950 + i % 50, 1, 1),
+                          gender="Female" if i % 2 else "Male")
+        db.session.add(patient)
+        db.session.flush()
+        for j in range(i % 4):
+            visit = Visit(patient_id=patient.id, doctor_id=staff[(i + j) % doctors].id,
+                          visit_date=now - timedelta(days=i + j), diagnosis=f"Diagnosis {i % 10}")
+            visit.prescriptions = [Prescription(medicament_num_enr="M1", dosage_instructions="1 per day", quantity=j + 1)
+                                   for _ in range(j)]
+            visit.documents = [VisitDocument(doc_type="blood", file_path=f"doc{i}_{j}.pdf")] if j % 2 else []
+            db.session.add(visit)
+        db.session.add(Appointment(date=now + timedelta(hours=i), reason="Consultation", patient_id=patient.id,
+                                   doctor_id=staff[i % doctors].id if i % 3 else None))
+    db.session.commit()
+
+
+def endpoint_calls(per_page):
+    """(name, budget, fn()) for every endpoint variant at page size ``per_page``"""
+    def paged(list_fn, next_page=False, **args):
+        def call():
+            query_args = MultiDict(dict(args, per_page=per_page))
+            if next_page:
+                page, _ = list_fn(query_args)
+                query_args["cursor"] = page.next_cursor or ""
+            return _counted(lambda: list_fn(query_args))
+        return call
+
+    calls = []
+    for name, list_fn, term in (("patients", patient_list, "patient1"),
+                                ("visits", visit_list, "diagnosis"),
+                                ("appointments", appointment_list, "consultation")):
+        calls += [
+            (f"{name} first page", PAGE_BUDGET, paged(list_fn)),
+            (f"{name} next page (cursor)", PAGE_BUDGET, paged(list_fn, next_page=True)),
+            (f"{name} page 2 (offset)", PAGE_BUDGET, paged(list_fn, page=2)),
+            (f"{name} search", PAGE_BUDGET, paged(list_fn, search=term)),
+        ]
+    calls.append(("doctors", LIST_BUDGET, lambda: _counted(doctor_list)))
+    return calls
+
+
+def _counted(fn):
+    """QueryLog of ``fn`` run on an empty session, and the number of JSON rows it returned"""
+    db.session.expunge_all()
+    with capture() as log:
+        result = fn()
+    rows = result[1] if isinstance(result, tuple) else result
+    return log, len(rows)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check the number of SQL statements per list page")
+    parser.add_argument("--database-url", default=os.getenv("QUERY_COUNT_DATABASE_URL"),
+                        help="database holding the data (default: synthetic in-memory SQLite)")
+    parser.add_argument("--patients", type=int, default=200, help="synthetic patients without --database-url")
+    parser.add_argument("--per-page", type=int, default=50)
+    parser.add_argument("--verbose", action="store_true", help="print the statements of failing checks")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = args.database_url or "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    failures = 0
+    with app.app_context():
+        if not args.database_url:
+            seed(args.patients)
+        small = endpoint_calls(1)
+        large = endpoint_calls(args.per_page)
+        for (name, budget, one_row), (_, _, many_rows) in zip(small, large):
+            log_one, _ = one_row()
+            log_many, rows = many_rows()
+            ok = log_one.count == log_many.count <= budget
+            failures += not ok
+            print(f"[{'ok' if ok else 'FAIL'}] {name}: {log_one.count} statements for 1 row, "
+                  f"{log_many.count} for {rows} rows (budget {budget})")
+            if not ok and args.verbose:
+                for statement, n in log_many.statements.most_common():
+                    print(f"      {n} x {statement[:200]}")
+
+    sys.exit(1 if failures else 0)
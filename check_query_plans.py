@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Check that the hot queries are served by indexes: runs EXPLAIN on each one
+against a PostgreSQL database and fails if a query reads its table with a
+sequential scan instead of one of the expected indexes.
+
+    createdb heartline_plans
+    python check_query_plans.py --database-url postgresql://localhost/heartline_plans --seed
+
+--seed creates the tables (with the indexes declared in models.py) in an
+empty database and fills them with synthetic rows, enough for the planner to
+prefer an index over scanning the table. Without --seed the checks run
+against whatever the database holds, e.g. a copy of production after
+migrations/002_hot_path_indexes.sql. Exits with status 1 if any check fails.
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import date, datetime
+
+from flask import Flask
+
+from models import db, Appointment, Patient, Prescription, Visit
+from table_engine import day_range
+
+INDEX_SCANS = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+SEED_SQL = """
+INSERT INTO doctor (first_name, last_name, specialty, created_at, updated_at)
+SELECT 'Doctor', 'D' || g, 'Cardiology', now(), now() FROM generate_series(1, 20) g;
+
+INSERT INTO patient (first_name, last_name, date_of_birth, gender, created_at, updated_at)
+SELECT 'Patient' || g, 'P' || (g % 997), date '1940-01-01' + (g % 25000),
+       (ARRAY['Male', 'Female', 'Other'])[1 + g % 3],
+       now() - (g % 1500) * interval '1 day', now()
+FROM generate_series(1, :patients) g;
+
+INSERT INTO appointment (date, reason, state, patient_id, doctor_id, created_at, updated_at)
+SELECT now() + (random() * 730 - 365) * interval '1 day', 'Consultation',
+       (ARRAY['scheduled', 'completed', 'canceled'])[1 + g % 3],
+       1 + g % :patients, 1 + g % 20, now(), now()
+FROM generate_series(1, :appointments) g;
+
+INSERT INTO visit (patient_id, doctor_id, visit_date, diagnosis, follow_up_date,
+                   payment_total, payment_status, payment_remaining, created_at, updated_at)
+SELECT 1 + g % :patients, 1 + g % 20, now() - random() * 1500 * interval '1 day',
+       CASE WHEN g % 4 = 0 THEN NULL ELSE 'Diagnosis ' || (g % 50) END,
+       CASE WHEN g % 5 = 0 THEN now() + (random() * 1500 - 1400) * interval '1 day' END,
+       100, 'paid', 0, now(), now()
+FROM generate_series(1, :visits) g;
+
+INSERT INTO medicament (num_enr, nom_com, nom_dci, dosage, unite)
+SELECT 'M' || g, 'Brand ' || g, 'Molecule ' || (g % 300), '10', 'mg' FROM generate_series(1, 2000) g;
+
+INSERT INTO prescription (visit_id, medicament_num_enr, dosage_instructions, quantity, created_at, updated_at)
+SELECT 1 + g % :visits, 'M' || (1 + g % 2000), '1 per day', 30, now(), now()
+FROM generate_series(1, :visits) g;
+"""
+
+
+def hot_queries(today, now):
+    """(name, table, indexes that may serve it, query) for each query checked"""
+    return [
+        ("today's scheduled appointments", "appointment", ["ix_appointment_state_date", "ix_appointment_date"],
+         Appointment.query.filter(Appointment.state == "scheduled", day_range(Appointment.date, today))
+         .order_by(Appointment.date).limit(10)),
+        ("patient queue", "appointment", ["ix_appointment_state_date", "ix_appointment_date"],
+         Appointment.query.filter(Appointment.state.in_(["scheduled", "in_progress"]), day_range(Appointment.date, today))
+         .order_by(Appointment.date)),
+        ("doctor's upcoming appointments", "appointment", ["ix_appointment_doctor_id", "ix_appointment_date"],
+         Appointment.query.filter(Appointment.doctor_id == 1, Appointment.date >= now)
+         .order_by(Appointment.date).limit(5)),
+        ("visits today", "visit", ["ix_visit_visit_date"],
+         Visit.query.filter(day_range(Visit.visit_date, today))),
+        ("doctor's visits today", "visit", ["ix_visit_doctor_id_visit_date", "ix_visit_visit_date"],
+         Visit.query.filter(Visit.doctor_id == 1, day_range(Visit.visit_date, today))),
+        ("recent visits of a patient", "visit", ["ix_visit_patient_id_visit_date"],
+         Visit.query.filter(Visit.patient_id == 42).order_by(Visit.visit_date.desc()).limit(5)),
+        ("visits chart, last 30 days", "visit", ["ix_visit_visit_date"],
+         Visit.query.with_entities(db.func.date_trunc("day", Visit.visit_date), db.func.count())
+         .filter(day_range(Visit.visit_date, today, days=30))
+         .group_by(db.func.date_trunc("day", Visit.visit_date))),
+        ("follow-ups due this week", "visit", ["ix_visit_follow_up_date"],
+         Visit.query.filter(day_range(Visit.follow_up_date, today, days=7))),
+        ("patients registered today", "patient", ["ix_patient_created_at"],
+         Patient.query.filter(day_range(Patient.created_at, today))),
+        ("prescriptions of a visit", "prescription", ["ix_prescription_visit_id"],
+         Prescription.query.filter(Prescription.visit_id == 42)),
+    ]
+
+
+def plan_nodes(plan):
+    """Every node of an EXPLAIN (FORMAT JSON) plan tree"""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(query):
+    compiled = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={"render_postcompile": True})
+    with db.engine.connect() as connection:
+        result = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]["Plan"]
+
+
+def check_plan(plan, table, indexes):
+    """Returns an error message, or None when ``table`` is only read through one of ``indexes``"""
+    scans = [node for node in plan_nodes(plan) if node.get("Relation Name") == table or
+             node.get("Node Type") == "Bitmap Index Scan"]
+    used = [node.get("Index Name") for node in scans if node.get("Node Type") in INDEX_SCANS]
+    sequential = [node for node in scans if node.get("Node Type") == "Seq Scan"]
+    if sequential:
+        return f"sequential scan on {table}"
+    if not any(name in indexes for name in used):
+        return f"uses {', '.join(filter(None, used)) or 'no index'}, expected one of {', '.join(indexes)}"
+    return None
+
+
+def seed(patients, visits, appointments):
+    db.create_all()
+    if db.session.query(Patient.id).first() is not None:
+        raise SystemExit("❌ The database already has patients; --seed needs an empty scratch database")
+    for statement in SEED_SQL.split(";"):
+        if statement.strip():
+            db.session.execute(db.text(statement),
+                               {"patients": patients, "visits": visits, "appointments": appointments})
+    db.session.commit()
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("ANALYZE")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Assert that the hot queries use index scans on PostgreSQL")
+    parser.add_argument("--database-url", default=os.getenv("PLAN_CHECK_DATABASE_URL"),
+                        help="PostgreSQL URL (default $PLAN_CHECK_DATABASE_URL)")
+    parser.add_argument("--seed", action="store_true", help="create the schema and synthetic rows first (empty database only)")
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--visits", type=int, default=200000)
+    parser.add_argument("--appointments", type=int, default=100000)
+    args = parser.parse_args()
+    if not args.database_url or not args.database_url.startswith("postgresql"):
+        parser.error("--database-url must point to a PostgreSQL database")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = args.database_url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    with app.app_context():
+        if args.seed:
+            print("Seeding synthetic data...")
+            seed(args.patients, args.visits, args.appointments)
+            print(f"✓ {args.patients} patients, {args.visits} visits, {args.appointments} appointments")
+
+        failures = 0
+        for name, table, indexes, query in hot_queries(date.today(), datetime.now()):
+            error = check_plan(explain(query), table, indexes)
+            if error:
+                failures += 1
+                print(f"✗ {name}: {error}")
+            else:
+                print(f"✓ {name}")
+
+    if failures:
+        print(f"❌ {failures} queries are not served by an index")
+        sys.exit(1)
+    print("✅ All hot queries use an index")
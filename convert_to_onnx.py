@@ -2,15 +2,38 @@
 """
 Convert PyTorch ResNet34 model to ONNX format for deployment.
 This script should be run once to convert your existing model.
+
+It can also publish INT8 variants of the exported model:
+
+    python convert_to_onnx.py --quantize all --calibration-dir path/to/wfdb_records
+
+Dynamic quantization stores INT8 weights and quantizes activations on the
+fly; static quantization also fixes activation ranges from the calibration
+records. The records are split into disjoint calibration and evaluation
+sets (--eval-fraction); each variant is scored against the FP32 model on
+the evaluation records only, never on the data it was calibrated on, and
+only published (resnet34_model.int8-dynamic.onnx / .int8-static.onnx)
+when no class probability moves by more than --tolerance. The app picks a
+variant with ECG_MODEL_VARIANT.
 """
 
-import torch
+import argparse
+import glob
+import json
 import numpy as np
-from resnet import resnet34
 import os
 
+from ecg_preprocessing import ECGPreprocessError, prepare_record
+from ecg_cache import model_identity
+from ecg_sessions import model_variant_path, variant_report_path
+
+CLASS_ABBRS = ["SNR", "AF", "IAVB", "LBBB", "RBBB", "PAC", "PVC", "STD", "STE"]
+
+
 def convert_model_to_onnx():
     """Convert the PyTorch model to ONNX format"""
+    import torch
+    from resnet import resnet34
     
     # Model paths
     pytorch_model_path = "resnet34_model.pth"
@@ -80,12 +103,258 @@ def convert_model_to_onnx():
         print(f"Error during conversion: {e}")
         return False
 
+
+# ----------------------------------------
+# INT8 quantization
+# ----------------------------------------
+
+def load_calibration_signals(folder, limit=None):
+    """
+    Read WFDB records (*.hea + signal file) from a folder and preprocess them
+    exactly like the app does. Records the model cannot take are skipped.
+    Returns a list of float32 [12, 15000] arrays.
+    """
+    import wfdb
+
+    signals = []
+    for hea_path in sorted(glob.glob(os.path.join(folder, "**", "*.hea"), recursive=True)):
+        if limit and len(signals) >= limit:
+            break
+        try:
+            record = wfdb.rdrecord(os.path.splitext(hea_path)[0])
+            signals.append(prepare_record(record))
+        except ECGPreprocessError as e:
+            print(f"   Skipping {hea_path}: {e.message}")
+        except Exception as e:
+            print(f"   Skipping {hea_path}: could not read record ({e})")
+    return signals
+
+
+def split_records(signals, eval_fraction=0.5, seed=0):
+    """
+    Split the records into disjoint (calibration, evaluation) lists, shuffled
+    with a fixed seed so reruns use the same split. Both keep at least one record.
+    """
+    if len(signals) < 2:
+        raise ValueError("at least 2 records are needed for separate calibration and evaluation sets")
+    order = np.random.default_rng(seed).permutation(len(signals))
+    n_eval = min(max(int(round(len(signals) * eval_fraction)), 1), len(signals) - 1)
+    evaluation = [signals[i] for i in sorted(order[:n_eval])]
+    calibration = [signals[i] for i in sorted(order[n_eval:])]
+    return calibration, evaluation
+
+
+def _calibration_reader(input_name, signals):
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class ECGCalibrationReader(CalibrationDataReader):
+        """Feeds calibration records to the static quantizer one at a time"""
+
+        def __init__(self):
+            self._iter = iter(signals)
+
+        def get_next(self):
+            signal = next(self._iter, None)
+            return None if signal is None else {input_name: signal[np.newaxis]}
+
+        def rewind(self):
+            self._iter = iter(signals)
+
+    return ECGCalibrationReader()
+
+
+def quantize_dynamic_model(fp32_path, output_path):
+    """INT8 weights, activations quantized at run time (no calibration needed)"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(fp32_path, output_path, weight_type=QuantType.QInt8)
+
+
+def quantize_static_model(fp32_path, output_path, signals, calibration_method="minmax"):
+    """
+    INT8 weights and activations (QDQ format, per-channel weights), with
+    activation ranges calibrated on ``signals``.
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    methods = {
+        "minmax": CalibrationMethod.MinMax,
+        "entropy": CalibrationMethod.Entropy,
+        "percentile": CalibrationMethod.Percentile,
+    }
+    # Shape inference + graph optimization first, as recommended for static quantization
+    prepared_path = output_path + ".prep.onnx"
+    quant_pre_process(fp32_path, prepared_path, skip_symbolic_shape=True)
+    try:
+        input_name = ort.InferenceSession(prepared_path).get_inputs()[0].name
+        quantize_static(
+            prepared_path,
+            output_path,
+            _calibration_reader(input_name, signals),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=methods[calibration_method],
+        )
+    finally:
+        if os.path.exists(prepared_path):
+            os.remove(prepared_path)
+
+
+def _predict_probs(model_path, signals, batch_size=8):
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(model_path)
+    input_name = session.get_inputs()[0].name
+    probs = []
+    for start in range(0, len(signals), batch_size):
+        batch = np.stack(signals[start:start + batch_size]).astype(np.float32)
+        logits = session.run(None, {input_name: batch})[0]
+        probs.append(1 / (1 + np.exp(-logits)))
+    return np.concatenate(probs, axis=0)
+
+
+def compare_probabilities(fp32_path, candidate_path, signals):
+    """
+    Per-class probability deltas of a candidate model against FP32 on the same records.
+    Returns {"per_class": {abbr: {"max": .., "mean": ..}}, "max": .., "records": N}.
+    """
+    reference = _predict_probs(fp32_path, signals)
+    candidate = _predict_probs(candidate_path, signals)
+    deltas = np.abs(reference - candidate)
+    return {
+        "records": int(deltas.shape[0]),
+        "max": float(deltas.max()),
+        "per_class": {
+            abbr: {"max": float(deltas[:, i].max()), "mean": float(deltas[:, i].mean())}
+            for i, abbr in enumerate(CLASS_ABBRS)
+        },
+    }
+
+
+def publish_quantized_variant(variant, fp32_path, calibration, evaluation, tolerance, calibration_method="minmax"):
+    """
+    Build one INT8 variant (static: calibrated on ``calibration``), gate it on
+    per-class probability deltas over ``evaluation`` and only move it into
+    place when every class stays within ``tolerance``. A JSON report is
+    written next to the model either way.
+    """
+    output_path = model_variant_path(fp32_path, variant)
+    candidate_path = output_path + ".candidate"
+    report_path = variant_report_path(output_path)
+
+    print(f"\nQuantizing ({variant})...")
+    try:
+        if variant == "int8-dynamic":
+            quantize_dynamic_model(fp32_path, candidate_path)
+        else:
+            quantize_static_model(fp32_path, candidate_path, calibration, calibration_method)
+
+        comparison = compare_probabilities(fp32_path, candidate_path, evaluation)
+        failing = [abbr for abbr, d in comparison["per_class"].items() if d["max"] > tolerance]
+        report = {
+            "variant": variant,
+            "source_model": os.path.abspath(fp32_path),
+            "source_model_sha256": model_identity(fp32_path),
+            "tolerance": tolerance,
+            "calibration_method": calibration_method if variant == "int8-static" else None,
+            "calibration_records": len(calibration) if variant == "int8-static" else 0,
+            "evaluation_records": len(evaluation),
+            "fp32_size_bytes": os.path.getsize(fp32_path),
+            "size_bytes": os.path.getsize(candidate_path),
+            "published": not failing,
+            "failing_classes": failing,
+            **comparison,
+        }
+        for abbr, d in comparison["per_class"].items():
+            mark = "❌" if abbr in failing else "✅"
+            print(f"   {mark} {abbr}: max Δ {d['max']:.4f}, mean Δ {d['mean']:.4f}")
+
+        if failing:
+            os.remove(candidate_path)
+            print(f"❌ {variant} not published: {', '.join(failing)} exceed tolerance {tolerance}")
+        else:
+            os.replace(candidate_path, output_path)
+            print(f"✅ {variant} published to {output_path} "
+                  f"({report['size_bytes'] / 1e6:.1f} MB vs {report['fp32_size_bytes'] / 1e6:.1f} MB FP32)")
+
+        with open(report_path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        return not failing
+
+    except Exception as e:
+        print(f"Error during {variant} quantization: {e}")
+        if os.path.exists(candidate_path):
+            os.remove(candidate_path)
+        return False
+
+
+def quantize_models(fp32_path, calibration_dir, variants, tolerance, max_records=None, calibration_method="minmax",
+                    eval_fraction=0.5):
+    if not os.path.exists(fp32_path):
+        print(f"Error: ONNX model not found at {fp32_path}. Run the FP32 conversion first.")
+        return False
+
+    print(f"Loading calibration records from {calibration_dir}...")
+    signals = load_calibration_signals(calibration_dir, limit=max_records)
+    if not signals:
+        print("Error: no usable WFDB records found for calibration/evaluation")
+        return False
+    try:
+        calibration, evaluation = split_records(signals, eval_fraction)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return False
+    print(f"   {len(signals)} records: {len(calibration)} for calibration, {len(evaluation)} for evaluation")
+
+    results = [publish_quantized_variant(v, fp32_path, calibration, evaluation, tolerance, calibration_method)
+               for v in variants]
+    return all(results)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the ECG ResNet34 model to ONNX and publish INT8 variants")
+    parser.add_argument("--skip-export", action="store_true",
+                        help="reuse the existing resnet34_model.onnx instead of exporting from PyTorch")
+    parser.add_argument("--quantize", choices=["none", "dynamic", "static", "all"], default="none")
+    parser.add_argument("--calibration-dir", help="folder of WFDB records used for calibration and the accuracy gate")
+    parser.add_argument("--max-records", type=int, default=200, help="cap on calibration records (default 200)")
+    parser.add_argument("--eval-fraction", type=float, default=0.5,
+                        help="share of the records held out for the accuracy gate, never used to calibrate (default 0.5)")
+    parser.add_argument("--calibration-method", choices=["minmax", "entropy", "percentile"], default="minmax")
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="max allowed absolute probability change per class vs FP32 (default 0.02)")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    success = convert_model_to_onnx()
+    args = parse_args()
+    success = True
+    if not args.skip_export:
+        success = convert_model_to_onnx()
+
+    if success and args.quantize != "none":
+        if not args.calibration_dir:
+            print("Error: --calibration-dir is required for quantization")
+            success = False
+        else:
+            variants = {
+                "dynamic": ["int8-dynamic"],
+                "static": ["int8-static"],
+                "all": ["int8-dynamic", "int8-static"],
+            }[args.quantize]
+            success = quantize_models("resnet34_model.onnx", args.calibration_dir, variants,
+                                      args.tolerance, args.max_records, args.calibration_method, args.eval_fraction)
+
     if success:
         print("\nNext steps:")
         print("1. Install onnxruntime: pip install onnxruntime")
         print("2. Update your app.py to use the ONNX model")
         print("3. Remove torch from requirements.txt")
+        if args.quantize != "none":
+            print("4. Set ECG_MODEL_VARIANT=int8-static (or int8-dynamic) to serve a published INT8 model")
     else:
-        print("Conversion failed. Please check the error messages above.")
\ No newline at end of file
+        print("Conversion failed. Please check the error messages above.")
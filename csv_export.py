@@ -0,0 +1,74 @@
+"""
+Streaming CSV responses for the export endpoints.
+
+Rows are written to the client in small chunks while the query is still
+being read (use ``Query.yield_per`` so PostgreSQL streams them from a
+server-side cursor), so memory stays flat however many rows are exported
+and the header reaches the client before the query has finished.
+"""
+
+import csv
+import io
+import zlib
+
+from flask import Response, stream_with_context
+
+ROWS_PER_CHUNK = 500
+
+
+def csv_chunks(header, rows, rows_per_chunk=ROWS_PER_CHUNK):
+    """Yield CSV text: the header line first, then ``rows_per_chunk`` rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of text chunks into one gzip member, chunk by chunk"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_response(header, rows, filename, compress=False):
+    """
+    Streaming attachment response for ``rows`` (any iterable of sequences,
+    consumed lazily inside the request context).
+
+    Args:
+        header: column titles
+        rows: iterable of row sequences
+        filename: download name without extension
+        compress: send a .csv.gz file instead of plain CSV
+    """
+    chunks = csv_chunks(header, rows)
+    if compress:
+        body, mimetype, filename = gzip_chunks(chunks), "application/gzip", f"{filename}.csv.gz"
+    else:
+        body, mimetype, filename = (c.encode("utf-8") for c in chunks), "text/csv", f"{filename}.csv"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "X-Accel-Buffering": "no",  # let reverse proxies pass chunks through as they come
+        },
+    )
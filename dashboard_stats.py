@@ -0,0 +1,150 @@
+"""
+Dashboard counters in one round trip, with a short-TTL cache.
+
+``compute_dashboard_stats`` gathers every counter the dashboards show
+(patients, visits, appointments, today's and this week's activity) with
+conditional aggregation - ``COUNT(*) FILTER (WHERE ...)`` - over one
+aggregate subquery per table, joined into a single SELECT. All time windows
+are half-open timestamp ranges, so indexes on the timestamp columns apply.
+
+``DashboardStatsCache`` keeps the result per (role, doctor) for a few
+seconds; ``invalidate_on_writes`` clears it whenever a flush touches a
+Patient, Visit or Appointment, so a new visit shows up on the next refresh.
+The cache is per process: other workers catch up within the TTL.
+"""
+
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Appointment, Patient, Visit
+from table_engine import day_range
+
+
+def _count(condition=None):
+    return db.func.count() if condition is None else db.func.count().filter(condition)
+
+
+def _has_text(column):
+    return db.and_(column.isnot(None), column != "")
+
+
+def compute_dashboard_stats(doctor_id=None, today=None):
+    """
+    All dashboard counters as a dict, from one SELECT.
+
+    Args:
+        doctor_id: also count this doctor's own visits and appointments
+        today: date the "today"/"this week" windows are relative to
+    """
+    today = today or date.today()
+    day_start = datetime.combine(today, datetime.min.time())
+    week_start = day_start - timedelta(days=7)
+    now = datetime.now()
+
+    def today_range(column):
+        return day_range(column, today)
+
+    patient_columns = [
+        _count().label("total_patients"),
+        _count(today_range(Patient.created_at)).label("new_patients_today"),
+        _count(Patient.created_at >= week_start).label("new_patients_week"),
+    ]
+    visit_columns = [
+        _count().label("total_visits"),
+        _count(today_range(Visit.visit_date)).label("today_visits"),
+        _count(db.and_(Visit.visit_date >= week_start, Visit.ecg_mat.isnot(None))).label("ecg_tests_week"),
+        _count(db.not_(_has_text(Visit.diagnosis))).label("pending_reports"),
+        _count(db.and_(today_range(Visit.visit_date), _has_text(Visit.diagnosis))).label("completed_today"),
+        _count(day_range(Visit.follow_up_date, today, days=7)).label("follow_ups"),
+    ]
+    appointment_columns = [
+        _count().label("total_appointments"),
+        _count(db.and_(today_range(Appointment.date), Appointment.state == "scheduled")).label("today_appointments"),
+    ]
+    if doctor_id is not None:
+        visit_columns.append(
+            _count(db.and_(Visit.doctor_id == doctor_id, today_range(Visit.visit_date))).label("doctor_today_visits"))
+        appointment_columns.append(
+            _count(db.and_(Appointment.doctor_id == doctor_id, Appointment.date >= now,
+                           Appointment.state == "scheduled")).label("doctor_upcoming_appointments"))
+
+    patients = db.session.query(*patient_columns).select_from(Patient).subquery()
+    visits = db.session.query(*visit_columns).select_from(Visit).subquery()
+    appointments = db.session.query(*appointment_columns).select_from(Appointment).subquery()
+
+    # Each subquery is a single row; join them side by side
+    row = (
+        db.session.query(patients, visits, appointments)
+        .select_from(patients)
+        .join(visits, db.true())
+        .join(appointments, db.true())
+        .one()
+    )
+    return {key: int(value or 0) for key, value in row._mapping.items()}
+
+
+class DashboardStatsCache:
+    """
+    Dashboard counters cached per key (role, doctor_id) for ``ttl`` seconds.
+
+    Args:
+        ttl: seconds an entry stays fresh; 0 disables caching
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = float(ttl)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, compute):
+        """Cached value for key, or compute() stored under it"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return dict(entry[1])
+            self.misses += 1
+        value = compute()
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+        return dict(value)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+WATCHED_MODELS = (Patient, Visit, Appointment)
+
+
+def invalidate_on_writes(cache, models=WATCHED_MODELS):
+    """Clear ``cache`` after any session flush that inserts, updates or deletes one of ``models``"""
+
+    @event.listens_for(Session, "after_flush")
+    def _after_flush(session, flush_context):
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(obj, models):
+                cache.invalidate()
+                return
+
+    return _after_flush
@@ -0,0 +1,166 @@
+"""
+Request-coalescing micro-batcher for ECG inference.
+
+Concurrent callers submit single [12, 15000] signals. A background thread
+collects them for at most ``max_wait_ms`` (or until ``max_batch_size`` is
+reached), runs one batched ONNX Runtime call and hands each caller back its
+own row of logits. The exported model has a dynamic ``batch_size`` axis, so
+one [N, 12, 15000] run is much cheaper than N single runs under load. With
+a pool of ORT sessions, ``workers`` batching threads run batches side by side.
+"""
+
+import queue
+import threading
+import time
+
+from ecg_preprocessing import ECGBufferPool
+from metrics import Histogram
+
+
+class _PendingRequest:
+    __slots__ = ("signal", "enqueued_at", "done", "result", "error")
+
+    def __init__(self, signal):
+        self.signal = signal
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ECGMicroBatcher:
+    """
+    Coalesce concurrent single-record inference calls into batched runs.
+
+    Args:
+        run_batch: callable taking a float32 array [N, 12, 15000] and
+            returning logits of shape [N, num_classes]
+        max_batch_size: upper bound on N for one run
+        max_wait_ms: how long the first queued request may wait for company
+        workers: batching threads, i.e. batches in flight at once (match the
+            ORT session pool size)
+    """
+
+    BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+    QUEUE_WAIT_MS_BUCKETS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=5.0, workers=1):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.run_batch = run_batch
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = max(float(max_wait_ms), 0.0) / 1000.0
+        self.workers = max(int(workers), 1)
+
+        self.buffer_pool = ECGBufferPool(self.max_batch_size, max_free=max(4, self.workers))
+
+        self.batch_size_histogram = Histogram(self.BATCH_SIZE_BUCKETS)
+        self.queue_wait_histogram = Histogram(self.QUEUE_WAIT_MS_BUCKETS)
+        self.batches_run = 0
+        self.batches_failed = 0
+
+        self._queue = queue.Queue()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stopping = False
+
+    def start(self):
+        """Start the batching threads (idempotent)"""
+        with self._start_lock:
+            if self._threads and all(t.is_alive() for t in self._threads):
+                return
+            self._stopping = False
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                t = threading.Thread(target=self._loop, name=f"ecg-batcher-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout=None):
+        """Stop the batching threads after draining queued requests"""
+        self._stopping = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def submit(self, signal, timeout=None):
+        """
+        Queue one [12, 15000] signal and block until its logits are ready.
+
+        Raises whatever the batched run raised, or TimeoutError.
+        """
+        self.start()
+        pending = _PendingRequest(signal)
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("ECG inference timed out waiting for a batch slot")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def stats(self):
+        """Batch-size and queue-wait histograms plus run counters"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "batches_run": self.batches_run,
+            "batches_failed": self.batches_failed,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_wait_ms": self.queue_wait_histogram.snapshot(),
+        }
+
+    # ------------------------------------------------------------------
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown sentinel: finish this batch, let the loop exit afterwards
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                if self._stopping:
+                    return
+                continue
+            batch = self._collect(first)
+            self._run(batch)
+
+    def _run(self, batch):
+        started = time.perf_counter()
+        for pending in batch:
+            self.queue_wait_histogram.observe((started - pending.enqueued_at) * 1000.0)
+        self.batch_size_histogram.observe(len(batch))
+
+        try:
+            # Copy each prepared [12, 15000] signal straight into a pooled,
+            # C-contiguous batch buffer (no np.stack allocation per run)
+            with self.buffer_pool.batch(len(batch)) as inputs:
+                for i, pending in enumerate(batch):
+                    inputs[i] = pending.signal
+                logits = self.run_batch(inputs)
+            self.batches_run += 1
+            for i, pending in enumerate(batch):
+                pending.result = logits[i]
+        except Exception as e:
+            self.batches_failed += 1
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
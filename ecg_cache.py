@@ -0,0 +1,204 @@
+"""
+Content-addressed cache for ECG inference results.
+
+Keys are SHA-256 digests of the model identity plus the raw .hea and .mat
+bytes, so the same record re-uploaded under any filename (or attached to a
+different visit) hits the cache, while a new model version never serves
+stale probabilities. Results live in an in-memory LRU backed by one small
+JSON file per key on disk, which survives restarts and is shared between
+worker processes. The disk tier is capped: every ``prune_every`` writes the
+files beyond ``max_disk_entries`` are removed, least recently used (by
+mtime, refreshed on each disk hit) first.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def _update_from_file(digest, path):
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+
+def model_identity(model_path):
+    """SHA-256 of the model file; None when the file does not exist"""
+    if not model_path or not os.path.exists(model_path):
+        return None
+    digest = hashlib.sha256()
+    _update_from_file(digest, model_path)
+    return digest.hexdigest()
+
+
+def record_key(mat_path, hea_path, model_id):
+    """Cache key for one WFDB record scored by one model"""
+    digest = hashlib.sha256()
+    digest.update(f"model:{model_id}\n".encode())
+    for label, path in (("hea", hea_path), ("mat", mat_path)):
+        digest.update(f"{label}:{os.path.getsize(path)}\n".encode())
+        _update_from_file(digest, path)
+    return digest.hexdigest()
+
+
+class ECGResultCache:
+    """
+    Two-tier (memory LRU + disk) store of probability dicts keyed by record_key.
+
+    Args:
+        max_entries: in-memory LRU capacity
+        cache_dir: directory for the on-disk tier; None keeps it memory-only
+        max_disk_entries: files kept in the on-disk tier (0 = unbounded)
+        prune_every: disk writes between two prunes of the on-disk tier
+    """
+
+    # Temporary files older than this are left over from a crashed writer
+    STALE_TMP_SECONDS = 3600
+
+    def __init__(self, max_entries=1024, cache_dir=None, max_disk_entries=20000, prune_every=100):
+        self.max_entries = int(max_entries)
+        self.cache_dir = cache_dir
+        self.max_disk_entries = int(max_disk_entries)
+        self.prune_every = max(int(prune_every), 1)
+        self._writes_since_prune = self.prune_every  # prune on the first write of the process
+        self._prune_lock = threading.Lock()
+        self.disk_pruned = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Return the cached probability dict for key, or None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(self._entries[key])
+
+        probs = self._read_disk(key)
+        with self._lock:
+            if probs is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, probs)
+        return dict(probs)
+
+    def put(self, key, probs):
+        """Store a probability dict in both tiers"""
+        probs = {abbr: float(p) for abbr, p in probs.items()}
+        with self._lock:
+            self._remember(key, probs)
+        self._write_disk(key, probs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "disk_pruned": self.disk_pruned,
+            }
+
+    # ------------------------------------------------------------------
+
+    def _remember(self, key, probs):
+        self._entries[key] = probs
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                probs = json.load(fh)["probabilities"]
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(path)  # recently used: pruned last
+        except OSError:
+            pass
+        return probs
+
+    def _write_disk(self, key, probs):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write-then-rename so concurrent readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                    json.dump({"probabilities": probs}, fh)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        except (OSError, TypeError, ValueError):
+            # The disk tier is best-effort; the in-memory entry is already stored
+            return
+        self._maybe_prune()
+
+    def _maybe_prune(self):
+        if not self.max_disk_entries:
+            return
+        with self._lock:
+            self._writes_since_prune += 1
+            if self._writes_since_prune < self.prune_every:
+                return
+            self._writes_since_prune = 0
+        # One pruning thread at a time; others just go on
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            self.disk_pruned += self.prune_disk()
+        finally:
+            self._prune_lock.release()
+
+    def prune_disk(self):
+        """Remove the least recently used files beyond max_disk_entries (and stale temp files); returns the count"""
+        files = []
+        removed = 0
+        now = time.time()
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    mtime = os.stat(path).st_mtime
+                    if name.endswith(".tmp"):
+                        if now - mtime > self.STALE_TMP_SECONDS:
+                            os.remove(path)
+                            removed += 1
+                    elif name.endswith(".json"):
+                        files.append((mtime, path))
+                except OSError:
+                    continue  # removed meanwhile by another process
+        if len(files) > self.max_disk_entries:
+            files.sort()
+            for _, path in files[:len(files) - self.max_disk_entries]:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
@@ -0,0 +1,254 @@
+"""
+Background ECG analysis jobs.
+
+Visit forms enqueue an ECGAnalysisJob row instead of running wfdb + ONNX
+inference inside the POST. A small pool of worker threads claims queued
+jobs from the database, runs the analysis, writes Visit.ecg_prediction and
+records the outcome. Because the queue lives in the SQLAlchemy database,
+jobs survive a restart: anything still "queued" is picked up again, and a
+"running" job whose worker died is reclaimed once its lock goes stale, or
+dead-lettered as abandoned when it has no attempt left. A worker only
+records its outcome while its claim still holds the job, and a result is
+only written to the visit if no newer job was queued for it meanwhile
+(otherwise the job ends "superseded").
+"""
+
+import os
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from ecg_preprocessing import ECGPreprocessError
+from models import db, ECGAnalysisJob, Visit
+
+
+class PermanentJobError(Exception):
+    """A failure retrying cannot fix (missing visit or files); goes straight to dead letter"""
+
+
+def enqueue_ecg_analysis(visit_id, max_attempts=3):
+    """Create a queued analysis job for a visit (caller commits)"""
+    job = ECGAnalysisJob(visit_id=visit_id, status="queued", max_attempts=max_attempts,
+                         available_at=datetime.utcnow())
+    db.session.add(job)
+    return job
+
+
+class ECGJobRunner:
+    """
+    Worker pool that drains the ecg_analysis_job table.
+
+    Args:
+        app: Flask app (workers push their own app context)
+        analyze: callable(visit) -> probabilities dict; raising marks the attempt failed
+        workers: number of worker threads
+        poll_interval: seconds between polls when the queue is empty
+        retry_backoff: base delay in seconds, doubled after each failed attempt
+        stale_after: seconds after which a "running" job is considered abandoned
+    """
+
+    def __init__(self, app, analyze, workers=2, poll_interval=2.0, retry_backoff=10.0, stale_after=600.0):
+        self.app = app
+        self.analyze = analyze
+        self.workers = int(workers)
+        self.poll_interval = float(poll_interval)
+        self.retry_backoff = float(retry_backoff)
+        self.stale_after = float(stale_after)
+
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        """Start worker threads once per process (safe to call on every request)"""
+        if self._pid == os.getpid() and self._threads:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = []
+            for i in range(self.workers):
+                t = threading.Thread(target=self._loop, name=f"ecg-job-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Wake idle workers after a job was enqueued"""
+        self._wakeup.set()
+
+    # ------------------------------------------------------------------
+
+    def _worker_id(self):
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+    def _claim(self):
+        """Atomically move the next due job to "running"; returns (id, locked_at) or None"""
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=self.stale_after)
+        self._abandon_exhausted(now, stale_before)
+        job = (
+            ECGAnalysisJob.query
+            .filter(db.or_(
+                db.and_(ECGAnalysisJob.status == "queued", ECGAnalysisJob.available_at <= now),
+                db.and_(ECGAnalysisJob.status == "running", ECGAnalysisJob.locked_at < stale_before,
+                        ECGAnalysisJob.attempts < ECGAnalysisJob.max_attempts),
+            ))
+            .order_by(ECGAnalysisJob.available_at, ECGAnalysisJob.id)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if job is None:
+            db.session.rollback()
+            return None
+        # Compare-and-set on (status, attempts) so backends without SKIP LOCKED
+        # (SQLite in local dev) still never hand one job to two workers
+        claimed = (
+            ECGAnalysisJob.query
+            .filter_by(id=job.id, status=job.status, attempts=job.attempts)
+            .update({
+                "status": "running",
+                "attempts": job.attempts + 1,
+                "locked_at": now,
+                "locked_by": self._worker_id(),
+            }, synchronize_session=False)
+        )
+        db.session.commit()
+        return (job.id, now) if claimed == 1 else None
+
+    def _abandon_exhausted(self, now, stale_before):
+        """
+        Dead-letter stale "running" jobs with no attempt left: their worker died
+        (OOM, killed on timeout) on every attempt, so reclaiming them would
+        retry forever.
+        """
+        abandoned = (
+            ECGAnalysisJob.query
+            .filter(ECGAnalysisJob.status == "running", ECGAnalysisJob.locked_at < stale_before,
+                    ECGAnalysisJob.attempts >= ECGAnalysisJob.max_attempts)
+            .update({
+                "status": "dead",
+                "last_error": f"Abandoned: no result {self.stale_after:.0f}s after the last attempt started",
+                "locked_at": None,
+                "finished_at": now,
+            }, synchronize_session=False)
+        )
+        if abandoned:
+            db.session.commit()
+            self.app.logger.error(f"{abandoned} ECG job(s) abandoned by their worker moved to dead letter")
+
+    def _run_job(self, job_id, locked_at):
+        job = db.session.get(ECGAnalysisJob, job_id)
+        visit = db.session.get(Visit, job.visit_id)
+        if self._has_newer_job(job):
+            self._finish(job_id, locked_at, job.visit_id, None, None)
+            return
+        try:
+            if visit is None:
+                raise PermanentJobError(f"Visit {job.visit_id} no longer exists")
+            if not visit.ecg_mat or not visit.ecg_hea:
+                raise PermanentJobError("Visit has no ECG files attached")
+            ecg_files = (visit.ecg_mat, visit.ecg_hea)
+            prob_dict = self.analyze(visit)
+        except Exception as e:
+            db.session.rollback()
+            self._fail(job_id, locked_at, e, permanent=isinstance(e, (PermanentJobError, ECGPreprocessError, FileNotFoundError)))
+            return
+        self._finish(job_id, locked_at, visit.id, ecg_files, prob_dict)
+
+    @staticmethod
+    def _has_newer_job(job):
+        """Whether the visit was queued for analysis again after ``job`` (its ECG replaced or re-analyzed)"""
+        return db.session.query(
+            ECGAnalysisJob.query.filter(ECGAnalysisJob.visit_id == job.visit_id, ECGAnalysisJob.id > job.id).exists()
+        ).scalar()
+
+    def _owned(self, job_id, locked_at):
+        """The job row, locked, if this claim still holds it (not reclaimed as stale by another worker)"""
+        job = (
+            ECGAnalysisJob.query
+            .filter_by(id=job_id, status="running", locked_at=locked_at)
+            .with_for_update()
+            .populate_existing()
+            .first()
+        )
+        if job is None:
+            db.session.rollback()
+            self.app.logger.warning(f"ECG job {job_id} was reclaimed by another worker; this attempt's outcome is discarded")
+        return job
+
+    def _finish(self, job_id, locked_at, visit_id, ecg_files, prob_dict):
+        """
+        Record the result only while this claim holds the job, and write it to
+        the visit only if it is still the latest: a newer job for the visit, or
+        ECG files replaced since the analysis started, supersede it.
+        """
+        job = self._owned(job_id, locked_at)
+        if job is None:
+            return
+        visit = db.session.get(Visit, visit_id, with_for_update=True, populate_existing=True)
+        current = (
+            prob_dict is not None
+            and visit is not None
+            and (visit.ecg_mat, visit.ecg_hea) == ecg_files
+            and not self._has_newer_job(job)
+        )
+        job.locked_at = None
+        job.finished_at = datetime.utcnow()
+        if current:
+            visit.ecg_prediction = prob_dict
+            job.status = "succeeded"
+            job.result = prob_dict
+            job.last_error = None
+        else:
+            # Kept for inspection; the newer analysis owns the visit's prediction
+            job.status = "superseded"
+            job.last_error = "Superseded: the visit's ECG was replaced or queued for analysis again"
+            self.app.logger.info(f"ECG job {job.id} for visit {job.visit_id} superseded")
+        db.session.commit()
+
+    def _fail(self, job_id, locked_at, error, permanent=False):
+        job = self._owned(job_id, locked_at)
+        if job is None:
+            return
+        job.last_error = f"{type(error).__name__}: {error}"
+        job.locked_at = None
+        if permanent or job.attempts >= job.max_attempts:
+            # Dead letter: kept for inspection, never retried automatically
+            job.status = "dead"
+            job.finished_at = datetime.utcnow()
+            self.app.logger.error(f"ECG job {job.id} for visit {job.visit_id} moved to dead letter: {job.last_error}")
+        else:
+            job.status = "queued"
+            delay = self.retry_backoff * (2 ** (job.attempts - 1))
+            job.available_at = datetime.utcnow() + timedelta(seconds=delay)
+            self.app.logger.warning(f"ECG job {job.id} attempt {job.attempts} failed, retrying in {delay:.0f}s: {job.last_error}")
+        db.session.commit()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            claim = None
+            with self.app.app_context():
+                try:
+                    claim = self._claim()
+                    if claim is not None:
+                        self._run_job(*claim)
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.error(f"ECG job worker error:\n{traceback.format_exc()}")
+                finally:
+                    db.session.remove()
+            if claim is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
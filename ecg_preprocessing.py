@@ -0,0 +1,182 @@
+"""
+Shared ECG preprocessing for the ResNet34 model.
+
+The model takes float32 input of shape [N, 12, 15000]: twelve leads, the last
+15000 samples of each record (30 s at 500 Hz), left-padded with zeros when the
+record is shorter. WFDB hands us ``p_signal`` as [n_samples, n_leads], so
+every record is written transposed, straight into a C-contiguous batch buffer,
+instead of allocating a padded copy and passing ORT a transposed view that it
+would copy again.
+"""
+
+import threading
+
+import numpy as np
+
+N_LEADS = 12
+N_SAMPLES = 15000
+EXPECTED_FS = 500
+
+
+class ECGPreprocessError(ValueError):
+    """
+    A record that cannot be fed to the model.
+
+    ``code`` is a stable machine-readable identifier ("lead_count_mismatch",
+    "sample_rate_mismatch", "empty_signal", "invalid_shape"), ``details``
+    carries the offending values so API responses can report them.
+    """
+
+    def __init__(self, code, message, **details):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.details = details
+
+    def to_dict(self):
+        return {"success": False, "error": self.message, "error_code": self.code, "details": self.details}
+
+
+def validate_signal(sig_all, fs=None, n_leads=N_LEADS, expected_fs=EXPECTED_FS):
+    """
+    Check a raw [n_samples, n_leads] signal against what the model expects.
+
+    Raises ECGPreprocessError; returns the signal unchanged on success.
+    """
+    if sig_all is None or getattr(sig_all, "ndim", 0) != 2:
+        raise ECGPreprocessError(
+            "invalid_shape",
+            "ECG signal must be a 2-D [samples, leads] array",
+            shape=list(getattr(sig_all, "shape", ())),
+        )
+    nsteps, nleads = sig_all.shape
+    if nsteps == 0:
+        raise ECGPreprocessError("empty_signal", "ECG record contains no samples")
+    if nleads != n_leads:
+        raise ECGPreprocessError(
+            "lead_count_mismatch",
+            f"ECG record has {nleads} leads, but model expects {n_leads}.",
+            leads=int(nleads),
+            expected_leads=n_leads,
+        )
+    if fs is not None and expected_fs is not None and float(fs) != float(expected_fs):
+        raise ECGPreprocessError(
+            "sample_rate_mismatch",
+            f"ECG record is sampled at {float(fs):g} Hz, but model expects {float(expected_fs):g} Hz.",
+            fs=float(fs),
+            expected_fs=float(expected_fs),
+        )
+    return sig_all
+
+
+def write_record(out, sig_all):
+    """
+    Clip/pad one raw [n_samples, n_leads] signal into ``out`` ([n_leads, N_SAMPLES]).
+
+    Keeps the last N_SAMPLES samples, zero-fills the head of shorter records.
+    """
+    n_samples = out.shape[-1]
+    n = min(sig_all.shape[0], n_samples)
+    if n < n_samples:
+        out[:, : n_samples - n] = 0.0
+    out[:, n_samples - n:] = sig_all[-n:, :].T
+    return out
+
+
+def prepare_signal(sig_all, fs=None, expected_fs=EXPECTED_FS):
+    """Validate and convert one raw record into a fresh [12, 15000] float32 array"""
+    validate_signal(sig_all, fs, expected_fs=expected_fs)
+    out = np.empty((N_LEADS, N_SAMPLES), dtype=np.float32)
+    return write_record(out, sig_all)
+
+
+def prepare_record(record, expected_fs=EXPECTED_FS):
+    """Same as prepare_signal, taking a wfdb.Record"""
+    return prepare_signal(record.p_signal, getattr(record, "fs", None), expected_fs=expected_fs)
+
+
+def prepare_batch(signals, fs_list=None, out=None, expected_fs=EXPECTED_FS):
+    """
+    Validate and write N raw records into one [N, 12, 15000] float32 buffer.
+
+    Args:
+        signals: sequence of raw [n_samples, n_leads] arrays
+        fs_list: optional sequence of sampling rates, one per signal
+        out: optional preallocated buffer with at least N rows (e.g. from
+            ECGBufferPool); a new one is allocated otherwise
+    Returns:
+        (batch, errors): ``batch`` is ``out[:N]``; ``errors`` maps the index
+        of each rejected record to its ECGPreprocessError. Rejected rows are
+        zero-filled so the batch can still be run as a whole.
+    """
+    n = len(signals)
+    if out is None:
+        out = np.empty((n, N_LEADS, N_SAMPLES), dtype=np.float32)
+    elif out.shape[0] < n or out.shape[1:] != (N_LEADS, N_SAMPLES):
+        raise ValueError(f"Output buffer of shape {out.shape} cannot hold {n} records")
+
+    batch = out[:n]
+    errors = {}
+    for i, sig_all in enumerate(signals):
+        fs = fs_list[i] if fs_list is not None else None
+        try:
+            validate_signal(sig_all, fs, expected_fs=expected_fs)
+        except ECGPreprocessError as e:
+            errors[i] = e
+            batch[i] = 0.0
+            continue
+        write_record(batch[i], sig_all)
+    return batch, errors
+
+
+class ECGBufferPool:
+    """
+    Pool of preallocated C-contiguous [capacity, 12, 15000] float32 buffers.
+
+    A buffer is ~720 KB per row, so reusing them keeps large allocations off
+    the hot inference path. Use as ``with pool.batch(n) as buf: ...``; ``buf``
+    is a contiguous [n, 12, 15000] view.
+    """
+
+    def __init__(self, capacity, max_free=4):
+        self.capacity = int(capacity)
+        self.max_free = int(max_free)
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self, n=None):
+        n = self.capacity if n is None else n
+        if n > self.capacity:
+            # Oversized requests are served with a one-off buffer
+            return np.empty((n, N_LEADS, N_SAMPLES), dtype=np.float32)
+        with self._lock:
+            buf = self._free.pop() if self._free else None
+        if buf is None:
+            buf = np.empty((self.capacity, N_LEADS, N_SAMPLES), dtype=np.float32)
+        return buf
+
+    def release(self, buf):
+        if buf.shape[0] != self.capacity:
+            return
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(buf)
+
+    def batch(self, n):
+        return _PooledBatch(self, n)
+
+
+class _PooledBatch:
+    def __init__(self, pool, n):
+        self.pool = pool
+        self.n = n
+        self.buf = None
+
+    def __enter__(self):
+        self.buf = self.pool.acquire(self.n)
+        return self.buf[: self.n]
+
+    def __exit__(self, *exc):
+        self.pool.release(self.buf)
+        self.buf = None
+        return False
@@ -0,0 +1,326 @@
+"""
+ONNX Runtime session factory and session pool for ECG inference.
+
+``create_session`` builds an InferenceSession with explicit SessionOptions
+(graph optimization level, intra/inter-op threads, execution mode, memory
+pattern and CPU arena) and can persist the optimized graph so later starts
+skip the optimization passes. ``ORTSessionPool`` holds N such sessions, each
+pinned to its own share of the cores, and hands one to each concurrent run.
+It mirrors the parts of the InferenceSession API the app uses (``run``,
+``get_inputs``, ``get_providers``), so it can stand in for a single session.
+
+Under a pre-forking server (wsgi.py) the master reads the model files once
+with ``preload_model``; sessions created in the forked workers are built from
+those bytes, shared copy-on-write, instead of each worker reading the files.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from functools import lru_cache
+from importlib import metadata
+import queue
+import threading
+import time
+
+import numpy as np
+
+# onnxruntime is imported on first use (see _ort), so importing the app or a
+# helper script does not pay for it; settings map to its enum member names
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+EXECUTION_MODES = {
+    "sequential": "ORT_SEQUENTIAL",
+    "parallel": "ORT_PARALLEL",
+}
+
+
+def _ort():
+    import onnxruntime
+    return onnxruntime
+
+
+@lru_cache(maxsize=None)
+def ort_version():
+    """
+    Version of the installed onnxruntime build (onnxruntime, onnxruntime-gpu...),
+    read from the package metadata: importing it starts a thread, which a
+    pre-fork master must not do.
+    """
+    for distribution in metadata.packages_distributions().get("onnxruntime", []):
+        try:
+            return metadata.version(distribution)
+        except metadata.PackageNotFoundError:
+            continue
+    return _ort().__version__
+
+
+def available_cpus():
+    """Cores this process may run on (its CPU affinity, e.g. a container's cpuset)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+# Model file contents read by preload_model, by absolute path
+_preloaded = {}
+
+
+def preload_model(*paths):
+    """
+    Read model files into memory (replacing any read before); create_session
+    then builds sessions from these bytes. Missing paths and None are skipped.
+    Returns the number of bytes held.
+    """
+    _preloaded.clear()
+    for path in paths:
+        if path and os.path.exists(path):
+            with open(path, "rb") as fh:
+                _preloaded[os.path.abspath(path)] = fh.read()
+    return sum(len(data) for data in _preloaded.values())
+
+
+# Published model variants, as written by convert_to_onnx.py next to the FP32 model
+MODEL_VARIANTS = {
+    "fp32": "",
+    "int8-dynamic": ".int8-dynamic",
+    "int8-static": ".int8-static",
+}
+
+
+def model_variant_path(model_path, variant):
+    """Path of a model variant: resnet34_model.onnx -> resnet34_model.int8-static.onnx"""
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model variant: {variant}")
+    base, ext = os.path.splitext(model_path)
+    return f"{base}{MODEL_VARIANTS[variant]}{ext}"
+
+
+def variant_report_path(variant_path):
+    """Accuracy-gate report written by convert_to_onnx.py next to a variant"""
+    return os.path.splitext(variant_path)[0] + ".report.json"
+
+
+def resolve_model_variant(model_path, variant, model_id):
+    """
+    Pick the model file to serve for ``variant``.
+
+    A quantized variant is only used when its gate report says it was
+    published from the FP32 model currently at ``model_path`` (``model_id``
+    is that file's SHA-256); otherwise the FP32 model is served.
+    Returns (path, reason or None when the requested variant is used).
+    """
+    if variant == "fp32":
+        return model_path, None
+    variant_path = model_variant_path(model_path, variant)
+    if not os.path.exists(variant_path):
+        return model_path, f"{variant} model not found at {variant_path}"
+    try:
+        with open(variant_report_path(variant_path), "r", encoding="utf-8") as fh:
+            report = json.load(fh)
+    except (OSError, ValueError):
+        return model_path, f"{variant} model has no accuracy report"
+    if not report.get("published"):
+        return model_path, f"{variant} model did not pass the accuracy gate"
+    if report.get("source_model_sha256") != model_id:
+        return model_path, f"{variant} model was built from a different FP32 model"
+    return variant_path, None
+
+
+def session_options(graph_optimization="all", intra_op_threads=0, inter_op_threads=0,
+                    execution_mode="sequential", enable_mem_pattern=True, enable_cpu_mem_arena=True):
+    """
+    Build ort.SessionOptions from plain settings.
+
+    Args:
+        graph_optimization: "disable", "basic", "extended" or "all"
+        intra_op_threads: threads used inside one operator (0 = ORT default, all cores)
+        inter_op_threads: threads running independent operators (parallel mode only)
+        execution_mode: "sequential" or "parallel"
+        enable_mem_pattern: pre-plan allocations for fixed input shapes
+        enable_cpu_mem_arena: reuse CPU allocations through ORT's arena
+    """
+    if graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown graph optimization level: {graph_optimization}")
+    if execution_mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode: {execution_mode}")
+    ort = _ort()
+    so = ort.SessionOptions()
+    so.graph_optimization_level = getattr(ort.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[graph_optimization])
+    so.intra_op_num_threads = int(intra_op_threads)
+    so.inter_op_num_threads = int(inter_op_threads)
+    so.execution_mode = getattr(ort.ExecutionMode, EXECUTION_MODES[execution_mode])
+    so.enable_mem_pattern = bool(enable_mem_pattern)
+    so.enable_cpu_mem_arena = bool(enable_cpu_mem_arena)
+    return so
+
+
+def optimized_model_path(cache_dir, model_id, graph_optimization):
+    """
+    Where the optimized graph for one model file is saved. The name carries the
+    model hash, ORT version and optimization level, since an "extended"/"all"
+    graph is only valid for the runtime and hardware that produced it.
+    """
+    if not cache_dir or not model_id:
+        return None
+    return os.path.join(cache_dir, f"{model_id[:16]}-ort{ort_version()}-{graph_optimization}.onnx")
+
+
+def create_session(model_path, providers=None, optimized_path=None, **options):
+    """
+    Create one InferenceSession.
+
+    When ``optimized_path`` already exists it is loaded with graph
+    optimizations disabled (they were applied when it was saved); otherwise,
+    or when it cannot be loaded, the model is optimized as usual and the
+    result saved there. The graph is written to a per-process temporary file
+    and renamed into place, so another process never loads a partial graph.
+    A file read by preload_model is built from its bytes rather than re-read.
+    """
+    if optimized_path and os.path.exists(optimized_path):
+        so = session_options(**options)
+        so.graph_optimization_level = _ort().GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            return _ort().InferenceSession(_preloaded.get(os.path.abspath(optimized_path), optimized_path),
+                                           sess_options=so, providers=providers)
+        except Exception:
+            pass  # unreadable saved graph: optimize the source model again and replace it
+
+    so = session_options(**options)
+    temp_path = None
+    if optimized_path:
+        os.makedirs(os.path.dirname(optimized_path), exist_ok=True)
+        temp_path = f"{optimized_path}.{os.getpid()}.tmp"
+        so.optimized_model_filepath = temp_path
+    try:
+        session = _ort().InferenceSession(_preloaded.get(os.path.abspath(model_path), model_path),
+                                          sess_options=so, providers=providers)
+        if temp_path and os.path.exists(temp_path):
+            os.replace(temp_path, optimized_path)
+        return session
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def build_optimized_model(model_path, optimized_path, providers=None, timeout=600, **options):
+    """
+    Save the optimized graph of ``model_path`` at ``optimized_path`` (see
+    create_session) from a child process, so the caller never imports
+    onnxruntime: a pre-fork master builds it once for all its workers
+    instead of each worker optimizing the model at the same time.
+    Returns None on success, otherwise the error.
+    """
+    code = ("import json, sys; from ecg_sessions import create_session; a = json.loads(sys.argv[1]); "
+            "create_session(a['model_path'], a['providers'], a['optimized_path'], **a['options'])")
+    args = json.dumps({"model_path": os.path.abspath(model_path), "providers": providers,
+                       "optimized_path": os.path.abspath(optimized_path), "options": options})
+    try:
+        result = subprocess.run([sys.executable, "-c", code, args], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return f"timed out after {timeout} s"
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return lines[-1] if lines else f"exit status {result.returncode}"
+    return None
+
+
+class ORTSessionPool:
+    """
+    Fixed pool of InferenceSessions sharing one model.
+
+    Args:
+        model_path: .onnx file
+        size: number of sessions (concurrent runs)
+        providers: execution providers, in priority order (None = ORT default)
+        optimized_path: see create_session
+        processes: processes running such a pool on this machine (server workers)
+        **options: passed to session_options; ``intra_op_threads`` defaults to
+            cores // (size * processes) so the pools do not oversubscribe the cores
+    """
+
+    def __init__(self, model_path, size=1, providers=None, optimized_path=None, processes=1, **options):
+        self.model_path = model_path
+        self.size = max(int(size), 1)
+        self.processes = max(int(processes), 1)
+        if not options.get("intra_op_threads"):
+            options["intra_op_threads"] = max(available_cpus() // (self.size * self.processes), 1)
+        self.options = options
+
+        # Created in order: the first session writes the optimized graph, the rest load it
+        self._sessions = [create_session(model_path, providers, optimized_path, **options)
+                          for _ in range(self.size)]
+        self.optimized_path = optimized_path if optimized_path and os.path.exists(optimized_path) else None
+
+        self._idle = queue.LifoQueue()
+        for session in self._sessions:
+            self._idle.put(session)
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.warmup_ms = None
+
+    def get_inputs(self):
+        return self._sessions[0].get_inputs()
+
+    def get_outputs(self):
+        return self._sessions[0].get_outputs()
+
+    def get_providers(self):
+        return self._sessions[0].get_providers()
+
+    def run(self, output_names, input_feed, timeout=None):
+        """InferenceSession.run on whichever pooled session is free"""
+        try:
+            session = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No ONNX Runtime session became free in time")
+        try:
+            return session.run(output_names, input_feed)
+        finally:
+            self._idle.put(session)
+            with self._lock:
+                self.runs += 1
+
+    def self_check(self, input_shape, runs=3):
+        """
+        Warm every session on zeros and time it; returns a summary for the startup log.
+        The first run of a session pays for kernel selection and arena growth.
+        """
+        input_name = self.get_inputs()[0].name
+        dummy = np.zeros(input_shape, dtype=np.float32)
+        timings = []
+        for session in self._sessions:
+            for _ in range(max(int(runs), 1)):
+                started = time.perf_counter()
+                session.run(None, {input_name: dummy})
+                timings.append((time.perf_counter() - started) * 1000.0)
+        self.warmup_ms = {"first": timings[0], "best": min(timings), "runs": len(timings)}
+        return {
+            "providers": self.get_providers(),
+            "pool_size": self.size,
+            "intra_op_threads": self.options["intra_op_threads"],
+            "optimized_model": self.optimized_path,
+            "warmup_ms": self.warmup_ms,
+        }
+
+    def stats(self):
+        with self._lock:
+            runs = self.runs
+        return {
+            "model_path": self.model_path,
+            "pool_size": self.size,
+            "processes": self.processes,
+            "idle": self._idle.qsize(),
+            "runs": runs,
+            "providers": self.get_providers(),
+            "options": dict(self.options),
+            "optimized_model": self.optimized_path,
+            "warmup_ms": self.warmup_ms,
+        }
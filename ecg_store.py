@@ -0,0 +1,160 @@
+"""
+Decoded ECG signal store.
+
+Uploaded WFDB records are decoded once into ``<record>.signal.npy`` (float32,
+lead-major [n_leads, n_samples]) plus ``<record>.signal.json`` metadata,
+written next to the .mat/.hea pair. Readers open the .npy with
+``np.load(mmap_mode="r")``, so a visit page or an inference job maps the file
+instead of re-parsing the WFDB header and signal, and slicing a plot window
+only touches the pages it needs.
+
+The store is rebuilt automatically whenever the source files change size or
+modification time, so a replaced upload never serves stale samples.
+"""
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+STORE_VERSION = 1
+
+
+def store_paths(hea_path):
+    """(.npy path, .json path) of the decoded store for a .hea file"""
+    base = os.path.splitext(hea_path)[0]
+    return f"{base}.signal.npy", f"{base}.signal.json"
+
+
+def _source_stats(hea_path, mat_path=None):
+    stats = {}
+    for label, path in (("hea", hea_path), ("mat", mat_path)):
+        if path:
+            st = os.stat(path)
+            stats[label] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def _listify(value):
+    if value is None:
+        return None
+    return [v.item() if hasattr(v, "item") else v for v in value]
+
+
+def _write_atomic(path, write):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            write(fh)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class StoredRecord:
+    """
+    Read-only stand-in for wfdb.Record backed by a decoded store.
+
+    ``signals`` is the lead-major [n_leads, n_samples] float32 array (a
+    memory map when loaded from disk); ``p_signal`` is its transposed view in
+    WFDB's [n_samples, n_leads] layout, so existing helpers work unchanged.
+    """
+
+    def __init__(self, signals, meta):
+        self.signals = signals
+        self.meta = meta
+        self.record_name = meta.get("record_name")
+        self.fs = meta.get("fs")
+        self.sig_name = meta.get("sig_name")
+        self.units = meta.get("units")
+        self.adc_gain = meta.get("adc_gain")
+        self.baseline = meta.get("baseline")
+        self.n_sig, self.sig_len = signals.shape
+
+    @property
+    def p_signal(self):
+        return self.signals.T
+
+
+def read_wfdb(hea_path):
+    """wfdb.rdrecord of a .hea path; wfdb (and the pandas it pulls in) is imported on first use"""
+    import wfdb
+    return wfdb.rdrecord(os.path.splitext(hea_path)[0])
+
+
+def build_store(hea_path, mat_path=None, record=None):
+    """
+    Decode a WFDB record into its .npy/.json store and return it memory-mapped.
+
+    Args:
+        hea_path: path of the .hea header (the record name is its basename)
+        mat_path: path of the signal file, tracked for staleness when given
+        record: optional already-loaded wfdb.Record (skips re-reading)
+    """
+    if record is None:
+        record = read_wfdb(hea_path)
+    signals = np.ascontiguousarray(record.p_signal.T, dtype=np.float32)
+    meta = {
+        "version": STORE_VERSION,
+        "record_name": record.record_name,
+        "fs": float(record.fs) if getattr(record, "fs", None) else None,
+        "n_leads": int(signals.shape[0]),
+        "n_samples": int(signals.shape[1]),
+        "sig_name": list(record.sig_name) if getattr(record, "sig_name", None) else None,
+        "units": list(record.units) if getattr(record, "units", None) else None,
+        "adc_gain": _listify(getattr(record, "adc_gain", None)),
+        "baseline": _listify(getattr(record, "baseline", None)),
+        "source": _source_stats(hea_path, mat_path),
+    }
+
+    npy_path, meta_path = store_paths(hea_path)
+    # Samples first, metadata last: the .json is what marks the store valid
+    _write_atomic(npy_path, lambda fh: np.save(fh, signals))
+    _write_atomic(meta_path, lambda fh: fh.write(json.dumps(meta).encode("utf-8")))
+    return StoredRecord(np.load(npy_path, mmap_mode="r"), meta)
+
+
+def open_store(hea_path, mat_path=None):
+    """Memory-map an up-to-date store, or None when it is missing or stale"""
+    npy_path, meta_path = store_paths(hea_path)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta.get("version") != STORE_VERSION:
+            return None
+        if meta.get("source") != _source_stats(hea_path, mat_path):
+            return None
+        signals = np.load(npy_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if signals.shape != (meta["n_leads"], meta["n_samples"]):
+        return None
+    return StoredRecord(signals, meta)
+
+
+def load_record(hea_path, mat_path=None):
+    """
+    Return the record for a .hea/.mat pair, decoding it into the store on first use.
+
+    Falls back to an in-memory record when the store cannot be written
+    (read-only upload directory).
+    """
+    stored = open_store(hea_path, mat_path)
+    if stored is not None:
+        return stored
+    record = read_wfdb(hea_path)
+    try:
+        return build_store(hea_path, mat_path, record=record)
+    except OSError:
+        signals = np.ascontiguousarray(record.p_signal.T, dtype=np.float32)
+        return StoredRecord(signals, {
+            "record_name": record.record_name,
+            "fs": getattr(record, "fs", None),
+            "sig_name": getattr(record, "sig_name", None),
+            "units": getattr(record, "units", None),
+            "adc_gain": getattr(record, "adc_gain", None),
+            "baseline": getattr(record, "baseline", None),
+        })
@@ -0,0 +1,230 @@
+"""
+Compact framed binary encoding for ECG waveforms.
+
+The JSON waveform responses serialize every sample as text plus an equally
+long time array (~200k floats for a 12-lead, 15000-sample record). The
+binary format ships the samples as raw little-endian float32 (or int16 with
+per-lead gain/baseline) and lets the client rebuild the time axis from
+``fs``. Layout::
+
+    offset  size  field
+    0       4     magic b"ECGW"
+    4       1     format version (1)
+    5       1     sample encoding: 1 = float32, 2 = int16
+    6       2     reserved (0)
+    8       4     header length H (uint32, little-endian)
+    12      H     JSON header, UTF-8, space-padded to a 4-byte boundary
+    12+H    ...   samples, lead-major: n_leads rows of n_samples values
+
+JSON header keys: fs, t0, n_leads, n_samples, lead_names, units, scale,
+encoding, layout, and for int16 also gain and baseline (one per lead).
+Physical value = (sample - baseline) / gain for int16, the sample itself
+for float32; multiply by ``scale`` to match the JSON endpoint's values.
+Sample i of every lead is at time t0 + i / fs.
+
+This module also implements the plot-view reductions (viewport slicing,
+min-max and LTTB decimation) so a chart a few thousand pixels wide never
+receives every sample of a long record.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+WAVEFORM_MIMETYPE = "application/vnd.heartline.ecg-waveform"
+MAGIC = b"ECGW"
+VERSION = 1
+ENCODINGS = {"float32": 1, "int16": 2}
+
+_PREAMBLE = struct.Struct("<4sBBHI")
+
+
+def _int16_params(signals):
+    """Per-lead gain/baseline mapping each lead's range onto int16"""
+    lo = np.nanmin(signals, axis=1)
+    hi = np.nanmax(signals, axis=1)
+    span = np.where(hi > lo, hi - lo, 1.0)
+    gain = 65534.0 / span
+    baseline = np.round(-32767.0 - lo * gain)
+    return gain, baseline
+
+
+def encode_waveform(signals, fs, lead_names, units=None, scale=1.0, encoding="float32",
+                    gain=None, baseline=None, t0=0.0):
+    """
+    Frame a lead-major waveform as bytes.
+
+    Args:
+        signals: array [n_leads, n_samples] of physical values (a transposed
+            view of WFDB's p_signal is fine)
+        fs: sampling frequency in Hz (of the samples sent, after decimation)
+        lead_names: list of lead labels
+        units: list of physical units per lead (e.g. "mV")
+        scale: factor the client applies to match the JSON endpoint
+        encoding: "float32" or "int16"
+        gain, baseline: per-lead ADC parameters for int16 (WFDB adc_gain and
+            baseline reproduce the original digital samples); derived from
+            each lead's range when omitted
+        t0: time of the first sample in seconds (viewport start)
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unsupported waveform encoding: {encoding}")
+    signals = np.asarray(signals)
+    n_leads, n_samples = signals.shape
+
+    header = {
+        "fs": float(fs),
+        "t0": float(t0),
+        "n_leads": int(n_leads),
+        "n_samples": int(n_samples),
+        "lead_names": list(lead_names),
+        "units": list(units) if units is not None else None,
+        "scale": float(scale),
+        "encoding": encoding,
+        "layout": "lead-major",
+    }
+
+    if encoding == "float32":
+        payload = np.ascontiguousarray(signals, dtype="<f4")
+    else:
+        if gain is None or baseline is None:
+            gain, baseline = _int16_params(signals)
+        gain = np.asarray(gain, dtype=np.float64).reshape(n_leads, 1)
+        baseline = np.asarray(baseline, dtype=np.float64).reshape(n_leads, 1)
+        digital = np.rint(np.nan_to_num(signals) * gain + baseline)
+        payload = np.clip(digital, -32768, 32767).astype("<i2")
+        header["gain"] = gain.ravel().tolist()
+        header["baseline"] = baseline.ravel().tolist()
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * (-len(header_bytes) % 4)
+    preamble = _PREAMBLE.pack(MAGIC, VERSION, ENCODINGS[encoding], 0, len(header_bytes))
+    return b"".join((preamble, header_bytes, payload.tobytes()))
+
+
+def decode_waveform(data):
+    """Inverse of encode_waveform: returns (header dict, float32 [n_leads, n_samples] physical values)"""
+    magic, version, code, _, header_len = _PREAMBLE.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not an ECG waveform frame")
+    start = _PREAMBLE.size
+    header = json.loads(data[start:start + header_len].decode("utf-8"))
+    shape = (header["n_leads"], header["n_samples"])
+    offset = start + header_len
+    if code == ENCODINGS["float32"]:
+        return header, np.frombuffer(data, dtype="<f4", count=shape[0] * shape[1], offset=offset).reshape(shape)
+    digital = np.frombuffer(data, dtype="<i2", count=shape[0] * shape[1], offset=offset).reshape(shape)
+    gain = np.asarray(header["gain"]).reshape(-1, 1)
+    baseline = np.asarray(header["baseline"]).reshape(-1, 1)
+    return header, ((digital - baseline) / gain).astype(np.float32)
+
+
+# ----------------------------------------------------------------------
+# Plot-view reductions
+# ----------------------------------------------------------------------
+
+def minmax_decimate(signals, max_points):
+    """
+    Min-max decimation of [n_leads, n] signals to at most ``max_points`` per lead.
+
+    Each bucket contributes its minimum and maximum in time order, so R peaks
+    and QRS spikes keep their full amplitude. Output samples are uniformly
+    spaced (two per bucket), i.e. the result is a regular series at
+    ``2 * fs / bucket_size``. Returns (decimated, bucket_size).
+    """
+    n_leads, n = signals.shape
+    if max_points >= n:
+        return signals, 1
+    n_buckets = max(max_points // 2, 1)
+    bucket = -(-n // n_buckets)
+    n_buckets = -(-n // bucket)
+
+    padded = np.pad(signals, ((0, 0), (0, n_buckets * bucket - n)), mode="edge")
+    buckets = padded.reshape(n_leads, n_buckets, bucket)
+    imin = buckets.argmin(axis=2)
+    imax = buckets.argmax(axis=2)
+    first = np.minimum(imin, imax)[..., None]
+    second = np.maximum(imin, imax)[..., None]
+
+    out = np.empty((n_leads, n_buckets, 2), dtype=signals.dtype)
+    out[..., 0] = np.take_along_axis(buckets, first, axis=2)[..., 0]
+    out[..., 1] = np.take_along_axis(buckets, second, axis=2)[..., 0]
+    return out.reshape(n_leads, n_buckets * 2), bucket
+
+
+def lttb_indices(signals, n_out):
+    """
+    Largest-Triangle-Three-Buckets sample selection, per lead.
+
+    Buckets are walked in order (each choice depends on the previous one),
+    but every step is vectorized across all leads and across the candidates
+    in the bucket. Returns int indices of shape [n_leads, n_out].
+    """
+    n_leads, n = signals.shape
+    if n_out >= n or n_out < 3:
+        return np.tile(np.arange(n), (n_leads, 1))
+
+    # n_out - 2 inner buckets over samples [1, n - 1); first and last samples are always kept
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    rows = np.arange(n_leads)
+    out = np.empty((n_leads, n_out), dtype=np.int64)
+    out[:, 0] = 0
+    out[:, -1] = n - 1
+
+    a = np.zeros(n_leads, dtype=np.int64)
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo = hi
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = (next_lo + next_hi - 1) / 2.0
+        avg_y = signals[:, next_lo:next_hi].mean(axis=1)
+
+        ax = a.astype(np.float64)[:, None]
+        ay = signals[rows, a][:, None]
+        bx = np.arange(lo, hi, dtype=np.float64)[None, :]
+        by = signals[:, lo:hi]
+        area = np.abs((ax - avg_x) * (by - ay) - (ax - bx) * (avg_y[:, None] - ay))
+        a = lo + area.argmax(axis=1)
+        out[:, i + 1] = a
+    return out
+
+
+def waveform_view(signals, fs, max_points=None, t_start=None, t_end=None, method="minmax"):
+    """
+    Slice [n_leads, n] signals to a time window and decimate for plotting.
+
+    Returns a dict with ``signals`` (lead-major array), ``t0``/``t_end`` of the
+    window, ``method`` ("none", "minmax" or "lttb") and either a uniform
+    ``fs`` (none/minmax) or per-lead ``times`` arrays (lttb, non-uniform).
+    """
+    if method not in ("minmax", "lttb"):
+        raise ValueError(f"Unknown decimation method: {method}")
+    n = signals.shape[1]
+    start = 0 if t_start is None else int(np.clip(np.floor(t_start * fs), 0, n))
+    stop = n if t_end is None else int(np.clip(np.ceil(t_end * fs), start, n))
+    window = signals[:, start:stop]
+
+    view = {
+        "signals": window,
+        "fs": float(fs),
+        "times": None,
+        "t0": start / fs,
+        "t_end": stop / fs,
+        "source_samples": stop - start,
+        "method": "none",
+        "bucket_size": 1,
+    }
+    if max_points is None or max_points >= window.shape[1]:
+        return view
+    if max_points < 2:
+        raise ValueError("max_points must be at least 2")
+
+    if method == "minmax":
+        decimated, bucket = minmax_decimate(window, max_points)
+        view.update(signals=decimated, fs=2.0 * fs / bucket, method="minmax", bucket_size=bucket)
+    else:
+        idx = lttb_indices(window, max_points)
+        view.update(signals=np.take_along_axis(window, idx, axis=1), fs=None,
+                    times=view["t0"] + idx / fs, method="lttb")
+    return view
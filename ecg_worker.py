@@ -19,6 +19,8 @@ import numpy as np
 import wfdb
 import torch
 from resnet import resnet34  # Ensure resnet34.py is on PYTHONPATH
+from ecg_preprocessing import ECGPreprocessError, prepare_record
+from ecg_store import build_store, load_record
 
 # ❓ QUESTION: Absolute path to your resnet34_model.pth
 MODEL_PATH = "D:\\doctor\\resnet34_model.pth"
@@ -68,6 +70,12 @@ def cmd_upload(args):
         print(json.dumps({"error": f"Could not read WFDB record: {e}"}))
         sys.exit(1)
 
+    # Decode once on upload; plot/inference then memory-map the .npy store
+    try:
+        build_store(os.path.join(target_folder, base1 + ".hea"), record=record)
+    except OSError:
+        pass  # load_record() decodes on demand instead
+
     output = {
         "record_id": record_id,
         "lead_names": lead_names,
@@ -81,7 +89,7 @@ def cmd_plot(args):
     base = record_id.split('_')[0]
 
     try:
-        record = wfdb.rdrecord(os.path.join(folder, base))
+        record = load_record(os.path.join(folder, base + ".hea"))
         sig_all = record.p_signal  # [n_samples, n_leads]
         lead_names = record.sig_name
         fs = getattr(record, 'fs', 500)
@@ -122,21 +130,17 @@ def cmd_inference(args):
     base = record_id.split('_')[0]
 
     try:
-        record = wfdb.rdrecord(os.path.join(folder, base))
-        sig_all = record.p_signal  # [n_samples, n_leads]
-        nsteps, nleads = sig_all.shape
+        record = load_record(os.path.join(folder, base + ".hea"))
     except Exception as e:
         print(json.dumps({"error": f"Could not read WFDB record: {e}"}))
         sys.exit(1)
 
-    if nsteps >= 15000:
-        clipped = sig_all[-15000:, :]
-    else:
-        padded = np.zeros((15000, nleads), dtype=np.float32)
-        padded[-nsteps:, :] = sig_all
-        clipped = padded
+    try:
+        x_np = prepare_record(record)  # shape: [12, 15000]
+    except ECGPreprocessError as e:
+        print(json.dumps({"error": e.message, "error_code": e.code, "details": e.details}))
+        sys.exit(1)
 
-    x_np = clipped.transpose().astype(np.float32)  # shape: [12, 15000]
     x_tensor = torch.from_numpy(x_np).unsqueeze(0)  # shape: [1, 12, 15000]
 
     model, device = load_model()
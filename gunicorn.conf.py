@@ -0,0 +1,68 @@
+"""
+gunicorn settings for the Heartline web app:
+
+    gunicorn -c gunicorn.conf.py
+
+The app is imported once in the master (``preload_app``, see wsgi.py) and the
+workers are forked from it, sharing the model bytes and reference data.
+
+  - Reload the ECG model (a new model file, or a newly published quantized
+    variant): ``kill -HUP <master pid>``. The master reads the model again,
+    forks new workers and stops the old ones once their in-flight requests
+    are done (graceful_timeout).
+  - Workers are recycled after max_requests requests, plus up to
+    max_requests_jitter so they do not all restart at once; this bounds the
+    growth of per-worker memory (ORT arenas, caches). A recycled worker is
+    forked again from the preloaded master.
+
+Every setting below can be overridden from the environment or the command line.
+"""
+
+import os
+
+if hasattr(os, "sched_getaffinity"):
+    cpus = len(os.sched_getaffinity(0)) or 1
+else:
+    cpus = os.cpu_count() or 1
+
+wsgi_app = "wsgi:application"
+preload_app = True
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+
+# One process per core for inference and Python work; threads overlap the
+# database and file I/O and feed the ECG micro-batcher concurrent requests
+workers = int(os.getenv("WEB_CONCURRENCY", str(cpus)))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))  # synchronous ECG analysis included
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "60"))
+keepalive = 5
+
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+
+
+def post_fork(server, worker):
+    """Before the worker creates its ORT sessions: split the cores across all workers"""
+    import app as heartline
+
+    if "ECG_ORT_PROCESSES" not in os.environ:
+        heartline.app.config["ECG_ORT_PROCESSES"] = server.num_workers
+
+
+def post_worker_init(worker):
+    """Start loading the model before the worker's first request"""
+    import app as heartline
+
+    if heartline.app.config["ECG_MODEL_WARMUP"] == "background":
+        heartline.start_model_warmup()
+
+
+def on_reload(server):
+    """SIGHUP: read the model again before the new workers are forked"""
+    import wsgi
+
+    wsgi.preload()
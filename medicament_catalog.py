@@ -0,0 +1,195 @@
+"""
+In-process copy of the medicament registry for the visit forms and the
+medication autocomplete.
+
+The registry is read-mostly reference data, so instead of loading the whole
+table on every visit form and querying it on every keystroke, each worker
+keeps one immutable snapshot:
+
+  - ``choices()``: the (num_enr, label) list the prescription SelectFields
+    validate against, built once per snapshot;
+  - ``search()``: autocomplete over nom_com / nom_dci folded like
+    text_search.normalize (case and accents ignored). Every entry's folded
+    names are concatenated into one string, with a sorted array of entry
+    offsets; a word is located with str.find and mapped back to its entry
+    by bisection. Prefix matches come from bisecting sorted arrays of the
+    folded names. A keystroke costs microseconds, not a query.
+
+Freshness: writes to Medicament through this process invalidate the snapshot
+(see dashboard_stats.invalidate_on_writes); changes made elsewhere (a
+registry import, an edit through another worker) are noticed by a
+fingerprint query run at most every ``refresh_interval`` seconds: the row
+count and a digest of every displayed column, so in-place edits of a name
+or dosage show up as well as inserts and deletes.
+"""
+
+import hashlib
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from models import db, Medicament
+from text_search import normalize, search_words
+
+CatalogEntry = namedtuple("CatalogEntry", "num_enr nom_com nom_dci dosage unite")
+
+
+class _Snapshot:
+    """Registry rows (sorted by nom_com) and the search structures built over them"""
+
+    def __init__(self, entries, fingerprint):
+        self.entries = entries
+        self.fingerprint = fingerprint
+        self.by_id = {entry.num_enr: entry for entry in entries}
+        self.names = [(normalize(e.nom_com), normalize(e.nom_dci)) for e in entries]
+        keys = [f"{com} {dci}" for com, dci in self.names]
+        self.offsets = []
+        position = 0
+        for key in keys:
+            self.offsets.append(position)
+            position += len(key) + 1
+        self.haystack = "\n".join(keys)
+        self.keys = keys
+        # Folded names in sorted order: the entries starting with a prefix are one bisected slice
+        self.prefix_index = []
+        for column in (0, 1):
+            ordered = sorted(range(len(entries)), key=lambda i: (self.names[i][column], i))
+            self.prefix_index.append(([self.names[i][column] for i in ordered], ordered))
+        self.choices = [(e.num_enr, f"{e.nom_com} ({e.dosage}{e.unite})") for e in entries]
+
+
+class MedicamentCatalog:
+    """
+    Args:
+        refresh_interval: seconds between checks that the table is unchanged
+    """
+
+    def __init__(self, refresh_interval=300):
+        self.refresh_interval = float(refresh_interval)
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    # ---------- freshness ----------
+
+    def invalidate(self):
+        """Reload on next use (called after Medicament rows are written)"""
+        self._stale = True
+
+    @staticmethod
+    def _fingerprint():
+        """(row count, digest of the displayed columns of every row)"""
+        if db.session.get_bind().dialect.name == "postgresql":
+            # Hashed in the database: one row comes back, not the registry
+            row = db.session.execute(db.text(
+                "SELECT count(*), md5(string_agg(concat_ws(chr(31), num_enr, nom_com, nom_dci, dosage, unite), "
+                "chr(30) ORDER BY num_enr)) FROM medicament"
+            )).one()
+            return tuple(row)
+        digest = hashlib.md5()
+        count = 0
+        rows = db.session.query(Medicament.num_enr, Medicament.nom_com, Medicament.nom_dci,
+                                Medicament.dosage, Medicament.unite).order_by(Medicament.num_enr)
+        for row in rows.yield_per(1000):
+            digest.update("\x1f".join("" if value is None else str(value) for value in row).encode("utf-8") + b"\x1e")
+            count += 1
+        return count, digest.hexdigest()
+
+    def _current(self):
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and not self._stale and now - self._checked_at < self.refresh_interval:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and not self._stale and time.monotonic() - self._checked_at < self.refresh_interval:
+                return snapshot  # refreshed by another thread meanwhile
+            self._stale = False
+            fingerprint = self._fingerprint()
+            if snapshot is None or fingerprint != snapshot.fingerprint:
+                rows = (
+                    db.session.query(Medicament.num_enr, Medicament.nom_com, Medicament.nom_dci,
+                                     Medicament.dosage, Medicament.unite)
+                    .order_by(Medicament.nom_com, Medicament.num_enr)
+                    .all()
+                )
+                snapshot = _Snapshot([CatalogEntry(*row) for row in rows], fingerprint)
+                self._snapshot = snapshot
+                self.loads += 1
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    # ---------- lookups ----------
+
+    def choices(self):
+        """[(num_enr, "NAME (dosage unit)")] for every medicament, sorted by name"""
+        return self._current().choices
+
+    def get(self, num_enr):
+        return self._current().by_id.get(num_enr)
+
+    def __len__(self):
+        return len(self._current().entries)
+
+    def search(self, term, offset=0, limit=10):
+        """
+        Medicaments whose names contain every word of ``term``: brand names
+        starting with the term first, then molecule names starting with it,
+        then names with a word starting with it, then the rest.
+        Returns (list of CatalogEntry, True if more results follow).
+        """
+        snapshot = self._current()
+        words = search_words(term)
+        wanted = offset + limit + 1
+        if not words:
+            page = snapshot.entries[offset:offset + wanted]
+            return page[:limit], len(page) > limit
+
+        # Prefix matches come straight from the sorted name arrays; the whole
+        # registry is only scanned when they do not fill the requested page
+        phrase = " ".join(words)
+        found, seen = [], set()
+        for names, order in snapshot.prefix_index:
+            start = bisect_left(names, phrase)
+            end = bisect_left(names, phrase + "\uffff", start)
+            for i in order[start:min(end, start + wanted)]:
+                if i not in seen:
+                    seen.add(i)
+                    found.append(i)
+            if len(found) >= wanted:
+                break
+
+        if len(found) < wanted:
+            rest = [i for i in self._find(snapshot, max(words, key=len))
+                    if i not in seen and all(word in snapshot.keys[i] for word in words)]
+            word_start = f" {phrase}"
+            rest.sort(key=lambda i: (word_start not in f" {snapshot.keys[i]}", i))
+            found += rest
+
+        page = [snapshot.entries[i] for i in found[offset:offset + limit]]
+        return page, len(found) > offset + limit
+
+    @staticmethod
+    def _find(snapshot, word):
+        """Indexes of the entries whose folded names contain ``word``"""
+        found = []
+        haystack, offsets = snapshot.haystack, snapshot.offsets
+        position = haystack.find(word)
+        while position != -1:
+            i = bisect_right(offsets, position) - 1
+            found.append(i)
+            if i + 1 >= len(offsets):
+                break
+            position = haystack.find(word, offsets[i + 1])
+        return found
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "entries": len(snapshot.entries) if snapshot else 0,
+            "loads": self.loads,
+            "refresh_interval": self.refresh_interval,
+        }
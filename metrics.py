@@ -0,0 +1,308 @@
+"""
+In-process latency metrics with Prometheus text exposition (/metrics).
+
+Two families are recorded for the web app:
+
+  heartline_http_request_duration_seconds{route, method, role, outcome}
+  heartline_http_requests_total{route, method, role, outcome}
+      every request, by URL rule (``/visit/<int:visit_id>``, not the raw
+      path, so the number of series stays bounded), the role of the logged
+      in user and the outcome (ok / client_error / server_error);
+
+  heartline_ecg_phase_seconds{phase, route}
+      the hot sub-phases of ECG handling, timed with ``time_phase()``:
+      read_record (wfdb.rdrecord or the signal store), preprocess, inference
+      (ORT run, including the micro-batching wait), json_serialize and
+      db_commit. ``route`` is the request's URL rule, or "background" for
+      the job workers, so a slow p99 can be traced to its step and caller.
+
+Histograms use fixed cumulative buckets, so quantiles are computed by
+Prometheus (histogram_quantile) and aggregate across workers. Each worker
+process keeps its own counts; scrape every worker, or run one per container.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram (cumulative, Prometheus style)"""
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * len(self.buckets)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._count += 1
+            self._sum += value
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    self._counts[i] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "buckets": {str(upper): count for upper, count in zip(self.buckets, self._counts)},
+                "count": self._count,
+                "sum": self._sum,
+            }
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Family:
+    """One metric name: a child per combination of label values"""
+
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **values):
+        key = tuple(str(values[name]) for name in self.label_names)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines += self._render_child(key, child)
+        return lines
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+
+class CounterFamily(_Family):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1.0, **labels):
+        self.labels(**labels).inc(amount)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(child.value)}"]
+
+
+class HistogramFamily(_Family):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+
+    def _new_child(self):
+        return Histogram(self.buckets)
+
+    def observe(self, value, **labels):
+        self.labels(**labels).observe(value)
+
+    def _render_child(self, key, child):
+        return render_histogram(self.name, child, self.label_names, key)
+
+
+def render_histogram(name, histogram, label_names=(), label_values=()):
+    """Prometheus lines (_bucket, _count, _sum) of a ``Histogram``"""
+    snapshot = histogram.snapshot()
+    lines = [
+        f"{name}_bucket{_labels(label_names, label_values, [('le', _number(float(upper)))])} {count}"
+        for upper, count in snapshot["buckets"].items()
+    ]
+    lines.append(f"{name}_bucket{_labels(label_names, label_values, [('le', '+Inf')])} {snapshot['count']}")
+    lines.append(f"{name}_count{_labels(label_names, label_values)} {snapshot['count']}")
+    lines.append(f"{name}_sum{_labels(label_names, label_values)} {_number(float(snapshot['sum']))}")
+    return lines
+
+
+class MetricsRegistry:
+    """Metric families plus collectors (callables returning lines) rendered together by /metrics"""
+
+    def __init__(self):
+        self._families = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        family = CounterFamily(name, help_text, labels)
+        self._families.append(family)
+        return family
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        family = HistogramFamily(name, help_text, labels, buckets)
+        self._families.append(family)
+        return family
+
+    def register_histogram(self, name, help_text, histogram):
+        """Export an existing unlabelled ``Histogram`` (e.g. the ECG batcher's)"""
+        self.register_collector(lambda: [f"# HELP {name} {help_text}", f"# TYPE {name} histogram",
+                                         *render_histogram(name, histogram)])
+
+    def register_value(self, name, help_text, read, kind="gauge"):
+        """Export ``read()`` (evaluated at scrape time) as a gauge, or a counter kept elsewhere"""
+        self.register_collector(lambda: [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}",
+                                         f"{name} {_number(read())}"])
+
+    def register_collector(self, collect):
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for family in self._families:
+            lines += family.render()
+        for collect in self._collectors:
+            lines += collect()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "heartline_http_request_duration_seconds", "Request latency by route, method, role and outcome",
+    ("route", "method", "role", "outcome"),
+)
+requests_total = registry.counter(
+    "heartline_http_requests_total", "Requests by route, method, role and outcome",
+    ("route", "method", "role", "outcome"),
+)
+ecg_phase_duration = registry.histogram(
+    "heartline_ecg_phase_seconds", "Time spent in the hot sub-phases of ECG handling and persistence",
+    ("phase", "route"),
+)
+
+
+def current_route():
+    """URL rule of the current request; "background" outside requests, "unmatched" for 404s"""
+    if not has_request_context():
+        return "background"
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+@contextmanager
+def time_phase(phase):
+    """Observe the duration of the block in heartline_ecg_phase_seconds (also when it raises)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ecg_phase_duration.observe(time.perf_counter() - started, phase=phase, route=current_route())
+
+
+def time_db_commits():
+    """Observe every Session.commit() (flush included) as the db_commit phase"""
+
+    @event.listens_for(Session, "before_commit")
+    def _before_commit(session):
+        session.info["metrics_commit_started"] = time.perf_counter()
+
+    @event.listens_for(Session, "after_commit")
+    def _after_commit(session):
+        started = session.info.pop("metrics_commit_started", None)
+        if started is not None:
+            ecg_phase_duration.observe(time.perf_counter() - started, phase="db_commit", route=current_route())
+
+
+def outcome(status_code):
+    if status_code >= 500:
+        return "server_error"
+    if status_code >= 400:
+        return "client_error"
+    return "ok"
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, timing every jsonify() response as the json_serialize phase"""
+
+    def response(self, *args, **kwargs):
+        with time_phase("json_serialize"):
+            return super().response(*args, **kwargs)
+
+
+class RequestMetrics:
+    """
+    Record heartline_http_request_* for every request and serve /metrics.
+
+    Args:
+        token: when set, /metrics requires ``Authorization: Bearer <token>``
+    """
+
+    def __init__(self, app=None, token=None):
+        self.token = token
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.json = TimedJSONProvider(app)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule("/metrics", "metrics", self._metrics)
+
+    def _start(self):
+        g.metrics_started = time.perf_counter()
+
+    def _finish(self, response):
+        started = g.pop("metrics_started", None)
+        if started is None or request.endpoint == "metrics":
+            return response
+        # Only a user the view already loaded: reading current_user here would query for it
+        user = g.get("_login_user")
+        role = getattr(user, "role", None) or "anonymous"
+        labels = {
+            "route": current_route(),
+            "method": request.method,
+            "role": role,
+            "outcome": outcome(response.status_code),
+        }
+        request_duration.observe(time.perf_counter() - started, **labels)
+        requests_total.inc(**labels)
+        return response
+
+    def _metrics(self):
+        if self.token and request.headers.get("Authorization") != f"Bearer {self.token}":
+            return Response("Unauthorized\n", status=401, mimetype="text/plain")
+        return Response(registry.render(), content_type=CONTENT_TYPE)
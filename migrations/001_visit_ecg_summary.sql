@@ -0,0 +1,17 @@
+-- Denormalized ECG summary on visit (Visit.ecg_primary_class / ecg_confidence / ecg_analyzed_at).
+-- The app fills these whenever it writes ecg_prediction; rows analyzed before
+-- this migration are filled by backfill_ecg_summary.py.
+--
+--   psql "$DATABASE_URL" -f migrations/001_visit_ecg_summary.sql
+--   python backfill_ecg_summary.py
+--
+-- Indexes are built CONCURRENTLY so the visit table stays writable; psql runs
+-- each statement in its own transaction, which CONCURRENTLY requires.
+
+ALTER TABLE visit ADD COLUMN IF NOT EXISTS ecg_primary_class VARCHAR(10);
+ALTER TABLE visit ADD COLUMN IF NOT EXISTS ecg_confidence FLOAT;
+ALTER TABLE visit ADD COLUMN IF NOT EXISTS ecg_analyzed_at TIMESTAMP WITHOUT TIME ZONE;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_visit_ecg_primary_class ON visit (ecg_primary_class);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_visit_ecg_confidence ON visit (ecg_confidence);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_visit_ecg_analyzed_at ON visit (ecg_analyzed_at);
@@ -0,0 +1,42 @@
+-- Indexes for the foreign keys and timestamp columns the app filters, joins and
+-- sorts on (declared on the models in models.py with the same names).
+--
+--   psql "$DATABASE_URL" -f migrations/002_hot_path_indexes.sql
+--   python check_query_plans.py --database-url postgresql://localhost/heartline_plans --seed
+--
+-- Indexes are built CONCURRENTLY so the tables stay writable; psql runs each
+-- statement in its own transaction, which CONCURRENTLY requires. If a build is
+-- interrupted it leaves an INVALID index behind: drop it and re-run this file.
+
+-- Dashboard: patients registered today / this week
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patient_created_at ON patient (created_at);
+
+-- Appointments: today's schedule and the patient queue (state = ... AND date in a day),
+-- upcoming appointments per doctor, appointments of a patient
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointment_state_date ON appointment (state, date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointment_date ON appointment (date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointment_patient_id ON appointment (patient_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointment_doctor_id ON appointment (doctor_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_waiting_list_entry_patient_id ON waiting_list_entry (patient_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_waiting_list_entry_assigned_doctor ON waiting_list_entry (assigned_doctor);
+
+-- Visits: date ranges (dashboard, charts, history), a patient's and a doctor's
+-- visits by date, follow-ups due, the visit of an appointment
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_visit_visit_date ON visit (visit_date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_visit_patient_id_visit_date ON visit (patient_id, visit_date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_visit_doctor_id_visit_date ON visit (doctor_id, visit_date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_visit_follow_up_date ON visit (follow_up_date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_visit_appointment_id ON visit (appointment_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_visit_document_visit_id ON visit_document (visit_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_prescription_visit_id ON prescription (visit_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_prescription_medicament_num_enr ON prescription (medicament_num_enr);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_doctor_id ON "user" (doctor_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_session_user_id ON user_session (user_id);
+
+ANALYZE patient;
+ANALYZE appointment;
+ANALYZE visit;
+ANALYZE prescription;
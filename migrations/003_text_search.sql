@@ -0,0 +1,44 @@
+-- Indexed, accent- and case-insensitive search (text_search.py).
+--
+--   psql "$DATABASE_URL" -f migrations/003_text_search.sql
+--
+-- Every index is on f_unaccent(lower(column)), the exact expression
+-- text_search.search_key() generates, so the planner can match it:
+--   *_trgm    GIN trigram indexes for LIKE '%word%' (words of 3+ characters)
+--   *_prefix  btree text_pattern_ops indexes for LIKE 'wo%' (1-2 characters)
+-- They are not declared in models.py because they need the extensions below,
+-- which db.create_all() (and SQLite) cannot provide.
+--
+-- Creating extensions needs a superuser or a role allowed to create them.
+-- Indexes are built CONCURRENTLY so the tables stay writable; psql runs each
+-- statement in its own transaction, which CONCURRENTLY requires.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() is only STABLE (its dictionary could change), so it cannot be
+-- used in an index; this wrapper pins the dictionary and is IMMUTABLE.
+CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$;
+
+-- Medicament registry: select2 autocomplete on brand (nom_com) and molecule (nom_dci)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_medicament_nom_com_trgm ON medicament USING gin (f_unaccent(lower(nom_com)) gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_medicament_nom_dci_trgm ON medicament USING gin (f_unaccent(lower(nom_dci)) gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_medicament_nom_com_prefix ON medicament (f_unaccent(lower(nom_com)) text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_medicament_nom_dci_prefix ON medicament (f_unaccent(lower(nom_dci)) text_pattern_ops);
+
+-- Patients: autocomplete, patients table and the name part of visit/appointment search
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patient_first_name_trgm ON patient USING gin (f_unaccent(lower(first_name)) gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patient_last_name_trgm ON patient USING gin (f_unaccent(lower(last_name)) gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patient_first_name_prefix ON patient (f_unaccent(lower(first_name)) text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patient_last_name_prefix ON patient (f_unaccent(lower(last_name)) text_pattern_ops);
+
+-- Visit diagnosis, appointment reason and doctor names
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_visit_diagnosis_trgm ON visit USING gin (f_unaccent(lower(diagnosis)) gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointment_reason_trgm ON appointment USING gin (f_unaccent(lower(reason)) gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_doctor_first_name_trgm ON doctor USING gin (f_unaccent(lower(first_name)) gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_doctor_last_name_trgm ON doctor USING gin (f_unaccent(lower(last_name)) gin_trgm_ops);
+
+ANALYZE medicament;
+ANALYZE patient;
@@ -22,7 +22,7 @@ class Patient(db.Model):
     email            = db.Column(db.String(120), nullable=True, unique=True)
     medical_history  = db.Column(db.Text, nullable=True)
 
-    created_at       = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at       = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at       = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     visits           = db.relationship("Visit", backref="patient", lazy="dynamic")
@@ -49,12 +49,16 @@ class Doctor(db.Model):
 
 class Appointment(db.Model):
     __tablename__ = "appointment"
+    __table_args__ = (
+        # "today's scheduled appointments": equality on state, range on date
+        db.Index("ix_appointment_state_date", "state", "date"),
+    )
     id          = db.Column(db.Integer, primary_key=True)
-    date        = db.Column(db.DateTime, nullable=False)  # scheduled datetime
+    date        = db.Column(db.DateTime, nullable=False, index=True)  # scheduled datetime
     reason      = db.Column(db.String(200), nullable=False)
     state       = db.Column(db.String(20), nullable=False, default="scheduled")  # "scheduled"/"completed"/"canceled"
-    patient_id  = db.Column(db.Integer, db.ForeignKey("patient.id"), nullable=False)
-    doctor_id   = db.Column(db.Integer, db.ForeignKey("doctor.id"), nullable=True)
+    patient_id  = db.Column(db.Integer, db.ForeignKey("patient.id"), nullable=False, index=True)
+    doctor_id   = db.Column(db.Integer, db.ForeignKey("doctor.id"), nullable=True, index=True)
 
     created_at  = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at  = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)    # Relationships
@@ -65,11 +69,11 @@ class Appointment(db.Model):
 class WaitingListEntry(db.Model):
     __tablename__ = "waiting_list_entry"
     id              = db.Column(db.Integer, primary_key=True)
-    patient_id      = db.Column(db.Integer, db.ForeignKey("patient.id"), nullable=False)
+    patient_id      = db.Column(db.Integer, db.ForeignKey("patient.id"), nullable=False, index=True)
     arrival_time    = db.Column(db.DateTime, default=datetime.utcnow)
     status          = db.Column(db.String(15), nullable=False, default="waiting")  # "waiting"/"called"/"in_progress"/"skipped"
     priority        = db.Column(db.SmallInteger, default=5)
-    assigned_doctor = db.Column(db.Integer, db.ForeignKey("doctor.id"), nullable=True)
+    assigned_doctor = db.Column(db.Integer, db.ForeignKey("doctor.id"), nullable=True, index=True)
 
     created_at      = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at      = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -77,17 +81,25 @@ class WaitingListEntry(db.Model):
 
 class Visit(db.Model):
     __tablename__ = "visit"
+    __table_args__ = (
+        # A patient's / a doctor's visits by date (also serve lookups on patient_id / doctor_id alone)
+        db.Index("ix_visit_patient_id_visit_date", "patient_id", "visit_date"),
+        db.Index("ix_visit_doctor_id_visit_date", "doctor_id", "visit_date"),
+    )
     id               = db.Column(db.Integer, primary_key=True)
-    appointment_id   = db.Column(db.Integer, db.ForeignKey("appointment.id"), nullable=True)
+    appointment_id   = db.Column(db.Integer, db.ForeignKey("appointment.id"), nullable=True, index=True)
     patient_id       = db.Column(db.Integer, db.ForeignKey("patient.id"), nullable=False)
     doctor_id        = db.Column(db.Integer, db.ForeignKey("doctor.id"), nullable=True)
-    visit_date       = db.Column(db.DateTime, nullable=False)
+    visit_date       = db.Column(db.DateTime, nullable=False, index=True)
     diagnosis        = db.Column(db.Text, nullable=True)
-    follow_up_date   = db.Column(db.DateTime, nullable=True)
+    follow_up_date   = db.Column(db.DateTime, nullable=True, index=True)
 
     ecg_mat          = db.Column(db.String(256), nullable=True)   # Path to uploaded .mat
     ecg_hea          = db.Column(db.String(256), nullable=True)   # Path to uploaded .hea
     ecg_prediction   = db.Column(JSON, nullable=True)            # e.g. {"AF":0.12, ...}
+    ecg_primary_class= db.Column(db.String(10), nullable=True, index=True)  # highest-probability class in ecg_prediction
+    ecg_confidence   = db.Column(db.Float, nullable=True, index=True)       # ... and its probability
+    ecg_analyzed_at  = db.Column(db.DateTime, nullable=True, index=True)    # when ecg_prediction was last written
 
     payment_total    = db.Column(db.Numeric(10, 2), default=0.00)
     payment_status   = db.Column(db.String(20), default="unpaid")  # "paid"/"partial"/"unpaid"
@@ -96,14 +108,70 @@ class Visit(db.Model):
     created_at       = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at       = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    documents        = db.relationship("VisitDocument", backref="visit", lazy="dynamic")
-    prescriptions    = db.relationship("Prescription", backref="visit", lazy="dynamic")
+    # A visit's own documents/prescriptions are few: plain collections, so
+    # pages can load them with selectinload. Unbounded collections (a
+    # patient's or doctor's visits, a medicament's prescriptions) stay
+    # "dynamic" queries and are counted with subqueries (see serializers.py).
+    documents        = db.relationship("VisitDocument", backref="visit", order_by="VisitDocument.id")
+    prescriptions    = db.relationship("Prescription", backref="visit", order_by="Prescription.id")
+
+    @db.validates("ecg_prediction")
+    def _summarize_ecg_prediction(self, key, prediction):
+        """Keep the ECG summary columns in step with every write of ecg_prediction"""
+        if prediction:
+            primary = max(prediction, key=prediction.get)
+            self.ecg_primary_class = primary
+            self.ecg_confidence = float(prediction[primary])
+            self.ecg_analyzed_at = datetime.utcnow()
+        else:
+            self.ecg_primary_class = None
+            self.ecg_confidence = None
+            self.ecg_analyzed_at = None
+        return prediction
+
+
+class ECGAnalysisJob(db.Model):
+    """
+    Persistent queue entry for background ECG inference on a visit.
+    Survives restarts; failed jobs are retried with backoff and end up
+    in the "dead" state (dead letter) after max_attempts.
+    """
+    __tablename__ = "ecg_analysis_job"
+    id           = db.Column(db.Integer, primary_key=True)
+    visit_id     = db.Column(db.Integer, db.ForeignKey("visit.id"), nullable=False, index=True)
+    status       = db.Column(db.String(20), nullable=False, default="queued", index=True)  # "queued"/"running"/"succeeded"/"dead"/"superseded"
+    attempts     = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # not picked up before this (retry backoff)
+    locked_at    = db.Column(db.DateTime, nullable=True)
+    locked_by    = db.Column(db.String(100), nullable=True)
+    last_error   = db.Column(db.Text, nullable=True)
+    result       = db.Column(JSON, nullable=True)
+
+    created_at   = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at   = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at  = db.Column(db.DateTime, nullable=True)
+
+    visit        = db.relationship("Visit", backref=db.backref("ecg_jobs", lazy="dynamic"))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "visit_id": self.visit_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "last_error": self.last_error,
+            "result": self.result,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
 
 
 class VisitDocument(db.Model):
     __tablename__ = "visit_document"
     id         = db.Column(db.Integer, primary_key=True)
-    visit_id   = db.Column(db.Integer, db.ForeignKey("visit.id"), nullable=False)
+    visit_id   = db.Column(db.Integer, db.ForeignKey("visit.id"), nullable=False, index=True)
     doc_type   = db.Column(db.String(5), nullable=False)     # e.g. "blood"/"mri"/"xray"
     file_path  = db.Column(db.String(256), nullable=False)   # Path to uploaded PDF/image
     notes      = db.Column(db.Text, nullable=True)
@@ -127,8 +195,8 @@ class Medicament(db.Model):
 class Prescription(db.Model):
     __tablename__ = "prescription"
     id                   = db.Column(db.Integer, primary_key=True)
-    visit_id             = db.Column(db.Integer, db.ForeignKey("visit.id"), nullable=False)
-    medicament_num_enr   = db.Column(db.String(50), db.ForeignKey("medicament.num_enr"), nullable=False)
+    visit_id             = db.Column(db.Integer, db.ForeignKey("visit.id"), nullable=False, index=True)
+    medicament_num_enr   = db.Column(db.String(50), db.ForeignKey("medicament.num_enr"), nullable=False, index=True)
     dosage_instructions  = db.Column(db.Text, nullable=False)
     quantity             = db.Column(db.Integer, nullable=False)
 
@@ -179,7 +247,7 @@ class User(UserMixin, db.Model):
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     
     # Optional reference to doctor record (only for doctor users)
-    doctor_id = db.Column(db.Integer, db.ForeignKey("doctor.id"), nullable=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey("doctor.id"), nullable=True, index=True)
     
     # Additional profile information
     first_name = db.Column(db.String(50), nullable=False)
@@ -191,7 +259,7 @@ class User(UserMixin, db.Model):
     last_login = db.Column(db.DateTime, nullable=True)
     
     # Relationship to doctor (for doctor users)
-    doctor = db.relationship("Doctor", backref="user", uselist=False)
+    doctor = db.relationship("Doctor", backref=db.backref("user", uselist=False))
     
     def set_password(self, password):
         """Hash and set password"""
@@ -227,7 +295,7 @@ class UserSession(db.Model):
     """
     __tablename__ = "user_session"
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     session_token = db.Column(db.String(255), unique=True, nullable=False)
     ip_address = db.Column(db.String(45), nullable=True)  # IPv6 support
     user_agent = db.Column(db.Text, nullable=True)
@@ -0,0 +1,168 @@
+"""
+Pagination for the JSON list endpoints without a COUNT(*) per page.
+
+Flask-SQLAlchemy's ``paginate()`` runs the page query plus a full COUNT(*)
+of the filtered query on every request. Here the rows are fetched with
+``LIMIT per_page + 1``: the extra row says whether there is a next page, so
+most endpoints (select2 only needs ``more``) never count. Each endpoint
+picks how much it needs to know about the total:
+
+  TOTAL_NONE      no total at all (autocomplete, infinite scroll)
+  TOTAL_ESTIMATE  PostgreSQL's own estimate: pg_class.reltuples for an
+                  unfiltered table, the planner's row estimate (EXPLAIN) for
+                  a filtered query; an exact count on other databases
+  TOTAL_EXACT     COUNT(*) (small tables, or when page numbers are shown)
+
+Deep pages can use keyset cursors instead of OFFSET (``keyset_page``),
+sharing the cursor format of table_engine. ``per_page`` always goes through
+``clamp_per_page``, so a client cannot ask for the whole table at once.
+"""
+
+import json
+import math
+
+from sqlalchemy import Table
+
+from models import db
+from table_engine import MAX_PER_PAGE, decode_cursor, encode_cursor, seek_condition
+
+TOTAL_NONE = "none"
+TOTAL_ESTIMATE = "estimate"
+TOTAL_EXACT = "exact"
+
+
+def clamp_per_page(per_page, default=10):
+    """``per_page`` from the request, within 1..MAX_PER_PAGE (``default`` when missing or invalid)"""
+    if not per_page or per_page < 1:
+        return default
+    return min(per_page, MAX_PER_PAGE)
+
+
+class Page:
+    """One page of results and what the client needs to ask for the next one"""
+
+    def __init__(self, items, page, per_page, has_more, total=None, total_estimated=False, next_cursor=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.has_more = has_more
+        self.total = total
+        self.total_estimated = total_estimated
+        self.next_cursor = next_cursor
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return None
+        # An estimate may undershoot: never report fewer pages than we know exist
+        return max(math.ceil(self.total / self.per_page), self.page + 1 if self.has_more else self.page)
+
+    def pagination(self):
+        """The ``pagination`` object of the JSON responses"""
+        info = {
+            "page": self.page,
+            "per_page": self.per_page,
+            "more": self.has_more,
+        }
+        if self.next_cursor:
+            info["next_cursor"] = self.next_cursor
+        if self.total is not None:
+            info.update({"total": self.total, "pages": self.pages, "total_estimated": self.total_estimated})
+        return info
+
+
+def estimated_count(query):
+    """
+    Approximate row count of ``query`` on PostgreSQL without counting:
+    reltuples of the table when the query has no WHERE clause, the
+    planner's estimate otherwise. Returns None on other databases or when
+    the table was never analyzed.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name != "postgresql":
+        return None
+    statement = query.order_by(None).statement
+    froms = statement.get_final_froms()
+    if statement.whereclause is None and len(froms) == 1 and isinstance(froms[0], Table):
+        table = froms[0]
+        rows = connection.execute(
+            db.text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": table.name},
+        ).scalar()
+    else:
+        compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+        plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        rows = plan[0]["Plan"]["Plan Rows"]
+    return int(rows) if rows is not None and rows >= 0 else None
+
+
+def _total(query, mode):
+    if mode == TOTAL_ESTIMATE:
+        estimate = estimated_count(query)
+        if estimate is not None:
+            return estimate, True
+        mode = TOTAL_EXACT
+    if mode == TOTAL_EXACT:
+        return query.order_by(None).count(), False
+    return None, False
+
+
+def offset_page(query, page=1, per_page=10, total=TOTAL_NONE):
+    """
+    Page ``page`` (1-based) of an ordered ``query``, fetched with
+    LIMIT per_page + 1 OFFSET (page - 1) * per_page.
+    """
+    page = max(page or 1, 1)
+    rows = query.limit(per_page + 1).offset((page - 1) * per_page).all()
+    count, estimated = _total(query, total)
+    return Page(rows[:per_page], page, per_page, len(rows) > per_page, count, estimated)
+
+
+def keyset_page(query, keys, cursor=None, per_page=10, total=TOTAL_NONE):
+    """
+    The page after ``cursor`` of the entity ``query`` (which must not be
+    ordered yet), ordered by ``keys`` [(name, expression, descending)]
+    whose last key is unique and none is NULL. Raises ValueError for a
+    cursor from another ordering.
+
+    Entity queries yield the entities; queries with extra columns yield
+    their rows (with the keys appended as ``_key_N`` columns).
+    """
+    sort = ",".join(("-" if descending else "") + name for name, _, descending in keys)
+    ordering = [(expression, descending) for _, expression, descending in keys]
+    paged = query
+    if cursor:
+        paged = paged.filter(seek_condition(ordering, decode_cursor(cursor, sort, len(keys))))
+    single_entity = len(query.column_descriptions) == 1 and isinstance(query.column_descriptions[0]["type"], type)
+    paged = paged.add_columns(*[expression.label(f"_key_{i}") for i, (expression, _) in enumerate(ordering)])
+    paged = paged.order_by(*[expression.desc() if descending else expression.asc() for expression, descending in ordering])
+    rows = paged.limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = encode_cursor(sort, list(rows[-1][-len(keys):])) if has_more else None
+    count, estimated = _total(query, total)
+    items = [row[0] for row in rows] if single_entity else rows
+    return Page(items, 1, per_page, has_more, count, estimated, next_cursor)
+
+
+def page_from_args(query, args, keys=None, default_per_page=10, total=TOTAL_NONE):
+    """
+    Page of ``query`` for request ``args`` (page, per_page, cursor).
+
+    With ``keys`` the rows are ordered by them and served by keyset from the
+    first page on (``cursor`` continues; a ``page`` number without a cursor
+    falls back to OFFSET); without ``keys`` the query must already be
+    ordered and is paged by OFFSET.
+    """
+    per_page = clamp_per_page(args.get("per_page", type=int), default_per_page)
+    page = args.get("page", 1, type=int)
+    cursor = args.get("cursor") or None
+    if keys and (cursor or page <= 1):
+        return keyset_page(query, keys, cursor, per_page, total)
+    if keys:
+        query = query.order_by(*[expression.desc() if descending else expression.asc()
+                                 for _, expression, descending in keys])
+    return offset_page(query, page, per_page, total)
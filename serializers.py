@@ -0,0 +1,166 @@
+"""
+JSON list endpoints (/api/patients, /api/visits, /api/appointments,
+/api/doctors), each page built from one SELECT.
+
+Every ``*_list`` function below selects up front everything its serializer
+reads, instead of letting the ORM fetch it row by row:
+
+  - related rows shown with each item (a visit's patient, an appointment's
+    patient and doctor, a doctor's user account) are joined into the page
+    query and loaded with contains_eager / joinedload;
+  - child counts (a patient's visits, a visit's prescriptions and documents)
+    are correlated COUNT subqueries in the SELECT list, served by the
+    foreign key indexes.
+
+A page therefore runs the same statements whatever its size: the page
+SELECT, plus the total (estimate or count) where the endpoint reports one.
+check_query_counts.py verifies this for every endpoint.
+
+Each function takes the request args and returns (pagination.Page, list of
+JSON dicts); invalid arguments raise ValueError.
+"""
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import contains_eager, joinedload
+
+from models import Appointment, Doctor, Patient, Prescription, Visit, VisitDocument
+from pagination import TOTAL_ESTIMATE, page_from_args
+from text_search import text_search
+
+
+def count_of(child_key, parent_key, label):
+    """Correlated ``SELECT count(*)`` of the child rows whose ``child_key`` is ``parent_key``"""
+    return (
+        select(func.count())
+        .where(child_key == parent_key)
+        .correlate(parent_key.class_)
+        .scalar_subquery()
+        .label(label)
+    )
+
+
+def _timestamp(value):
+    return value.strftime('%Y-%m-%d %H:%M') if value else None
+
+
+# ---------- patients ----------
+
+def patient_list(args):
+    """Patients, newest first (best matches first for ``search``), with their visit count"""
+    search = args.get('search', '', type=str).strip()
+    query = Patient.query.add_columns(count_of(Visit.patient_id, Patient.id, "visits_count"))
+    query = text_search(query, [Patient.first_name, Patient.last_name], search)
+    if search:
+        query = query.order_by(Patient.id.desc())
+    keys = None if search else [("id", Patient.id, True)]
+
+    page = page_from_args(query, args, keys, total=TOTAL_ESTIMATE)
+    return page, [patient_json(row[0], row.visits_count) for row in page.items]
+
+
+def patient_json(p, visits_count):
+    return {
+        'id': p.id,
+        'first_name': p.first_name,
+        'last_name': p.last_name,
+        'date_of_birth': p.date_of_birth.strftime('%Y-%m-%d') if p.date_of_birth else None,
+        'gender': p.gender,
+        'phone': p.phone,
+        'email': p.email,
+        'created_at': _timestamp(p.created_at),
+        'visits_count': visits_count,
+    }
+
+
+# ---------- visits ----------
+
+def visit_list(args):
+    """Visits, latest first (best matches first for ``search``), with patient and child counts"""
+    search = args.get('search', '', type=str).strip()
+    query = (
+        Visit.query.join(Visit.patient)
+        .options(contains_eager(Visit.patient))
+        .add_columns(
+            count_of(Prescription.visit_id, Visit.id, "prescriptions_count"),
+            count_of(VisitDocument.visit_id, Visit.id, "documents_count"),
+        )
+    )
+    if search:
+        query = text_search(
+            query, [Patient.first_name, Patient.last_name, Visit.diagnosis], search,
+        ).order_by(Visit.visit_date.desc(), Visit.id.desc())
+    keys = None if search else [("visit_date", Visit.visit_date, True), ("id", Visit.id, True)]
+
+    page = page_from_args(query, args, keys, total=TOTAL_ESTIMATE)
+    return page, [visit_json(row[0], row.prescriptions_count, row.documents_count) for row in page.items]
+
+
+def visit_json(v, prescriptions_count, documents_count):
+    return {
+        'id': v.id,
+        'patient_name': f"{v.patient.first_name} {v.patient.last_name}",
+        'visit_date': _timestamp(v.visit_date),
+        'diagnosis': v.diagnosis,
+        'payment_status': v.payment_status,
+        'created_at': _timestamp(v.created_at),
+        'prescriptions_count': prescriptions_count,
+        'documents_count': documents_count,
+    }
+
+
+# ---------- appointments ----------
+
+def appointment_list(args):
+    """Appointments, latest first (best matches first for ``search``), with patient and doctor"""
+    search = args.get('search', '', type=str).strip()
+    query = (
+        Appointment.query.join(Appointment.patient).outerjoin(Appointment.doctor)
+        .options(contains_eager(Appointment.patient), contains_eager(Appointment.doctor))
+    )
+    if search:
+        query = text_search(
+            query,
+            [Patient.first_name, Patient.last_name, Doctor.first_name, Doctor.last_name, Appointment.reason],
+            search,
+        ).order_by(Appointment.date.desc(), Appointment.id.desc())
+    keys = None if search else [("date", Appointment.date, True), ("id", Appointment.id, True)]
+
+    page = page_from_args(query, args, keys, total=TOTAL_ESTIMATE)
+    return page, [appointment_json(a) for a in page.items]
+
+
+def appointment_json(a):
+    return {
+        'id': a.id,
+        'patient_name': f"{a.patient.first_name} {a.patient.last_name}",
+        'doctor_name': f"Dr. {a.doctor.first_name} {a.doctor.last_name}" if a.doctor else "No doctor assigned",
+        'date': _timestamp(a.date),
+        'reason': a.reason,
+        'state': a.state,
+        'created_at': _timestamp(a.created_at),
+    }
+
+
+# ---------- doctors ----------
+
+def doctor_list():
+    """Every doctor (a short reference list, not paginated) with their user account"""
+    doctors = (
+        Doctor.query.options(joinedload(Doctor.user))
+        .order_by(Doctor.last_name, Doctor.first_name, Doctor.id)
+        .all()
+    )
+    return [doctor_json(d) for d in doctors]
+
+
+def doctor_json(d):
+    return {
+        'id': d.id,
+        'first_name': d.first_name,
+        'last_name': d.last_name,
+        'specialty': d.specialty,
+        'phone': d.phone,
+        'email': d.email,
+        'user_id': d.user.id if d.user else None,
+        'username': d.user.username if d.user else None,
+    }
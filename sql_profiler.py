@@ -0,0 +1,243 @@
+"""
+Per-request SQL instrumentation: how many statements a request ran, how long
+they spent in the database, and which ones were slowest or repeated.
+
+Every statement is timed by listeners on SQLAlchemy's
+``before_cursor_execute`` / ``after_cursor_execute`` events and recorded
+in the current request's ``QueryLog`` (and in any ``capture()`` block
+open on the thread). At the end of each request ``SQLProfiler``:
+
+  - adds ``Server-Timing: db;dur=<ms>;desc="<n> queries", total;dur=<ms>``,
+    which the browser devtools show next to the request;
+  - logs one JSON line on the ``heartline.sql`` logger (the slowest and
+    the most repeated statements are included when the request is over
+    its query budget or its database time is over ``slow_ms``);
+  - keeps the last requests for the ``/debug/queries`` view, which is only
+    registered when enabled (development).
+
+Statements are grouped by their normalized SQL (literals and parameters
+replaced by ``?``, IN lists collapsed), so the same SELECT run once per row
+shows up as one entry with a high count: the signature of an N+1 query.
+
+Budgets: ``@query_budget(n)`` (placed right under ``@app.route``) sets the
+most statements a view may run, the app-wide default applies otherwise.
+Going over logs a warning; with ``strict=True`` (tests) the request raises
+``QueryBudgetExceeded`` instead. ``capture(budget=n)`` does the same around
+any block of code, e.g. in check_query_counts.py.
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("heartline.sql")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PARAMETER = re.compile(r"%\(\w+\)s|%s|(?<!:):\w+|\$\d+")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(statement):
+    """``statement`` with literals and parameters as ``?``, IN lists collapsed and whitespace folded"""
+    sql = _STRING.sub("?", statement)
+    sql = _PARAMETER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("(?)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """More statements ran than the budget allows (raised in strict mode and by capture())"""
+
+
+class QueryLog:
+    """Statements run by one request or one capture() block"""
+
+    def __init__(self, keep_slowest=5):
+        self.count = 0
+        self.total_ms = 0.0
+        self.keep_slowest = keep_slowest
+        self.statements = Counter()   # normalized SQL -> executions
+        self._slowest = []            # min-heap of (ms, sequence, normalized SQL)
+        self._sequence = itertools.count()
+
+    def record(self, statement, elapsed_ms):
+        sql = normalize_sql(statement)
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.statements[sql] += 1
+        entry = (elapsed_ms, next(self._sequence), sql)
+        if len(self._slowest) < self.keep_slowest:
+            heapq.heappush(self._slowest, entry)
+        elif entry > self._slowest[0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def slowest(self):
+        """[{"sql", "ms"}] slowest first"""
+        return [{"sql": sql, "ms": round(ms, 2)} for ms, _, sql in sorted(self._slowest, reverse=True)]
+
+    def repeated(self, min_count=2, limit=5):
+        """[{"sql", "count"}] statements run at least ``min_count`` times, most repeated first"""
+        return [{"sql": sql, "count": n} for sql, n in self.statements.most_common(limit) if n >= min_count]
+
+    def to_dict(self):
+        return {
+            "queries": self.count,
+            "db_ms": round(self.total_ms, 2),
+            "distinct": len(self.statements),
+            "slowest": self.slowest(),
+            "repeated": self.repeated(),
+        }
+
+
+# ---------- statement timing ----------
+
+_captures = threading.local()
+
+
+def _active_logs():
+    logs = list(getattr(_captures, "stack", ()))
+    if has_request_context():
+        request_log = g.get("sql_queries")
+        if request_log is not None:
+            logs.append(request_log)
+    return logs
+
+
+# The start time is kept on the statement's execution context, not the
+# connection: after_cursor_execute does not fire for a failing statement, and
+# a per-connection entry would then be paired with a later statement
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    if started is None:
+        return
+    del context._query_started
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    for log in _active_logs():
+        log.record(statement, elapsed_ms)
+
+
+@contextmanager
+def capture(budget=None):
+    """
+    Record the statements run on this thread inside the block::
+
+        with capture(budget=2) as log:
+            patient_list(args)
+        log.count, log.total_ms, log.repeated()
+
+    Raises QueryBudgetExceeded on exit when more than ``budget`` ran.
+    """
+    log = QueryLog()
+    stack = _captures.__dict__.setdefault("stack", [])
+    stack.append(log)
+    try:
+        yield log
+    finally:
+        stack.remove(log)
+    if budget is not None and log.count > budget:
+        raise QueryBudgetExceeded(f"{log.count} statements, budget {budget}: {log.repeated() or log.slowest()}")
+
+
+def query_budget(n):
+    """Most SQL statements the decorated view may run per request"""
+    def decorator(view):
+        view.query_budget = n
+        return view
+    return decorator
+
+
+# ---------- Flask integration ----------
+
+class SQLProfiler:
+    """
+    Args:
+        budget: default statements per request (None: no budget)
+        strict: raise QueryBudgetExceeded when a request goes over its budget
+        slow_ms: database time per request above which the statements are logged
+        debug_view: register /debug/queries (development only)
+        history: requests kept for /debug/queries
+    """
+
+    def __init__(self, app=None, budget=None, strict=False, slow_ms=200.0, debug_view=False, history=100):
+        self.budget = budget
+        self.strict = strict
+        self.slow_ms = slow_ms
+        self.debug_view = debug_view
+        self.recent = deque(maxlen=history)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        if self.debug_view:
+            app.add_url_rule("/debug/queries", "debug_queries", self._debug_queries)
+
+    def _budget_for(self, app, endpoint):
+        view = app.view_functions.get(endpoint)
+        return getattr(view, "query_budget", self.budget)
+
+    def _start(self):
+        g.sql_queries = QueryLog()
+        g.sql_request_started = time.perf_counter()
+
+    def _finish(self, response):
+        log = g.pop("sql_queries", None)
+        if log is None:
+            return response
+        request_ms = (time.perf_counter() - g.pop("sql_request_started")) * 1000.0
+        response.headers.add(
+            "Server-Timing", f'db;dur={log.total_ms:.2f};desc="{log.count} queries", total;dur={request_ms:.2f}'
+        )
+
+        budget = self._budget_for(current_app, request.endpoint)
+        over_budget = budget is not None and log.count > budget
+        entry = {
+            "event": "request_sql",
+            "method": request.method,
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "queries": log.count,
+            "db_ms": round(log.total_ms, 2),
+            "request_ms": round(request_ms, 2),
+        }
+        if budget is not None:
+            entry["budget"] = budget
+        if over_budget or log.total_ms >= self.slow_ms:
+            entry.update(slowest=log.slowest(), repeated=log.repeated())
+        logger.log(logging.WARNING if over_budget else logging.INFO, json.dumps(entry))
+
+        if self.debug_view and request.endpoint != "debug_queries":
+            self.recent.append(dict(entry, **log.to_dict()))
+        if over_budget and self.strict:
+            raise QueryBudgetExceeded(
+                f"{request.method} {request.path}: {log.count} statements, budget {budget}: {log.repeated() or log.slowest()}"
+            )
+        return response
+
+    def _debug_queries(self):
+        """Recent requests with their statement counts, newest first (?path= filters by path prefix)"""
+        prefix = request.args.get("path", "")
+        requests = [entry for entry in reversed(self.recent) if entry["path"].startswith(prefix)]
+        return jsonify({"requests": requests, "budget": self.budget, "slow_ms": self.slow_ms})
@@ -28,10 +28,9 @@ class ECGEditFormHandler extends ECGFormSubmissionHandler {
           }
           // Render the diagnosis & probabilities
           this.displayAnalysisResults(data);
-          // STEP B: Now get waveform data
-          return fetch(`/ecg_waveform_by_visit/${visitId}`);
+          // STEP B: Now get waveform data (binary frame, decoded by ecg_form.js)
+          return fetchECGWaveform(`/ecg_waveform_by_visit/${visitId}?max_points=${ECG_PLOT_MAX_POINTS}`);
         })
-        .then(r => r.json())
         .then(wf => {
           if (!wf.success) {
             throw new Error(wf.error || 'Waveform load failed');
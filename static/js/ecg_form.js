@@ -1,5 +1,75 @@
 'use strict';
 
+/**
+ * Binary ECG waveform support (see ecg_waveform.py for the frame layout).
+ * Requesting ECG_WAVEFORM_MIMETYPE gets raw little-endian samples instead of
+ * JSON float lists; the time axis is rebuilt here from t0 and fs.
+ */
+const ECG_WAVEFORM_MIMETYPE = 'application/vnd.heartline.ecg-waveform';
+// ~2 points per horizontal pixel of a 30 s strip at 25 mm/s (100 px/s);
+// sent as ?max_points= so the server min-max decimates long records
+const ECG_PLOT_MAX_POINTS = 6000;
+
+function decodeECGWaveform(buffer) {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+  if (magic !== 'ECGW' || view.getUint8(4) !== 1) {
+    throw new Error('Unsupported ECG waveform format');
+  }
+  const encoding   = view.getUint8(5);
+  const headerLen  = view.getUint32(8, true);
+  const header     = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, headerLen)));
+  const nLeads     = header.n_leads;
+  const nSamples   = header.n_samples;
+  const offset     = 12 + headerLen;
+  const scale      = header.scale || 1;
+
+  const signals = [];
+  for (let lead = 0; lead < nLeads; lead++) {
+    const out = new Float32Array(nSamples);
+    if (encoding === 1) {
+      const raw = new Float32Array(buffer, offset + lead * nSamples * 4, nSamples);
+      for (let i = 0; i < nSamples; i++) out[i] = raw[i] * scale;
+    } else {
+      const raw = new Int16Array(buffer, offset + lead * nSamples * 2, nSamples);
+      const gain = header.gain[lead];
+      const baseline = header.baseline[lead];
+      for (let i = 0; i < nSamples; i++) out[i] = ((raw[i] - baseline) / gain) * scale;
+    }
+    signals.push(out);
+  }
+
+  const t0 = header.t0 || 0;
+  const time = Array.from({ length: nSamples }, (_, i) => t0 + i / header.fs);
+  return {
+    time: time,
+    signals: signals,
+    sampling_rate: header.fs,
+    duration: nSamples / header.fs,
+    t_start: t0,
+    lead_names: header.lead_names,
+    n_leads: nLeads,
+    leads: nLeads
+  };
+}
+
+function fetchECGWaveform(url, options) {
+  const opts = Object.assign({}, options || {});
+  opts.headers = Object.assign({ 'Accept': ECG_WAVEFORM_MIMETYPE + ', application/json;q=0.5' }, opts.headers || {});
+  return fetch(url, opts).then(response => {
+    const type = response.headers.get('Content-Type') || '';
+    if (response.ok && type.indexOf(ECG_WAVEFORM_MIMETYPE) === 0) {
+      return response.arrayBuffer().then(buf => ({ success: true, ecg_data: decodeECGWaveform(buf) }));
+    }
+    return response.json().then(data => {
+      if (!response.ok) {
+        throw new Error(data.error || `Server returned ${response.status} for waveform`);
+      }
+      return data;
+    });
+  });
+}
+
 /**
  * ECG Form Submission Script
  * Handles ECG file upload and real-time analysis for NEW visit forms
@@ -274,6 +344,7 @@ displayECGWaveform() {
 
   // Plot dimensions (px)
   const totalSec  = data.duration;             // e.g. 15.0 s
+  const t0        = data.t_start || 0;         // viewport start when windowed
   const boxesHorz = totalSec / 0.04;           // small boxes across
   const plotW     = boxesHorz * SMALL_BOX;     // px width
   const plotH     = 30 * SMALL_BOX;            // ±1.5 mV => 30 mm
@@ -338,7 +409,7 @@ displayECGWaveform() {
 
   // 3) ECG trace
   const pts = data.time.map((t,i) => {
-    const x = M_LEFT + (t/totalSec) * plotW;
+    const x = M_LEFT + ((t - t0)/totalSec) * plotW;
     const y = M_TOP + plotH - ((data.signals[this.currentLead][i] + 1.5)/3) * plotH;
     return `${x},${y}`;
   }).join(' ');
@@ -461,17 +532,7 @@ drawGrid(ctx, width, height, offsetX, offsetY, small, large) {
     formData.append('mat_file', matFile);
     formData.append('hea_file', heaFile);
 
-    fetch('/ecg_waveform_data', { method: 'POST', body: formData })
-      .then(response => {
-        if (!response.ok) {
-          return response.json().then(errData => {
-            throw new Error(errData.error || `Server returned ${response.status} for waveform`);
-          }).catch(() => {
-            throw new Error(`Server returned ${response.status} for waveform`);
-          });
-        }
-        return response.json();
-      })
+    fetchECGWaveform('/ecg_waveform_data', { method: 'POST', body: formData })
       .then(data => {
         this.hideWaveformLoading();
         if (data.success && data.ecg_data) {
@@ -0,0 +1,343 @@
+"""
+Server-side table engine for the list pages (patients, visits, appointments,
+ECG history).
+
+A ``TableSpec`` describes one table: its base query, the expressions it may
+be sorted on (a whitelist, so request input never reaches ORDER BY), named
+sort presets for the page's "Sort By" select, and the filter parameters that
+translate request arguments into WHERE clauses. ``paginate_table`` applies
+them to a request and returns one bounded page using keyset (seek)
+pagination::
+
+    WHERE (k1, k2, id) > (:k1, :k2, :id)    -- expanded per sort direction
+    ORDER BY k1, k2, id
+    LIMIT per_page + 1
+
+The cursor carries the sort values of the last row shown, so page 50 costs
+the same as page 1 (no OFFSET scan), and no COUNT(*) is run: the extra row
+only tells us whether there is a next page.
+
+Sort expressions must never be NULL (wrap nullable columns in coalesce),
+otherwise rows holding NULL keys fall out of the seek comparison.
+"""
+
+import base64
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import and_, or_
+
+from text_search import matches_words
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 100
+
+
+class TableSpec:
+    """
+    Args:
+        query: base query (ORM entity or column rows), without ORDER BY/LIMIT
+        sorts: {name: SQL expression} the table may be ordered by
+        tiebreaker: name in ``sorts`` of a unique column (the primary key),
+            appended to every ordering so the seek position is exact
+        presets: {preset: "field,-field"} named orderings for the Sort By select
+        default_sort: preset or sort string used when the request has none
+        filters: {request arg: fn(query, value) -> query}; fn raises
+            ValueError on malformed input
+    """
+
+    def __init__(self, query, sorts, tiebreaker="id", presets=None, default_sort=None, filters=None):
+        if tiebreaker not in sorts:
+            raise ValueError(f"Tiebreaker {tiebreaker} must be a sortable column")
+        self.query = query
+        self.sorts = sorts
+        self.tiebreaker = tiebreaker
+        self.presets = presets or {}
+        self.default_sort = default_sort or f"-{tiebreaker}"
+        self.filters = filters or {}
+
+
+class TablePage:
+    """One page of a table, plus what is needed to link to the next one"""
+
+    def __init__(self, rows, has_more, next_cursor, sort, per_page, filters, cursor=None):
+        self.rows = rows
+        self.has_more = has_more
+        self.next_cursor = next_cursor
+        self.sort = sort
+        self.per_page = per_page
+        self.filters = filters
+        self.cursor = cursor
+
+    @property
+    def args(self):
+        """Request args reproducing this table view from its first page (for url_for)"""
+        args = dict(self.filters)
+        args["sort"] = self.sort
+        if self.per_page != DEFAULT_PER_PAGE:
+            args["per_page"] = self.per_page
+        return args
+
+    def to_dict(self, serialize):
+        return {
+            "rows": [serialize(row) for row in self.rows],
+            "has_more": self.has_more,
+            "next_cursor": self.next_cursor,
+            "sort": self.sort,
+            "per_page": self.per_page,
+            "filters": self.filters,
+        }
+
+
+# ----------------------------------------
+# Filters
+# ----------------------------------------
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError(f"Invalid date: {value} (expected YYYY-MM-DD)")
+
+
+def date_from(column):
+    """Filter on a DateTime column: on or after the given day"""
+    def apply(query, value):
+        return query.filter(column >= datetime.combine(parse_date(value), time.min))
+    return apply
+
+
+def date_to(column):
+    """
+    Filter on a DateTime column: up to and including the given day, as the
+    half-open ``column < next day`` so an index on the column stays usable.
+    """
+    def apply(query, value):
+        return query.filter(column < datetime.combine(parse_date(value) + timedelta(days=1), time.min))
+    return apply
+
+
+def day_range(column, day, days=1):
+    """
+    ``column`` falls on ``day`` (or within ``days`` days from it), as the
+    half-open range ``day 00:00 <= column < next day 00:00`` rather than
+    ``date(column) == day``, which no index on the column can serve.
+    """
+    start = datetime.combine(day, time.min)
+    return and_(column >= start, column < start + timedelta(days=days))
+
+
+def one_of(column, choices):
+    """Filter on equality with one of a fixed set of values"""
+    def apply(query, value):
+        if value not in choices:
+            raise ValueError(f"Invalid value: {value}")
+        return query.filter(column == value)
+    return apply
+
+
+def equal_to(column, cast=int):
+    """Filter on equality with a typed value (e.g. a foreign key id)"""
+    def apply(query, value):
+        try:
+            bound = cast(value)
+        except ValueError:
+            raise ValueError(f"Invalid value: {value}")
+        return query.filter(column == bound)
+    return apply
+
+
+def contains_words(*columns):
+    """
+    Every whitespace-separated word must appear in one of the columns,
+    ignoring case and accents (text_search.matches_words, index-backed).
+    """
+    def apply(query, value):
+        condition = matches_words(columns, value)
+        return query if condition is None else query.filter(condition)
+    return apply
+
+
+def at_least(expression, cast=float):
+    """Filter on ``expression >= value``"""
+    def apply(query, value):
+        try:
+            bound = cast(value)
+        except ValueError:
+            raise ValueError(f"Invalid number: {value}")
+        return query.filter(expression >= bound)
+    return apply
+
+
+# ----------------------------------------
+# Sorting and cursors
+# ----------------------------------------
+
+def parse_sort(spec, value):
+    """
+    Resolve a preset name or a "field,-field" string against the whitelist.
+    Returns [(name, descending)], always ending with the tiebreaker.
+    """
+    value = spec.presets.get(value, value)
+    fields = []
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name = part.lstrip("+-")
+        if name not in spec.sorts:
+            raise ValueError(f"Cannot sort by: {name}")
+        if name not in [n for n, _ in fields]:
+            fields.append((name, part.startswith("-")))
+    if not fields:
+        raise ValueError("Empty sort")
+    if spec.tiebreaker not in [n for n, _ in fields]:
+        fields.append((spec.tiebreaker, fields[0][1]))
+    return fields
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "dec" in value:
+            try:
+                return Decimal(value["dec"])
+            except InvalidOperation:
+                raise ValueError("Invalid cursor value")
+        raise ValueError("Invalid cursor value")
+    # Only scalars reach the bound parameters: a forged list or object would fail in the database
+    if value is not None and not isinstance(value, (str, int, float, bool)):
+        raise ValueError("Invalid cursor value")
+    return value
+
+
+def encode_cursor(sort, values):
+    payload = json.dumps({"s": sort, "v": [_encode_value(v) for v in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, sort, n_keys):
+    """Sort values stored in a cursor; the cursor must come from the same ordering"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw.decode("utf-8"))
+        if not isinstance(payload["v"], list):
+            raise ValueError("Invalid cursor")
+        values = [_decode_value(v) for v in payload["v"]]
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+    if payload.get("s") != sort or len(values) != n_keys:
+        raise ValueError("Cursor does not match the current sort order")
+    return values
+
+
+def _coerce_key_value(expression, value):
+    """
+    Cursor ``value`` as the Python type of the sort key ``expression``, so a
+    forged cursor fails here (ValueError) rather than in the database.
+    """
+    if value is None:
+        return None
+    try:
+        python_type = expression.type.python_type
+    except NotImplementedError:
+        return value
+    if isinstance(value, python_type) and (python_type is bool or not isinstance(value, bool)):
+        return value
+    try:
+        if python_type in (datetime, date) and isinstance(value, str):
+            return python_type.fromisoformat(value)
+        if python_type is int and isinstance(value, str):
+            return int(value)
+        if python_type in (float, Decimal) and isinstance(value, (int, float, str)) and not isinstance(value, bool):
+            return python_type(value)
+    except (ValueError, ArithmeticError):
+        pass
+    raise ValueError("Invalid cursor value")
+
+
+def seek_condition(keys, values):
+    """
+    Rows strictly after ``values`` in the ordering ``keys`` ([(expr, descending)]):
+    (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ... with < for descending keys.
+    Raises ValueError when a value does not fit the type of its key.
+    """
+    values = [_coerce_key_value(expression, value) for (expression, _), value in zip(keys, values)]
+    clauses = []
+    for i, ((expression, descending), value) in enumerate(zip(keys, values)):
+        equal = [k == v for (k, _), v in zip(keys[:i], values[:i])]
+        after = expression < value if descending else expression > value
+        clauses.append(and_(*equal, after))
+    return or_(*clauses)
+
+
+def parse_per_page(value):
+    if not value:
+        return DEFAULT_PER_PAGE
+    try:
+        per_page = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid per_page: {value}")
+    return min(max(per_page, 1), MAX_PER_PAGE)
+
+
+def apply_filters(spec, query, args):
+    """
+    Apply the spec's filters present in ``args`` to ``query`` (which may be
+    another query over the same tables, e.g. an export).
+    Returns (query, {name: value} of the filters applied).
+    """
+    filters = {}
+    for name, apply in spec.filters.items():
+        value = (args.get(name) or "").strip()
+        if value:
+            query = apply(query, value)
+            filters[name] = value
+    return query, filters
+
+
+def paginate_table(spec, args):
+    """
+    Run one page of ``spec`` for request ``args`` (sort, cursor, per_page and
+    the spec's filter names). Raises ValueError on invalid arguments.
+
+    Entity queries yield the entities; column queries yield their rows (with
+    the sort keys appended as extra ``_sort_N`` columns).
+    """
+    sort = (args.get("sort") or "").strip() or spec.default_sort
+    fields = parse_sort(spec, sort)
+    per_page = parse_per_page(args.get("per_page"))
+
+    query, filters = apply_filters(spec, spec.query, args)
+
+    keys = [(spec.sorts[name], descending) for name, descending in fields]
+    cursor = args.get("cursor") or None
+    if cursor:
+        query = query.filter(seek_condition(keys, decode_cursor(cursor, sort, len(keys))))
+
+    single_entity = len(query.column_descriptions) == 1 and isinstance(query.column_descriptions[0]["type"], type)
+    query = query.add_columns(*[expression.label(f"_sort_{i}") for i, (expression, _) in enumerate(keys)])
+    query = query.order_by(*[expression.desc() if descending else expression.asc() for expression, descending in keys])
+    fetched = query.limit(per_page + 1).all()
+
+    has_more = len(fetched) > per_page
+    fetched = fetched[:per_page]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(sort, list(fetched[-1][-len(keys):]))
+    rows = [row[0] for row in fetched] if single_entity else fetched
+    return TablePage(rows, has_more, next_cursor, sort, per_page, filters, cursor)
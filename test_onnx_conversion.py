@@ -143,6 +143,47 @@ def compare_pytorch_onnx():
         print(f"❌ Error comparing models: {e}")
         return False
 
+def test_quantized_variants():
+    """Check published INT8 variants (convert_to_onnx.py --quantize) against FP32"""
+    
+    try:
+        import json
+        import onnxruntime as ort
+        from ecg_sessions import MODEL_VARIANTS, model_variant_path, variant_report_path
+    except ImportError:
+        return True
+    
+    fp32_path = "resnet34_model.onnx"
+    variants = [v for v in MODEL_VARIANTS if v != "fp32" and os.path.exists(model_variant_path(fp32_path, v))]
+    if not variants:
+        print("\nℹ️  No quantized variants published (run convert_to_onnx.py --quantize all --calibration-dir ...)")
+        return True
+    
+    print("\nChecking quantized variants...")
+    test_input = np.random.randn(2, 12, 15000).astype(np.float32)
+    fp32_session = ort.InferenceSession(fp32_path)
+    input_name = fp32_session.get_inputs()[0].name
+    fp32_probs = 1 / (1 + np.exp(-fp32_session.run(None, {input_name: test_input})[0]))
+    
+    all_ok = True
+    for variant in variants:
+        path = model_variant_path(fp32_path, variant)
+        try:
+            session = ort.InferenceSession(path)
+            probs = 1 / (1 + np.exp(-session.run(None, {input_name: test_input})[0]))
+            assert probs.shape == fp32_probs.shape, f"Expected {fp32_probs.shape}, got {probs.shape}"
+            
+            with open(variant_report_path(path), "r", encoding="utf-8") as fh:
+                report = json.load(fh)
+            print(f"✅ {variant}: {os.path.getsize(path) / 1e6:.1f} MB, "
+                  f"gate max Δ {report['max']:.4f} on {report['records']} records (tolerance {report['tolerance']})")
+            print(f"   Random-input max difference vs FP32: {np.max(np.abs(probs - fp32_probs)):.4f}")
+        except Exception as e:
+            print(f"❌ {variant}: {e}")
+            all_ok = False
+    
+    return all_ok
+
 def check_app_readiness():
     """Check if the app is ready for ONNX deployment"""
     
@@ -202,6 +243,9 @@ if __name__ == "__main__":
         # Compare with PyTorch if available
         compare_pytorch_onnx()
         
+        # Check INT8 variants if any were published
+        test_quantized_variants()
+        
         # Check deployment readiness
         check_app_readiness()
     else:
@@ -0,0 +1,174 @@
+"""
+Accent- and case-insensitive search for the autocomplete and table search
+boxes (patients, medicaments, visits, appointments), ranked by trigram
+similarity.
+
+Columns are compared through ``search_key(column)`` = f_unaccent(lower(column)),
+the expression the PostgreSQL indexes of migrations/003_text_search.sql are
+built on:
+
+  - words of 3+ characters match anywhere (``LIKE '%word%'``), served by
+    pg_trgm GIN indexes instead of a sequential scan per keystroke;
+  - a term made only of 1-2 character words matches prefixes
+    (``LIKE 'wo%'``), served by text_pattern_ops btree indexes (trigrams
+    cannot help that short).
+
+Results are ordered by pg_trgm ``similarity()`` to the search term, so
+"doliprane" ranks the exact name above names that merely contain it.
+
+SQLite (local dev) has neither function: f_unaccent and similarity are
+registered on every SQLite connection as Python functions with the same
+behaviour, so the same queries run there (without indexes).
+
+On a PostgreSQL database where the migration has not run (it needs a role
+allowed to create the extensions), the first connection of each engine
+finds f_unaccent and similarity missing, and the expressions fall back to
+lower(column) (case-insensitive only) and no ranking instead of failing.
+"""
+
+import re
+import sqlite3
+import unicodedata
+
+from sqlalchemy import Float, String, and_, event, func, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+MAX_WORDS = 5
+MIN_SUBSTRING_LENGTH = 3
+
+# Letters NFKD does not decompose but unaccent folds
+_LIGATURES = str.maketrans({"œ": "oe", "Œ": "OE", "æ": "ae", "Æ": "AE", "ß": "ss"})
+
+
+def normalize(text):
+    """Lower-case ``text`` and strip its accents, like f_unaccent(lower(text))"""
+    decomposed = unicodedata.normalize("NFKD", (text or "").translate(_LIGATURES))
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+class _SearchKey(FunctionElement):
+    type = String()
+    name = "search_key"
+    inherit_cache = True
+
+
+class _Similarity(FunctionElement):
+    type = Float()
+    name = "search_similarity"
+    inherit_cache = True
+
+
+@compiles(_SearchKey)
+def _compile_search_key(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+    if getattr(compiler.dialect, "has_f_unaccent", True):
+        return f"f_unaccent(lower({column}))"
+    return f"lower({column})"
+
+
+@compiles(_Similarity)
+def _compile_similarity(element, compiler, **kw):
+    if getattr(compiler.dialect, "has_similarity", True):
+        return f"similarity({compiler.process(element.clauses, **kw)})"
+    return "0.0"
+
+
+def search_key(column):
+    """``column`` folded like ``normalize``, as indexed by the search migration"""
+    return _SearchKey(column)
+
+
+def search_words(term):
+    return normalize(term).split()[:MAX_WORDS]
+
+
+def _escape_like(word):
+    return word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def matches_words(columns, term):
+    """Every word of ``term`` is found in one of ``columns`` (None when the term has no words)"""
+    words = search_words(term)
+    # Short words alone match prefixes; next to a longer word (whose trigram
+    # index already narrows the rows) they match anywhere
+    anywhere = any(len(word) >= MIN_SUBSTRING_LENGTH for word in words)
+    conditions = []
+    for word in words:
+        escaped = _escape_like(word)
+        pattern = f"%{escaped}%" if anywhere else f"{escaped}%"
+        conditions.append(or_(*[search_key(column).like(pattern, escape="\\") for column in columns]))
+    return and_(*conditions) if conditions else None
+
+
+def similarity_rank(columns, term):
+    """Sum of the trigram similarities of ``columns`` to ``term`` (higher is closer)"""
+    normalized = " ".join(search_words(term))
+    scores = [func.coalesce(_Similarity(search_key(column), normalized), 0) for column in columns]
+    rank = scores[0]
+    for score in scores[1:]:
+        rank = rank + score
+    return rank
+
+
+def text_search(query, columns, term):
+    """
+    Filter ``query`` to rows matching ``term`` in ``columns`` and order them
+    best match first. Further order_by() calls only break ties. A blank
+    term returns the query unchanged.
+    """
+    condition = matches_words(columns, term)
+    if condition is None:
+        return query
+    return query.filter(condition).order_by(similarity_rank(columns, term).desc())
+
+
+# ----------------------------------------
+# SQLite fallback
+# ----------------------------------------
+
+def trigrams(text):
+    """pg_trgm's trigram set: each word padded with two spaces in front and one behind"""
+    grams = set()
+    for word in re.findall(r"\w+", normalize(text)):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def trigram_similarity(a, b):
+    if a is None or b is None:
+        return None
+    left, right = trigrams(a), trigrams(b)
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+@event.listens_for(Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function("f_unaccent", 1, lambda v: None if v is None else normalize(v),
+                                         deterministic=True)
+        dbapi_connection.create_function("similarity", 2, trigram_similarity, deterministic=True)
+
+
+# ----------------------------------------
+# PostgreSQL without the search migration
+# ----------------------------------------
+
+@event.listens_for(Engine, "engine_connect")
+def _detect_search_functions(connection):
+    """Once per engine: record whether f_unaccent and pg_trgm's similarity exist (see _compile_search_key)"""
+    dialect = connection.dialect
+    if dialect.name != "postgresql" or hasattr(dialect, "has_f_unaccent"):
+        return
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute("SELECT to_regprocedure('f_unaccent(text)') IS NOT NULL, "
+                       "to_regprocedure('similarity(text, text)') IS NOT NULL")
+        has_f_unaccent, dialect.has_similarity = cursor.fetchone()
+        dialect.has_f_unaccent = has_f_unaccent
+    finally:
+        cursor.close()
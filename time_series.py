@@ -0,0 +1,120 @@
+"""
+Counts per time bucket for the dashboard charts.
+
+``count_series`` runs a single grouped query over a half-open timestamp
+range::
+
+    SELECT date_trunc('week', visit_date) AS bucket, doctor_id, count(*)
+    FROM visit
+    WHERE visit_date >= :start AND visit_date < :end
+    GROUP BY bucket, doctor_id
+
+and fills the buckets without rows with zeros, so a chart of any length
+costs one round trip and the range condition can use an index on the
+timestamp column. SQLite (local dev) has no date_trunc; the same buckets
+are built there with date() modifiers.
+"""
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+
+from table_engine import day_range
+
+GRANULARITIES = ("day", "week", "month")
+MAX_BUCKETS = 400
+MAX_SERIES = 10
+OTHER = "Other"
+
+
+def bucket_start(day, granularity):
+    """First day of the bucket holding ``day`` (weeks start on Monday, like date_trunc)"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day, granularity):
+    if granularity == "week":
+        return day + timedelta(days=7)
+    if granularity == "month":
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def bucket_expression(column, granularity, dialect):
+    """SQL expression for the start of the bucket holding ``column``"""
+    if dialect == "postgresql":
+        return func.date_trunc(granularity, column)
+    if granularity == "week":
+        return func.date(column, "-6 days", "weekday 1")
+    if granularity == "month":
+        return func.date(column, "start of month")
+    return func.date(column)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def count_series(query, column, start, end, granularity="day", series=None, dialect="postgresql"):
+    """
+    Count the rows of ``query`` per bucket of ``column`` between two days.
+
+    Args:
+        query: base query over the table holding ``column`` (may already be filtered)
+        column: DateTime column the rows are bucketed on
+        start, end: first and last day of the range (both included)
+        granularity: "day", "week" or "month"
+        series: optional expression to break the counts down by
+        dialect: database dialect name, picks the bucketing SQL
+    Returns:
+        dict: buckets (ISO dates), total counts per bucket and, with ``series``,
+        one list of counts per key (the MAX_SERIES largest; the rest are
+        summed under OTHER)
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Invalid granularity: {granularity}")
+    if end < start:
+        raise ValueError("End date is before start date")
+
+    buckets = []
+    day = bucket_start(start, granularity)
+    while day <= end:
+        buckets.append(day)
+        day = next_bucket(day, granularity)
+        if len(buckets) > MAX_BUCKETS:
+            raise ValueError(f"Too many {granularity} buckets, choose a shorter range or a coarser granularity")
+    index = {day: i for i, day in enumerate(buckets)}
+
+    bucket = bucket_expression(column, granularity, dialect).label("bucket")
+    columns = [bucket] if series is None else [bucket, series.label("series")]
+    rows = (
+        query.with_entities(*columns, func.count().label("n"))
+        .filter(day_range(column, start, days=(end - start).days + 1))
+        .group_by(*columns)
+        .all()
+    )
+
+    total = [0] * len(buckets)
+    per_key = {}
+    for row in rows:
+        i = index[_as_date(row.bucket)]
+        total[i] += row.n
+        if series is not None:
+            per_key.setdefault(row.series, [0] * len(buckets))[i] += row.n
+
+    result = {"buckets": [day.isoformat() for day in buckets], "total": total}
+    if series is not None:
+        ranked = sorted(per_key.items(), key=lambda item: (-sum(item[1]), str(item[0])))
+        shown = [{"key": key, "counts": counts} for key, counts in ranked[:MAX_SERIES]]
+        if len(ranked) > MAX_SERIES:
+            shown.append({"key": OTHER, "counts": [sum(c) for c in zip(*[counts for _, counts in ranked[MAX_SERIES:]])]})
+        result["series"] = shown
+    return result
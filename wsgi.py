@@ -0,0 +1,62 @@
+"""
+Production entry point: the WSGI application for gunicorn or uWSGI.
+
+    gunicorn -c gunicorn.conf.py
+    uwsgi --master --processes 4 --threads 4 --module wsgi:application --env ECG_ORT_PROCESSES=4
+
+(``python app.py`` runs the single-process development server.)
+
+Importing this module in the server master (gunicorn ``preload_app``, uWSGI
+without ``lazy-apps``) prepares what the forked workers then share
+copy-on-write instead of each building its own copy:
+
+  - the ECG model: variant resolved, files hashed, optimized graph built
+    (in a child process, so the master never imports onnxruntime) and read
+    into memory (app.preload_ecg_model). Each worker creates its ORT sessions from these
+    bytes after the fork, since sessions and their thread pools do not
+    survive one; with ECG_ORT_PROCESSES set to the number of workers, each
+    session gets cores // (workers * pool size) intra-op threads;
+  - the medicament catalog snapshot;
+  - wfdb and pandas, imported once.
+
+The database connections opened meanwhile are closed before the fork, and
+everything loaded so far is frozen out of the garbage collector's reach
+(gc.freeze), so collections in the workers do not write to the shared pages.
+
+``preload()`` runs again on SIGHUP (gunicorn's on_reload hook) to pick up a
+new model file or newly published variant before the workers are replaced.
+"""
+
+import gc
+
+import app as heartline
+
+app = heartline.app
+
+
+def preload():
+    """Load what the workers share (in the master, before the workers are forked)"""
+    if heartline.ort_session is not None:
+        raise RuntimeError("ECG model sessions were created before the fork (ECG_MODEL_WARMUP=eager); "
+                           "use background or lazy under a multi-process server")
+    model_bytes = heartline.preload_ecg_model()
+
+    with app.app_context():
+        try:
+            medicaments = len(heartline.medicament_catalog)
+        except Exception as e:
+            medicaments = 0
+            print(f"Medicament catalog not preloaded ({e}); each worker will load it on first use.")
+        finally:
+            # Connections must not be shared with the forked workers: they open their own
+            heartline.db.session.remove()
+            heartline.db.engine.dispose()
+
+    import wfdb  # noqa: F401 (with pandas: record reading in every worker)
+
+    gc.freeze()
+    print(f"Preloaded for the workers: ECG model {model_bytes / 1e6:.1f} MB, {medicaments} medicaments.")
+
+
+preload()
+application = app